@@ -1,5 +1,9 @@
 from django.contrib import admin
-from .models import Brand, Product, LicenseKey, License, Activation
+from django.http import Http404, HttpResponse
+from django.template.response import TemplateResponse
+from .models import Brand, Product, LicenseKey, License, Activation, ServiceToken
+from .profiling import PHASES, folded_stacks, get_profiler_setting, profile_buffer
+from .service_tokens import revoked_service_tokens
 
 @admin.register(Brand)
 class BrandAdmin(admin.ModelAdmin):
@@ -21,19 +25,77 @@ class LicenseKeyAdmin(admin.ModelAdmin):
 class LicenseActivationInline(admin.TabularInline):
     model = Activation
     extra = 0
-    readonly_fields = ('instance_id', 'activated_at')
+    readonly_fields = ('instance_id', 'activated_at', 'last_seen_at')
+
+class ActiveLicenseFilter(admin.SimpleListFilter):
+    # Evaluated in SQL through LicenseQuerySet.active(), unlike License.is_active()
+    title = 'active'
+    parameter_name = 'active'
+
+    def lookups(self, request, model_admin):
+        return (('yes', 'Active'), ('no', 'Inactive'))
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.active()
+        if self.value() == 'no':
+            return queryset.inactive()
+        return queryset
 
 @admin.register(License)
 class LicenseAdmin(admin.ModelAdmin):
     list_display = ('product', 'license_key', 'status', 'expires_at', 'total_seats', 'active_seats')
-    list_filter = ('status', 'product__brand', 'product')
+    list_filter = (ActiveLicenseFilter, 'status', 'product__brand', 'product')
     search_fields = ('license_key__key', 'license_key__customer_email')
+    list_select_related = ('product__brand', 'license_key')
+    readonly_fields = ('active_seats',)
     inlines = [LicenseActivationInline]
 
-    def active_seats(self, obj):
-        return obj.activations.count()
-
 @admin.register(Activation)
 class ActivationAdmin(admin.ModelAdmin):
-    list_display = ('instance_id', 'license', 'activated_at')
+    list_display = ('instance_id', 'license', 'activated_at', 'last_seen_at')
+    list_select_related = ('license__product', 'license__license_key')
     search_fields = ('instance_id', 'license__license_key__key')
+
+@admin.register(ServiceToken)
+class ServiceTokenAdmin(admin.ModelAdmin):
+    # Issued with `manage.py issue_service_token`; the token itself is only shown then
+    list_display = ('name', 'brand', 'scopes', 'created_at', 'expires_at', 'revoked_at')
+    list_filter = ('brand',)
+    search_fields = ('name', 'jti')
+    readonly_fields = ('jti', 'brand', 'scopes', 'created_at', 'expires_at', 'revoked_at')
+    actions = ['revoke']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Revoke selected service tokens')
+    def revoke(self, request, queryset):
+        revoked = revoked_service_tokens.revoke(queryset)
+        self.message_user(request, f"Revoked {revoked} service token(s).")
+
+def request_profiles_view(request):
+    """
+    Recent profiles of this worker (see api/profiling.py). `?id=` shows one profile,
+    `?download=folded` returns the samples as folded stacks for flamegraph tools.
+    """
+    profile_id = request.GET.get('id')
+    profile = profile_buffer.get(profile_id) if profile_id else None
+    if profile_id and profile is None:
+        raise Http404("Profile not found (it may have been rotated out of the buffer).")
+
+    if request.GET.get('download') == 'folded':
+        profiles = [profile] if profile else profile_buffer.all()
+        response = HttpResponse('\n'.join(folded_stacks(profiles)) + '\n', content_type='text/plain')
+        response['Content-Disposition'] = f'attachment; filename="profiles-{profile_id or "all"}.folded"'
+        return response
+
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Request profiles',
+        'profile': profile,
+        'profiles': profile_buffer.all(),
+        'phases': PHASES,
+        'enabled': get_profiler_setting('ENABLED'),
+    }
+    return TemplateResponse(request, 'admin/api/request_profiles.html', context)
@@ -0,0 +1,170 @@
+# Native async request path for ASGI deployments
+#
+# Async counterparts of ActivateLicenseView and LicenseStatusView. They keep the
+# same throttling, unknown-key rejection, caching and response bodies, but await
+# the cache and ORM instead of tying up a worker thread, so one ASGI process can
+# hold many concurrent checks. The DRF views remain the WSGI (uWSGI) path.
+#
+# Serve with e.g. `uvicorn assessment.asgi:application --workers 4`.
+
+import json
+import logging
+import math
+
+from asgiref.sync import sync_to_async
+from django.db.models import aprefetch_related_objects
+from django.http import HttpResponseNotModified, JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.settings import api_settings
+
+from .cache import add_status_headers, etag_matches, license_status_cache, status_etag
+from .heartbeats import heartbeat_buffer
+from .key_filter import license_key_filter
+from .metrics import record_activation
+from .models import License, LicenseKey, SeatLimitReached
+from .serializers import ActivateLicenseSerializer, LicenseActivationSerializer, LicenseKeySerializer
+from .sharding import use_shard_of
+
+logger = logging.getLogger(__name__)
+
+NOT_FOUND = {"detail": "No LicenseKey matches the given query."}
+
+
+class AsyncAPIView(View):
+    """Minimal async view base: CSRF exempt like APIView, and runs the DRF throttles."""
+    throttle_scope = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def check_throttles(self, request):
+        """Returns a 429 response when any throttle rejects the request, else None."""
+        waits = []
+        for throttle_class in api_settings.DEFAULT_THROTTLE_CLASSES:
+            throttle = throttle_class()
+            if not await throttle.aallow_request(request, self):
+                waits.append(throttle.wait())
+        if not waits:
+            return None
+        wait = max((math.ceil(wait) for wait in waits if wait is not None), default=None)
+        if wait is None:
+            return JsonResponse({"detail": "Request was throttled."}, status=429)
+        response = JsonResponse(
+            {"detail": f"Request was throttled. Expected available in {wait} seconds."}, status=429
+        )
+        response['Retry-After'] = str(wait)
+        return response
+
+    async def get_license_key(self, license_key, queryset):
+        """Async get_license_key_or_404(); returns None when the key does not exist."""
+        if not await license_key_filter.amight_exist(license_key):
+            return None
+        lk = await queryset.filter(key=license_key).afirst()
+        if lk is None:
+            await license_key_filter.arecord_missing(license_key)
+        return lk
+
+
+class AsyncLicenseStatusView(AsyncAPIView):
+    """
+    US4 (async): User can check license status.
+    """
+    throttle_scope = 'status'
+
+    async def get(self, request, key):
+        throttled = await self.check_throttles(request)
+        if throttled:
+            return throttled
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            version = await license_status_cache.acurrent_version(key)
+            if etag_matches(if_none_match, status_etag(version)):
+                return add_status_headers(HttpResponseNotModified(), version)
+
+        version, cached_data = await license_status_cache.aget_versioned(key)
+        if cached_data is not None:
+            return add_status_headers(JsonResponse(cached_data), version)
+
+        if not await license_key_filter.amight_exist(key):
+            return JsonResponse(NOT_FOUND, status=404)
+        # Read before the payload, as in get_versioned_license_status()
+        version = await license_status_cache.aversion(key)
+        with use_shard_of(key):
+            lk = await self.get_license_key(key, LicenseKey.objects.with_license_details())
+        if lk is None:
+            return JsonResponse(NOT_FOUND, status=404)
+
+        # Everything the serializer reads was loaded by the query above
+        data = LicenseKeySerializer(lk).data
+        await license_status_cache.aset(key, data, version)
+        logger.info(f"License status fetched and cached: {key}")
+        return add_status_headers(JsonResponse(data), version)
+
+
+class AsyncActivateLicenseView(AsyncAPIView):
+    """
+    US3 (async): End-user product can activate a license.
+    """
+    throttle_scope = 'activate'
+
+    async def post(self, request):
+        try:
+            payload = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({"detail": "JSON parse error."}, status=400)
+        # Exposed like DRF's request.data so the license key throttle can read it
+        request.data = payload if isinstance(payload, dict) else {}
+
+        throttled = await self.check_throttles(request)
+        if throttled:
+            return throttled
+
+        serializer = ActivateLicenseSerializer(data=payload)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=400)
+        # Every query of the activation goes to the key's shard (api/sharding.py)
+        with use_shard_of(serializer.validated_data['license_key']):
+            return await self.activate(serializer.validated_data)
+
+    async def activate(self, data):
+        lk = await self.get_license_key(data['license_key'], LicenseKey.objects.all())
+        if lk is None:
+            record_activation('not_found')
+            return JsonResponse(NOT_FOUND, status=404)
+
+        license_obj = await License.objects.filter(
+            license_key=lk,
+            product__slug=data['product_slug']
+        ).select_related('license_key', 'product__brand').order_by('-created_at').afirst()
+
+        if not license_obj:
+            logger.error(f"Activation failed: License not found for key {lk.key} and product {data['product_slug']}")
+            record_activation('not_found')
+            return JsonResponse({"error": "License not found for this product/key."}, status=404)
+
+        if not license_obj.is_active():
+            logger.warning(f"Activation candidate inactive: Key {lk.key}")
+            record_activation('inactive')
+            return JsonResponse({"error": "License is not active or expired."}, status=403)
+
+        # The seat claim is transactional, which the async ORM does not support yet
+        try:
+            activation, created = await sync_to_async(license_obj.activate)(data['instance_id'])
+        except SeatLimitReached:
+            logger.warning(f"Seat limit reached for license: {license_obj.id}")
+            record_activation('seat_limit')
+            return JsonResponse({"error": "No seats remaining."}, status=409)
+
+        if created:
+            logger.info(f"New activation created for license {license_obj.id}: {data['instance_id']}")
+        record_activation('created' if created else 'idempotent')
+        if not created:
+            heartbeat_buffer.record(activation.id)
+
+        await aprefetch_related_objects([license_obj], 'activations')
+        return JsonResponse(
+            LicenseActivationSerializer(license_obj, context={'instance_id': data['instance_id']}).data
+        )
@@ -0,0 +1,293 @@
+# License status cache
+#
+# Two tiers sit in front of the database for LicenseStatusView:
+#   1. an in-process LRU, absorbing hot keys without a network hop, and
+#   2. the shared Django cache (`license_status_<key>`), shared by all workers.
+#
+# Writes to License, LicenseKey and Activation invalidate both tiers through the
+# signal handlers in api/signals.py; bulk writes that bypass signals call
+# `license_status_cache.invalidate()` explicitly. Other processes can only drop
+# the shared tier, so local entries are kept for a few seconds at most
+# (LICENSE_STATUS_CACHE['LOCAL_TIMEOUT']).
+#
+# Conditional GET: every key also has an opaque version (`license_version_<key>`),
+# replaced whenever its status is invalidated. Status entries are stored with
+# the version read *before* their data was loaded, and that version is the ETag,
+# so an ETag can be older than the payload it came with but never newer. A
+# request whose If-None-Match still matches the current version is answered 304
+# from the version alone. An evicted version is replaced by a new random one,
+# never reissued, so no old ETag can match it.
+
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import parse_etags, quote_etag
+
+from .metrics import STATUS_CACHE_LOOKUPS
+from .routing import pin_to_primary
+from .sharding import current_shard
+
+DEFAULT_SETTINGS = {
+    'TIMEOUT': 3600,
+    'LOCAL_MAX_ENTRIES': 10000,
+    'LOCAL_TIMEOUT': 5,
+    # Cache-Control max-age of status responses, for proxies and CDNs
+    'HTTP_MAX_AGE': 5,
+}
+# Lookup counters that are also exported to Prometheus, with their label
+LOOKUP_RESULTS = {'local_hits': 'local_hit', 'shared_hits': 'shared_hit', 'misses': 'miss'}
+
+
+def get_cache_setting(name):
+    return getattr(settings, 'LICENSE_STATUS_CACHE', {}).get(name, DEFAULT_SETTINGS[name])
+
+
+def new_version():
+    return secrets.token_hex(8)
+
+
+def status_etag(version):
+    return quote_etag(version) if version else None
+
+
+def etag_matches(if_none_match, etag):
+    """Weak If-None-Match comparison, as used for GET."""
+    if not if_none_match or not etag:
+        return False
+    etags = parse_etags(if_none_match)
+    return '*' in etags or any(tag.removeprefix('W/') == etag for tag in etags)
+
+
+def add_status_headers(response, version):
+    """ETag and Cache-Control of a status response (200 or 304)."""
+    etag = status_etag(version)
+    if etag:
+        response['ETag'] = etag
+    response['Cache-Control'] = f"public, max-age={get_cache_setting('HTTP_MAX_AGE')}"
+    return response
+
+
+def _unpack(entry):
+    # Entries cached before versions existed hold the bare payload
+    return entry if isinstance(entry, tuple) else (None, entry)
+
+
+class LocalLRUCache:
+    """Thread-safe, size-bounded LRU with a per-entry TTL."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        """Returns (found, value)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, timeout, max_entries):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class LicenseStatusCache:
+    def __init__(self):
+        self.local = LocalLRUCache()
+        self._stats_lock = threading.Lock()
+        self._stats = dict.fromkeys(('local_hits', 'shared_hits', 'misses', 'invalidations'), 0)
+
+    @staticmethod
+    def make_key(license_key):
+        return f"license_status_{license_key}"
+
+    @staticmethod
+    def make_version_key(license_key):
+        return f"license_version_{license_key}"
+
+    def _count(self, stat, amount=1):
+        with self._stats_lock:
+            self._stats[stat] += amount
+        if stat in LOOKUP_RESULTS:
+            STATUS_CACHE_LOOKUPS.labels(LOOKUP_RESULTS[stat]).inc(amount)
+
+    def _set_local(self, cache_key, value):
+        self.local.set(cache_key, value, get_cache_setting('LOCAL_TIMEOUT'), get_cache_setting('LOCAL_MAX_ENTRIES'))
+
+    def get(self, license_key):
+        """Returns the cached status payload or None."""
+        return self.get_versioned(license_key)[1]
+
+    def get_versioned(self, license_key):
+        """Returns (version, payload) of the cached status, or (None, None)."""
+        cache_key = self.make_key(license_key)
+        found, entry = self.local.get(cache_key)
+        if found:
+            self._count('local_hits')
+            return _unpack(entry)
+
+        entry = cache.get(cache_key)
+        if entry is None:
+            self._count('misses')
+            return None, None
+
+        self._count('shared_hits')
+        self._set_local(cache_key, entry)
+        return _unpack(entry)
+
+    async def aget(self, license_key):
+        return (await self.aget_versioned(license_key))[1]
+
+    async def aget_versioned(self, license_key):
+        """get_versioned() for async views; only the shared tier involves I/O."""
+        cache_key = self.make_key(license_key)
+        found, entry = self.local.get(cache_key)
+        if found:
+            self._count('local_hits')
+            return _unpack(entry)
+
+        entry = await cache.aget(cache_key)
+        if entry is None:
+            self._count('misses')
+            return None, None
+
+        self._count('shared_hits')
+        self._set_local(cache_key, entry)
+        return _unpack(entry)
+
+    def set(self, license_key, data, version=None):
+        """Caches a payload; `version` must have been read before the payload was loaded."""
+        cache_key = self.make_key(license_key)
+        cache.set(cache_key, (version, data), get_cache_setting('TIMEOUT'))
+        self._set_local(cache_key, (version, data))
+
+    async def aset(self, license_key, data, version=None):
+        cache_key = self.make_key(license_key)
+        await cache.aset(cache_key, (version, data), get_cache_setting('TIMEOUT'))
+        self._set_local(cache_key, (version, data))
+
+    def current_version(self, license_key):
+        """The key's current version, or None when it has none yet."""
+        cache_key = self.make_version_key(license_key)
+        found, version = self.local.get(cache_key)
+        if found:
+            return version
+        version = cache.get(cache_key)
+        if version is not None:
+            self._set_local(cache_key, version)
+        return version
+
+    async def acurrent_version(self, license_key):
+        cache_key = self.make_version_key(license_key)
+        found, version = self.local.get(cache_key)
+        if found:
+            return version
+        version = await cache.aget(cache_key)
+        if version is not None:
+            self._set_local(cache_key, version)
+        return version
+
+    def version(self, license_key):
+        """The key's current version, starting a new one when it has none."""
+        version = self.current_version(license_key)
+        if version is None:
+            cache_key = self.make_version_key(license_key)
+            # Another worker may start one at the same time; the first one wins
+            cache.add(cache_key, new_version(), get_cache_setting('TIMEOUT'))
+            version = cache.get(cache_key)
+            if version is not None:
+                self._set_local(cache_key, version)
+        return version
+
+    def versions(self, license_keys):
+        """version() for many keys with one get_many; bypasses the local tier."""
+        version_keys = {self.make_version_key(license_key): license_key for license_key in license_keys}
+        found = cache.get_many(list(version_keys))
+        # Overwriting a version started concurrently only retires it, which is safe
+        started = {version_key: new_version() for version_key in version_keys if version_key not in found}
+        if started:
+            cache.set_many(started, get_cache_setting('TIMEOUT'))
+        return {license_key: found.get(version_key) or started[version_key]
+                for version_key, license_key in version_keys.items()}
+
+    async def aversion(self, license_key):
+        version = await self.acurrent_version(license_key)
+        if version is None:
+            cache_key = self.make_version_key(license_key)
+            await cache.aadd(cache_key, new_version(), get_cache_setting('TIMEOUT'))
+            version = await cache.aget(cache_key)
+            if version is not None:
+                self._set_local(cache_key, version)
+        return version
+
+    def invalidate(self, license_keys, using=None):
+        """
+        Drops the status and version of `license_keys` from both tiers. Inside a transaction
+        on `using` (by default the current shard, see api/sharding.py) the entries are
+        dropped again on commit, so a concurrent read cannot re-cache the pre-commit
+        state. The keys are also pinned to the primary database for a moment, so a
+        lagging replica cannot either.
+        """
+        license_keys = list(license_keys)
+        if not license_keys:
+            return
+        # Dropping the version retires every ETag handed out for the key
+        cache_keys = [self.make_key(license_key) for license_key in license_keys] + [
+            self.make_version_key(license_key) for license_key in license_keys
+        ]
+        pin_to_primary([f"license_key_{license_key}" for license_key in license_keys])
+        self._drop(cache_keys)
+        self._count('invalidations', len(license_keys))
+        using = using or current_shard()
+        if transaction.get_connection(using).in_atomic_block:
+            transaction.on_commit(lambda: self._drop(cache_keys), using=using)
+
+    def _drop(self, cache_keys):
+        self.local.delete_many(cache_keys)
+        cache.delete_many(cache_keys)
+
+    def clear_local(self):
+        self.local.clear()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+        stats.update({
+            'local_entries': len(self.local),
+            'local_max_entries': get_cache_setting('LOCAL_MAX_ENTRIES'),
+            'local_evictions': self.local.evictions,
+            'hit_ratio': round((stats['local_hits'] + stats['shared_hits']) / lookups, 4) if lookups else None,
+        })
+        return stats
+
+
+license_status_cache = LicenseStatusCache()
@@ -0,0 +1,23 @@
+# System checks
+#
+# Run by every management command, including the `migrate` of the container
+# entrypoint, so a deployment without usable signing keys fails before uWSGI
+# starts instead of on its first activation.
+
+from django.core.checks import Error, register
+from django.core.exceptions import ImproperlyConfigured
+
+
+@register()
+def check_signing_keys(app_configs, **kwargs):
+    from .signing import get_signing_keys
+
+    try:
+        get_signing_keys()
+    except (ImproperlyConfigured, OSError, ValueError) as exc:
+        return [Error(
+            f"Offline license tokens cannot be signed: {exc}",
+            hint="Set LICENSE_SIGNING_KEY_DIR and LICENSE_SIGNING_ACTIVE_KID (see README, Offline License Tokens).",
+            id='api.E001',
+        )]
+    return []
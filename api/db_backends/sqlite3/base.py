@@ -0,0 +1,7 @@
+from django.db.backends.sqlite3 import base
+
+from api.pooling import ConnectionStatsMixin
+
+
+class DatabaseWrapper(ConnectionStatsMixin, base.DatabaseWrapper):
+    pass
@@ -0,0 +1,47 @@
+# License expiry sweeper
+#
+# License.is_active() treats a VALID license past its expires_at as inactive,
+# but the row keeps saying VALID until something rewrites it. `manage.py
+# expire_licenses` (run from cron) moves such licenses to EXPIRED in batches:
+# ids come from the partial license_valid_expires_idx, each batch is a single
+# UPDATE, and the status cache entries of the affected keys are dropped.
+# Re-provisioning an expired license sets it back to VALID.
+
+import logging
+
+from django.db import router, transaction
+from django.utils import timezone
+
+from .cache import license_status_cache
+from .models import License, LicenseKey
+from .sharding import each_shard
+from .verdicts import refresh_verdicts
+
+logger = logging.getLogger(__name__)
+
+
+def expire_licenses(batch_size=1000, dry_run=False):
+    """Marks VALID licenses past expires_at as EXPIRED. Returns how many were (or would be) expired."""
+    now = timezone.now()
+    due = License.objects.filter(status='VALID', expires_at__lt=now)
+    if dry_run:
+        return sum(due.count() for _ in each_shard())
+
+    expired = 0
+    for _ in each_shard():
+        while True:
+            with transaction.atomic(using=router.db_for_write(License)):
+                ids = list(due.order_by('expires_at').values_list('pk', flat=True)[:batch_size])
+                if not ids:
+                    break
+                # Re-checked in the UPDATE, in case a license was renewed in the meantime
+                updated = License.objects.filter(pk__in=ids, status='VALID', expires_at__lt=now).update(
+                    status='EXPIRED', updated_at=now
+                )
+                # update() bypasses the model signals, so invalidate explicitly
+                keys = list(LicenseKey.objects.filter(licenses__id__in=ids).values_list('key', flat=True).distinct())
+                license_status_cache.invalidate(keys)
+                refresh_verdicts(keys)
+            expired += updated
+            logger.info(f"Expired {updated} license(s)")
+    return expired
@@ -0,0 +1,243 @@
+# Activation heartbeats and stale seat reclamation
+#
+# Installed products ping POST /api/heartbeat/ periodically. The view resolves
+# the activation from the cached status payload and only records its id here:
+# pings are coalesced per process into one UPDATE per minute bucket, flushed
+# every ACTIVATION_HEARTBEAT['FLUSH_INTERVAL'] seconds (or MAX_PENDING ids), so
+# a million pings for the same installs become a handful of row writes. The
+# writes happen on a background thread per process, never on the request path
+# (async views record pings too, and cannot run the ORM), including for a worker
+# that stops receiving pings; uWSGI workers flush what is left when they exit.
+# A flush that fails puts its heartbeats back for the next one.
+#
+# `manage.py reclaim_stale_seats` deletes activations whose last_seen_at is
+# older than STALE_AFTER, a batch at a time, and gives the seats back with one
+# UPDATE per batch. last_seen_at is at most FLUSH_INTERVAL (plus a second) behind, so
+# STALE_AFTER must be much larger than that (it is in days by default).
+
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .cache import license_status_cache
+from .models import Activation, License, LicenseKey
+from .sharding import current_shard, each_shard, use_shard
+from .verdicts import refresh_verdicts
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'FLUSH_INTERVAL': 30,
+    'MAX_PENDING': 10000,
+    'STALE_AFTER': 14 * 86400,
+}
+UPDATE_BATCH_SIZE = 1000
+# Seconds between the background flusher's checks, unless a full buffer wakes it
+FLUSHER_TICK = 1
+
+
+def get_heartbeat_setting(name):
+    return getattr(settings, 'ACTIVATION_HEARTBEAT', {}).get(name, DEFAULT_SETTINGS[name])
+
+
+class HeartbeatBuffer:
+    def __init__(self):
+        # Minute bucket -> (shard, activation id) pairs seen in it
+        self._pending = defaultdict(set)
+        self._size = 0
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flusher_pid = None
+        self._wake = threading.Event()
+        self._stats = Counter()
+
+    def _due(self):
+        return self._size >= get_heartbeat_setting('MAX_PENDING') or (
+            self._oldest is not None and time.monotonic() - self._oldest >= get_heartbeat_setting('FLUSH_INTERVAL')
+        )
+
+    def record(self, activation_id):
+        now = timezone.now()
+        # Activation ids are per shard; the view is on the activation's shard
+        entry = (current_shard(), activation_id)
+        with self._lock:
+            bucket = self._pending[now.replace(second=0, microsecond=0)]
+            if entry not in bucket:
+                bucket.add(entry)
+                self._size += 1
+            self._oldest = self._oldest or time.monotonic()
+            self._stats['heartbeats'] += 1
+            due = self._due()
+        self._start_flusher()
+        if due:
+            # The flusher writes them: the caller may be an async view, outside the ORM's reach
+            self._wake.set()
+
+    def flush_if_due(self):
+        """Flushes once the oldest ping is FLUSH_INTERVAL old (or MAX_PENDING are buffered)."""
+        with self._lock:
+            due = self._due()
+        return self.flush() if due else 0
+
+    def _start_flusher(self):
+        # Once per process: a forked worker does not inherit its parent's threads
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._run_flusher, name='heartbeat-flusher', daemon=True).start()
+
+    def _run_flusher(self):
+        # Without it, a worker that stops receiving pings would hold its last ones forever
+        # and reclaim_stale_seats could free seats that are still in use.
+        while True:
+            self._wake.wait(FLUSHER_TICK)
+            self._wake.clear()
+            with self._lock:
+                due = self._due()
+            if not due:
+                continue
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Could not flush buffered heartbeats")
+            finally:
+                # This thread's connections; requests close their own
+                connections.close_all()
+
+    def flush(self):
+        """Writes the buffered heartbeats; returns the number of rows updated."""
+        # One flusher at a time; pings arriving meanwhile go to the next buffer
+        if not self._flush_lock.acquire(blocking=False):
+            return 0
+        try:
+            with self._lock:
+                pending, self._pending = self._pending, defaultdict(set)
+                self._size, self._oldest = 0, None
+            try:
+                updated = self._write(pending)
+            except Exception:
+                self._restore(pending)
+                raise
+            with self._lock:
+                self._stats['flushes'] += 1
+                self._stats['rows_updated'] += updated
+            return updated
+        finally:
+            self._flush_lock.release()
+
+    def _write(self, pending):
+        updated = 0
+        for seen_at, entries in sorted(pending.items()):
+            by_shard = defaultdict(list)
+            for shard, activation_id in entries:
+                by_shard[shard].append(activation_id)
+            for shard, ids in by_shard.items():
+                ids.sort()
+                with use_shard(shard):
+                    for start in range(0, len(ids), UPDATE_BATCH_SIZE):
+                        # Bucket start is at most a minute early; never moves last_seen_at backwards
+                        updated += Activation.objects.filter(
+                            pk__in=ids[start:start + UPDATE_BATCH_SIZE], last_seen_at__lt=seen_at
+                        ).update(last_seen_at=seen_at)
+        return updated
+
+    def _restore(self, pending):
+        # Buckets written before the failure are rewritten as no-ops (last_seen_at only moves forward)
+        with self._lock:
+            for seen_at, entries in pending.items():
+                bucket = self._pending[seen_at]
+                self._size += len(entries - bucket)
+                bucket |= entries
+            # Retried a FLUSH_INTERVAL later, not on every tick of a failing database
+            self._oldest = self._oldest or time.monotonic()
+            self._stats['failed_flushes'] += 1
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'pending': self._size}
+
+
+heartbeat_buffer = HeartbeatBuffer()
+
+
+def _flush_on_exit():
+    try:
+        heartbeat_buffer.flush()
+    except Exception:
+        logger.exception("Could not flush buffered heartbeats on exit")
+
+
+def install_exit_flush():
+    """Flushes the buffer when a uWSGI worker stops, while Django can still reach the database."""
+    try:
+        import uwsgi
+    except ImportError:  # Not under uWSGI (runserver, tests, management commands)
+        return
+    uwsgi.atexit = _flush_on_exit
+
+
+def _delete_activations(using, ids):
+    connection = connections[using]
+    table, pk = connection.ops.quote_name(Activation._meta.db_table), connection.ops.quote_name(Activation._meta.pk.column)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE {pk} IN ({', '.join(['%s'] * len(ids))})", ids)
+
+
+def reclaim_stale_seats(stale_after=None, batch_size=1000, dry_run=False):
+    """
+    Deletes activations not seen for `stale_after` seconds and releases their
+    seats. Returns the number of activations reclaimed (or found, on a dry run).
+    """
+    cutoff = timezone.now() - timedelta(seconds=stale_after or get_heartbeat_setting('STALE_AFTER'))
+    stale = Activation.objects.filter(last_seen_at__lt=cutoff)
+    if dry_run:
+        return sum(stale.count() for _ in each_shard())
+
+    reclaimed = 0
+    for _ in each_shard():
+        using = router.db_for_write(Activation)
+        while True:
+            with transaction.atomic(using=using):
+                # Locked so a concurrent heartbeat flush cannot revive a row being deleted;
+                # parallel reclaimers skip each other's batches.
+                ids = list(
+                    stale.select_for_update(skip_locked=True).order_by('pk').values_list('pk', flat=True)[:batch_size]
+                )
+                if not ids:
+                    break
+                batch = Activation.objects.filter(pk__in=ids)
+                released = list(batch.values('license_id').annotate(seats=Count('pk')).order_by())
+                licenses_by_seats = defaultdict(list)
+                for row in released:
+                    licenses_by_seats[row['seats']].append(row['license_id'])
+                keys = list(
+                    LicenseKey.objects.filter(licenses__id__in=[row['license_id'] for row in released])
+                    .values_list('key', flat=True).distinct()
+                )
+
+                # Set-based: plain SQL skips the per-row post_delete handlers, so the
+                # seat counters and status caches are updated here once per batch.
+                _delete_activations(using, ids)
+                for seats, license_ids in licenses_by_seats.items():
+                    License.objects.filter(pk__in=license_ids).update(
+                        active_seats=Greatest(F('active_seats') - seats, 0)
+                    )
+                license_status_cache.invalidate(keys)
+                refresh_verdicts(keys)
+            reclaimed += len(ids)
+            logger.info(f"Reclaimed {len(ids)} stale activation(s) across {len(keys)} license key(s)")
+    return reclaimed
+
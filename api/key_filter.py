@@ -0,0 +1,219 @@
+# Unknown license key rejection
+#
+# Key-guessing bots and misconfigured plugins send keys that do not exist. Two
+# layers reject most of them before the database is touched:
+#   1. an in-process Bloom filter of every LicenseKey.key, rebuilt every
+#      LICENSE_KEY_FILTER['REFRESH_INTERVAL'] seconds and updated on creation;
+#   2. a short-lived negative cache entry (`license_key_missing_<key>`) for keys
+#      the filter cannot rule out but the database did not find.
+#
+# Keys created by other processes after this process built its filter are
+# covered by a shared `license_key_recent_<key>` marker that outlives the refresh
+# interval. With several workers the default cache must therefore be shared
+# (CACHE_URL), as it already must be for status invalidation; the settings turn
+# the filter off unless it is.
+#
+# The first build happens on first use. Later rebuilds run in a background
+# thread while the current filter keeps answering.
+
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.http import Http404
+
+from .models import LicenseKey
+from .sharding import shard_databases, use_shard_of
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'ENABLED': False,
+    'ERROR_RATE': 0.01,
+    'MIN_CAPACITY': 100000,
+    'REFRESH_INTERVAL': 300,
+    'NEGATIVE_TIMEOUT': 60,
+}
+
+
+def get_filter_setting(name):
+    return getattr(settings, 'LICENSE_KEY_FILTER', {}).get(name, DEFAULT_SETTINGS[name])
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter using double hashing over a single blake2b digest."""
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        positions = self._positions(item)
+        with self._lock:
+            for position in positions:
+                self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class LicenseKeyFilter:
+    def __init__(self):
+        self._bloom = None
+        self._built_at = None
+        self._build_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = dict.fromkeys(
+            ('filter_rejections', 'negative_cache_rejections', 'false_positives', 'rebuilds'), 0
+        )
+
+    @staticmethod
+    def missing_key(license_key):
+        return f"license_key_missing_{license_key}"
+
+    @staticmethod
+    def recent_key(license_key):
+        return f"license_key_recent_{license_key}"
+
+    def _count(self, stat):
+        with self._stats_lock:
+            self._stats[stat] += 1
+
+    def _is_stale(self):
+        return self._built_at is None or time.monotonic() - self._built_at > get_filter_setting('REFRESH_INTERVAL')
+
+    def _get_bloom(self):
+        if self._bloom is None:
+            # Nothing to answer with until the first build
+            with self._build_lock:
+                if self._bloom is None:
+                    self.rebuild()
+        elif self._is_stale() and self._build_lock.acquire(blocking=False):
+            threading.Thread(target=self._rebuild_in_background, name='license-key-filter', daemon=True).start()
+        return self._bloom
+
+    def _rebuild_in_background(self):
+        try:
+            self.rebuild()
+        except Exception:
+            logger.exception("Could not rebuild the license key filter")
+        finally:
+            self._build_lock.release()
+            # This thread's connections; requests close their own
+            connections.close_all()
+
+    def rebuild(self):
+        """Rebuilds the filter from every stored key."""
+        started_at = time.monotonic()
+        databases = shard_databases()
+        count = sum(LicenseKey.objects.using(database).count() for database in databases)
+        capacity = max(get_filter_setting('MIN_CAPACITY'), int(count * 1.5))
+        bloom = BloomFilter(capacity, get_filter_setting('ERROR_RATE'))
+        for database in databases:
+            for key in LicenseKey.objects.using(database).values_list('key', flat=True).iterator(chunk_size=10000):
+                bloom.add(key)
+        # Age is measured from the start, so keys created during the build are
+        # still covered by their recent markers when the next rebuild is due.
+        self._bloom, self._built_at = bloom, started_at
+        self._count('rebuilds')
+        logger.info(f"License key filter rebuilt in {time.monotonic() - started_at:.2f}s (capacity {capacity})")
+
+    def might_exist(self, license_key):
+        """False only when `license_key` is certainly unknown; never a false negative."""
+        if not get_filter_setting('ENABLED'):
+            return True
+
+        if license_key in self._get_bloom():
+            if cache.get(self.missing_key(license_key)):
+                self._count('negative_cache_rejections')
+                return False
+            return True
+
+        if cache.get(self.recent_key(license_key)):
+            return True
+        self._count('filter_rejections')
+        return False
+
+    async def amight_exist(self, license_key):
+        """might_exist() for async views; a due rebuild runs in a worker thread."""
+        if not get_filter_setting('ENABLED'):
+            return True
+
+        if self._bloom is None:
+            await sync_to_async(self._get_bloom)()
+        if license_key in self._get_bloom():
+            if await cache.aget(self.missing_key(license_key)):
+                self._count('negative_cache_rejections')
+                return False
+            return True
+
+        if await cache.aget(self.recent_key(license_key)):
+            return True
+        self._count('filter_rejections')
+        return False
+
+    async def arecord_missing(self, license_key):
+        if get_filter_setting('ENABLED'):
+            self._count('false_positives')
+            await cache.aset(self.missing_key(license_key), True, get_filter_setting('NEGATIVE_TIMEOUT'))
+
+    def record_missing(self, license_key):
+        """Remembers a database miss for a key the filter could not rule out."""
+        if get_filter_setting('ENABLED'):
+            self._count('false_positives')
+            cache.set(self.missing_key(license_key), True, get_filter_setting('NEGATIVE_TIMEOUT'))
+
+    def record_created(self, license_keys):
+        license_keys = [str(license_key) for license_key in license_keys]
+        if not license_keys:
+            return
+        if self._bloom is not None:
+            for license_key in license_keys:
+                self._bloom.add(license_key)
+        cache.set_many(
+            {self.recent_key(license_key): True for license_key in license_keys},
+            get_filter_setting('REFRESH_INTERVAL') * 2
+        )
+        cache.delete_many([self.missing_key(license_key) for license_key in license_keys])
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update({
+            'enabled': get_filter_setting('ENABLED'),
+            'bits': self._bloom.size if self._bloom else None,
+            'hash_count': self._bloom.hash_count if self._bloom else None,
+        })
+        return stats
+
+
+license_key_filter = LicenseKeyFilter()
+
+
+def get_license_key_or_404(license_key, queryset=None):
+    """
+    Drop-in for get_object_or_404(LicenseKey, key=...) that rejects unknown keys
+    through the filter and negative cache before querying.
+    """
+    if not license_key_filter.might_exist(license_key):
+        raise Http404("No LicenseKey matches the given query.")
+    with use_shard_of(license_key):
+        lk = (queryset if queryset is not None else LicenseKey.objects.all()).filter(key=license_key).first()
+    if lk is None:
+        license_key_filter.record_missing(license_key)
+        raise Http404("No LicenseKey matches the given query.")
+    return lk
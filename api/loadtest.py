@@ -0,0 +1,256 @@
+# Load-testing harness
+#
+# Replays a weighted mix of the service's hot requests against a running server
+# (e.g. `docker compose up` or uvicorn/uWSGI) over plain HTTP, so the numbers
+# include serialization, middleware and the real database. Each worker thread
+# keeps one keep-alive connection and picks the next operation by weight:
+#   status           GET  /api/status/<key>/
+#   activate         POST /api/activate/        (re-activates from a pool of instances)
+#   provision        POST /api/provision/       (new customer each time)
+#   customer_lookup  GET  /api/customer-lookup/?email=...
+# A working set of keys is provisioned before the timed run. The report gives
+# throughput and p50/p95/p99 latency per operation; a saved report can be used
+# as the baseline for later runs (see `python manage.py loadtest --help`).
+#
+# Throttling applies to load tests like to any other client: raise the
+# THROTTLE_* rates on the server under test, or 429s show up as errors.
+
+import http.client
+import itertools
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from urllib.parse import urlencode, urlsplit
+
+OPERATIONS = ('status', 'activate', 'provision', 'customer_lookup')
+DEFAULT_MIX = 'status=70,activate=15,provision=10,customer_lookup=5'
+PERCENTILES = (50, 95, 99)
+
+
+def parse_mix(mix):
+    """'status=70,activate=30' -> {'status': 70, 'activate': 30}."""
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{name}' (expected one of {', '.join(OPERATIONS)})")
+        try:
+            weights[name] = float(weight)
+        except ValueError:
+            raise ValueError(f"Invalid weight for '{name}': '{weight}'")
+        if weights[name] < 0:
+            raise ValueError(f"Invalid weight for '{name}': '{weight}'")
+    if not any(weights.values()):
+        raise ValueError("The mix needs at least one operation with a positive weight")
+    return weights
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(samples, elapsed):
+    """
+    `samples` maps operation -> list of (latency in seconds, ok). Returns a
+    JSON-serializable report with latencies in milliseconds.
+    """
+    operations = {}
+    for name, results in sorted(samples.items()):
+        latencies = sorted(latency for latency, _ in results)
+        errors = sum(1 for _, ok in results if not ok)
+        operations[name] = {
+            'requests': len(results),
+            'errors': errors,
+            'throughput': round(len(results) / elapsed, 2) if elapsed else None,
+            **{
+                f'p{pct}_ms': round(percentile(latencies, pct) * 1000, 2) if latencies else None
+                for pct in PERCENTILES
+            },
+        }
+    total = sum(op['requests'] for op in operations.values())
+    return {
+        'elapsed': round(elapsed, 2),
+        'requests': total,
+        'throughput': round(total / elapsed, 2) if elapsed else None,
+        'operations': operations,
+    }
+
+
+def compare_to_baseline(report, baseline, tolerance):
+    """
+    Lists regressions of `report` against `baseline`: a latency percentile more
+    than `tolerance` (a fraction) higher, throughput more than `tolerance` lower,
+    or a higher error rate.
+    """
+    regressions = []
+    for name, current in report['operations'].items():
+        previous = baseline.get('operations', {}).get(name)
+        if not previous:
+            continue
+        for pct in PERCENTILES:
+            field = f'p{pct}_ms'
+            if current[field] is not None and previous.get(field) and \
+                    current[field] > previous[field] * (1 + tolerance):
+                regressions.append(f"{name} {field}: {previous[field]} -> {current[field]}")
+        if previous.get('throughput') and current['throughput'] is not None and \
+                current['throughput'] < previous['throughput'] * (1 - tolerance):
+            regressions.append(f"{name} throughput: {previous['throughput']} -> {current['throughput']} req/s")
+        previous_rate = previous['errors'] / previous['requests'] if previous.get('requests') else 0
+        current_rate = current['errors'] / current['requests'] if current['requests'] else 0
+        if current_rate > previous_rate + tolerance / 10:
+            regressions.append(f"{name} error rate: {previous_rate:.2%} -> {current_rate:.2%}")
+    return regressions
+
+
+class Client:
+    """One keep-alive HTTP connection; not thread-safe, so each worker owns one."""
+
+    def __init__(self, base_url, token=None, timeout=10):
+        parts = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(parts.netloc, timeout=timeout)
+        self.prefix = parts.path.rstrip('/')
+        self.token = token
+
+    def request(self, method, path, payload=None):
+        """Returns (status, parsed JSON body or None)."""
+        headers = {'Accept': 'application/json'}
+        body = None
+        if payload is not None:
+            body = json.dumps(payload)
+            headers['Content-Type'] = 'application/json'
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        try:
+            self.connection.request(method, self.prefix + path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            # Reconnect on the next request
+            self.connection.close()
+            return None, None
+        try:
+            return response.status, json.loads(content) if content else None
+        except ValueError:
+            return response.status, None
+
+    def close(self):
+        self.connection.close()
+
+
+class LoadTest:
+    def __init__(self, base_url, token, brand_slug, product_slug, mix, concurrency=10,
+                 duration=30, keys=200, instances_per_key=5, seed=None):
+        self.base_url = base_url
+        self.token = token
+        self.brand_slug = brand_slug
+        self.product_slug = product_slug
+        self.mix = mix
+        self.concurrency = concurrency
+        self.duration = duration
+        self.key_count = keys
+        self.instances_per_key = instances_per_key
+        self.seed = seed
+        self.run_id = uuid.uuid4().hex[:8]
+        self.keys = []
+
+    def _provision_payload(self, customer):
+        return {
+            'brand_slug': self.brand_slug,
+            'product_slug': self.product_slug,
+            'customer_email': f'load-{self.run_id}-{customer}@example.com',
+            'total_seats': self.instances_per_key,
+        }
+
+    def prepare(self):
+        """Provisions the working set of (key, customer email) pairs used by the run."""
+        client = Client(self.base_url, self.token)
+        try:
+            for customer in range(self.key_count):
+                payload = self._provision_payload(customer)
+                status, body = client.request('POST', '/api/provision/', payload)
+                if status != 201:
+                    raise RuntimeError(f"Provisioning the working set failed with HTTP {status}: {body}")
+                self.keys.append((body['key'], payload['customer_email']))
+        finally:
+            client.close()
+
+    def _operation(self, name, client, rng, counter):
+        key, email = rng.choice(self.keys)
+        if name == 'status':
+            status, _ = client.request('GET', f'/api/status/{key}/')
+            return status == 200
+        if name == 'activate':
+            status, _ = client.request('POST', '/api/activate/', {
+                'license_key': key,
+                'product_slug': self.product_slug,
+                'instance_id': f'load-{rng.randrange(self.instances_per_key)}.example.com',
+            })
+            return status in (200, 201)
+        if name == 'provision':
+            status, _ = client.request('POST', '/api/provision/', self._provision_payload(f'new-{next(counter)}'))
+            return status == 201
+        status, _ = client.request('GET', f"/api/customer-lookup/?{urlencode({'email': email})}")
+        return status == 200
+
+    def _worker(self, worker_id, deadline, samples, lock, counter):
+        rng = random.Random(None if self.seed is None else self.seed + worker_id)
+        names, weights = zip(*self.mix.items())
+        client = Client(self.base_url, self.token)
+        local = {name: [] for name in names}
+        try:
+            while time.monotonic() < deadline:
+                name = rng.choices(names, weights)[0]
+                started_at = time.perf_counter()
+                ok = self._operation(name, client, rng, counter)
+                local[name].append((time.perf_counter() - started_at, ok))
+        finally:
+            client.close()
+        with lock:
+            for name, results in local.items():
+                samples.setdefault(name, []).extend(results)
+
+    def run(self):
+        """Runs the timed mix and returns the summary report."""
+        if not self.keys:
+            self.prepare()
+        samples, lock = {}, threading.Lock()
+        # Unique customer suffixes for provisions during the run
+        counter = itertools.count()
+        started_at = time.monotonic()
+        deadline = started_at + self.duration
+        workers = [
+            threading.Thread(target=self._worker, args=(i, deadline, samples, lock, counter), daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        report = summarize(samples, time.monotonic() - started_at)
+        report['config'] = {
+            'mix': self.mix,
+            'concurrency': self.concurrency,
+            'duration': self.duration,
+            'keys': self.key_count,
+        }
+        return report
+
+
+def obtain_token(base_url, username, password):
+    client = Client(base_url)
+    try:
+        status, body = client.request('POST', '/api/auth/token/', {'username': username, 'password': password})
+    finally:
+        client.close()
+    if status != 200 or not body:
+        raise RuntimeError(f"Could not obtain a token for '{username}' (HTTP {status})")
+    return body['access']
@@ -0,0 +1,67 @@
+import io
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from api.models import LicenseKey
+from api.parsers import MessagePackParser, ORJSONParser
+from api.renderers import MessagePackRenderer, ORJSONRenderer, msgpack
+from api.serializers import LicenseKeySerializer
+
+
+class Command(BaseCommand):
+    help = "Compares the JSON (DRF, orjson) and MessagePack renderers and parsers on license status payloads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keys', type=int, default=1000, help="License keys to serialize (default 1000)")
+        parser.add_argument('--page-size', type=int, default=100,
+                            help="Keys per list payload, like a customer lookup page (default 100)")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per measurement; the best is kept")
+
+    def handle(self, *args, **options):
+        keys = LicenseKey.objects.with_license_details().order_by('pk')[:options['keys']]
+        statuses = [dict(data) for data in LicenseKeySerializer(keys, many=True).data]
+        if not statuses:
+            raise CommandError("No license keys to serialize; create some with `manage.py generate_data`.")
+        page_size = options['page_size']
+        pages = [statuses[start:start + page_size] for start in range(0, len(statuses), page_size)]
+        self.stderr.write(f"{len(statuses)} status payloads, {len(pages)} list payloads of up to {page_size} keys")
+
+        formats = [('json', JSONRenderer(), JSONParser()), ('orjson', ORJSONRenderer(), ORJSONParser())]
+        if msgpack is not None:
+            formats.append(('msgpack', MessagePackRenderer(), MessagePackParser()))
+        else:
+            self.stderr.write("msgpack is not installed; skipping MessagePack")
+
+        columns = ['render_us', 'parse_us', 'bytes', 'speedup']
+        self.stdout.write(f"{'payload':<10}{'format':<10}" + ''.join(f"{column:>12}" for column in columns))
+        for payload_name, payloads in (('status', statuses), ('list', pages)):
+            baseline = None
+            for format_name, renderer, parser in formats:
+                result = self._measure(renderer, parser, payloads, options['repeat'])
+                baseline = baseline or result['render_us']
+                result['speedup'] = f"{baseline / result['render_us']:.1f}x" if result['render_us'] else '-'
+                self.stdout.write(f"{payload_name:<10}{format_name:<10}"
+                                  + ''.join(f"{str(result[column]):>12}" for column in columns))
+
+    def _measure(self, renderer, parser, payloads, repeat):
+        """Best-of-`repeat` microseconds per payload to render and parse, and mean size."""
+        rendered = [renderer.render(payload) for payload in payloads]
+        render_time = parse_time = float('inf')
+        for _ in range(max(1, repeat)):
+            started_at = time.perf_counter()
+            for payload in payloads:
+                renderer.render(payload)
+            render_time = min(render_time, time.perf_counter() - started_at)
+
+            started_at = time.perf_counter()
+            for body in rendered:
+                parser.parse(io.BytesIO(body))
+            parse_time = min(parse_time, time.perf_counter() - started_at)
+        return {
+            'render_us': round(render_time * 1e6 / len(payloads), 1),
+            'parse_us': round(parse_time * 1e6 / len(payloads), 1),
+            'bytes': sum(map(len, rendered)) // len(rendered),
+        }
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api.expiry import expire_licenses
+
+
+class Command(BaseCommand):
+    help = "Moves VALID licenses whose expires_at has passed to EXPIRED, in batches. Meant to run from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Count due licenses without changing them")
+
+    def handle(self, *args, **options):
+        expired = expire_licenses(options['batch_size'], options['dry_run'])
+        verb = "Found" if options['dry_run'] else "Expired"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {expired} license(s) past their expiry date."))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.exports import EXPORT_FORMATS, export_lines
+from api.models import Brand
+
+
+class Command(BaseCommand):
+    help = "Streams a brand's license keys, licenses and activations as NDJSON or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('brand_slug')
+        parser.add_argument('--export-format', choices=sorted(EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--output', default='-', help="File path, or '-' for stdout")
+        parser.add_argument('--active-only', action='store_true', help="Only export active licenses")
+
+    def handle(self, *args, **options):
+        try:
+            brand = Brand.objects.get(slug=options['brand_slug'])
+        except Brand.DoesNotExist:
+            raise CommandError(f"Brand '{options['brand_slug']}' does not exist.")
+
+        chunks = export_lines(brand, options['export_format'], active_only=options['active_only'])
+        if options['output'] == '-':
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        with open(options['output'], 'w', newline='') as output:
+            for chunk in chunks:
+                output.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f"Exported {brand.slug} to {options['output']}"))
@@ -0,0 +1,63 @@
+from datetime import timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from api.synthetic import DEFAULT_EPOCH, SyntheticDataGenerator
+
+
+class Command(BaseCommand):
+    help = "Generates a skewed, seed-deterministic data set of brands, keys, licenses and activations for benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--brands', type=int, default=20)
+        parser.add_argument('--products-per-brand', type=int, default=5)
+        parser.add_argument('--keys', type=int, default=100000, help="Number of license keys to generate")
+        parser.add_argument('--customers', type=int, help="Distinct customer emails (default: keys / 3)")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--epoch', default=DEFAULT_EPOCH.isoformat(),
+                            help="Newest timestamp of the data set, ISO 8601 or 'now' (default: %(default)s)")
+        parser.add_argument('--chunk-size', type=int, default=10000, help="License keys written per transaction")
+        parser.add_argument('--skip-key-filter', action='store_true',
+                            help="Do not register the new keys with the license key filter")
+
+    def handle(self, *args, **options):
+        for option in ('brands', 'products_per_brand', 'keys', 'chunk_size'):
+            if options[option] < 1:
+                raise CommandError(f"--{option.replace('_', '-')} must be at least 1.")
+        try:
+            epoch = timezone.now() if options['epoch'] == 'now' else parse_datetime(options['epoch'])
+        except ValueError:
+            epoch = None
+        if epoch is None:
+            raise CommandError("--epoch must be an ISO 8601 date and time, or 'now'.")
+        if timezone.is_naive(epoch):
+            epoch = timezone.make_aware(epoch, dt_timezone.utc)
+
+        generator = SyntheticDataGenerator(
+            brands=options['brands'],
+            products_per_brand=options['products_per_brand'],
+            keys=options['keys'],
+            customers=options['customers'],
+            seed=options['seed'],
+            epoch=epoch,
+            chunk_size=options['chunk_size'],
+            register_keys=not options['skip_key_filter'],
+            progress=self._report_progress,
+        )
+        try:
+            stats = generator.generate()
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        rows = ', '.join(f"{count} {name}" for name, count in stats['rows'].items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {rows} in {stats['elapsed']}s ({stats['rows_per_second']} rows/s)."
+        ))
+
+    def _report_progress(self, stats):
+        self.stderr.write(
+            f"{stats['rows']['LicenseKey']} keys, {stats['rows']['License']} licenses, "
+            f"{stats['rows']['Activation']} activations ({stats['rows_per_second']} rows/s)"
+        )
@@ -0,0 +1,37 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.signing import generate_key_pair
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates an Ed25519 key pair for offline license tokens in LICENSE_SIGNING_KEY_DIR. "
+        "The new key is published immediately; set LICENSE_SIGNING_ACTIVE_KID to start signing with it."
+    )
+    # Creates the first key, which the signing key check would otherwise reject
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('kid', help="Key id, e.g. 2026-10")
+        parser.add_argument('--key-dir', default=None, help="Defaults to LICENSE_SIGNING_KEY_DIR")
+
+    def handle(self, *args, **options):
+        key_dir = options['key_dir'] or settings.LICENSE_SIGNING_KEY_DIR
+        if not key_dir:
+            raise CommandError("No key directory given and LICENSE_SIGNING_KEY_DIR is not set.")
+
+        key_dir = Path(key_dir)
+        key_dir.mkdir(parents=True, exist_ok=True)
+        private_path = key_dir / f"{options['kid']}.pem"
+        public_path = key_dir / f"{options['kid']}.pub.pem"
+        if private_path.exists() or public_path.exists():
+            raise CommandError(f"Key '{options['kid']}' already exists in {key_dir}")
+
+        private_pem, public_pem = generate_key_pair()
+        private_path.write_bytes(private_pem)
+        private_path.chmod(0o600)
+        public_path.write_bytes(public_pem)
+        self.stdout.write(self.style.SUCCESS(f"Created signing key '{options['kid']}' in {key_dir}"))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Brand
+from api.service_tokens import SCOPES, issue_service_token
+
+
+class Command(BaseCommand):
+    help = (
+        "Issues a service token limited to one brand, for its integrations. "
+        "The token is printed once; revoke it with revoke_service_token or from the admin."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('brand_slug')
+        parser.add_argument('--name', required=True, help="What the token is for, e.g. 'billing sync'")
+        parser.add_argument(
+            '--scope', dest='scopes', action='append', choices=SCOPES,
+            help="Endpoints the token may call; repeat for several (default: all)"
+        )
+        parser.add_argument('--lifetime', type=int, default=None, help="Seconds (default: SERVICE_TOKEN_LIFETIME)")
+
+    def handle(self, *args, **options):
+        brand = Brand.objects.filter(slug=options['brand_slug']).first()
+        if brand is None:
+            raise CommandError(f"Brand '{options['brand_slug']}' not found.")
+
+        record, token = issue_service_token(brand, options['scopes'] or SCOPES, options['name'], options['lifetime'])
+        self.stderr.write(
+            f"Issued service token {record.jti} for brand {brand.slug} "
+            f"(scopes: {', '.join(record.scopes)}; expires {record.expires_at:%Y-%m-%d})"
+        )
+        self.stdout.write(token)
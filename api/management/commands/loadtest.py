@@ -0,0 +1,83 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.loadtest import DEFAULT_MIX, PERCENTILES, LoadTest, compare_to_baseline, obtain_token, parse_mix
+
+
+class Command(BaseCommand):
+    help = "Replays a mix of status, activation, provisioning and lookup requests against a running server."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://localhost:8000', help="Base URL of the server under test")
+        parser.add_argument('--username', help="Staff user used to provision and look up licenses")
+        parser.add_argument('--password')
+        parser.add_argument('--token', help="JWT access token, instead of --username/--password")
+        parser.add_argument('--brand', required=True, help="Slug of an existing brand")
+        parser.add_argument('--product', required=True, help="Slug of an existing product of that brand")
+        parser.add_argument('--mix', default=DEFAULT_MIX, help=f"Operation weights (default: {DEFAULT_MIX})")
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--duration', type=float, default=30, help="Seconds to run the mix for")
+        parser.add_argument('--keys', type=int, default=200, help="Size of the provisioned working set")
+        parser.add_argument('--seed', type=int)
+        parser.add_argument('--save-baseline', metavar='PATH', help="Write the report as JSON to PATH")
+        parser.add_argument('--baseline', metavar='PATH', help="Compare against a saved report")
+        parser.add_argument('--tolerance', type=float, default=0.10,
+                            help="Allowed relative regression against the baseline (default 0.10)")
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as baseline_file:
+                    baseline = json.load(baseline_file)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Could not read baseline '{options['baseline']}': {exc}")
+
+        token = options['token']
+        try:
+            if not token:
+                if not options['username'] or not options['password']:
+                    raise CommandError("Pass --token or --username and --password.")
+                token = obtain_token(options['url'], options['username'], options['password'])
+
+            load_test = LoadTest(
+                options['url'], token, options['brand'], options['product'], mix,
+                concurrency=options['concurrency'], duration=options['duration'],
+                keys=options['keys'], seed=options['seed'],
+            )
+            self.stderr.write(f"Provisioning {options['keys']} keys...")
+            load_test.prepare()
+            self.stderr.write(f"Running {options['concurrency']} workers for {options['duration']}s...")
+            report = load_test.run()
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+
+        self._print_report(report)
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as baseline_file:
+                json.dump(report, baseline_file, indent=2)
+            self.stderr.write(self.style.SUCCESS(f"Saved baseline to {options['save_baseline']}"))
+
+        if baseline is not None:
+            regressions = compare_to_baseline(report, baseline, options['tolerance'])
+            if regressions:
+                for regression in regressions:
+                    self.stdout.write(self.style.ERROR(f"REGRESSION {regression}"))
+                raise CommandError(f"{len(regressions)} regression(s) against {options['baseline']}")
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['baseline']}"))
+
+    def _print_report(self, report):
+        columns = ['requests', 'errors', 'throughput'] + [f'p{pct}_ms' for pct in PERCENTILES]
+        self.stdout.write(f"{'operation':<16}" + ''.join(f"{column:>12}" for column in columns))
+        for name, stats in report['operations'].items():
+            self.stdout.write(f"{name:<16}" + ''.join(f"{str(stats[column]):>12}" for column in columns))
+        self.stdout.write(
+            f"Total: {report['requests']} requests in {report['elapsed']}s ({report['throughput']} req/s)"
+        )
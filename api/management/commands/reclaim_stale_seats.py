@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.heartbeats import get_heartbeat_setting, reclaim_stale_seats
+
+
+class Command(BaseCommand):
+    help = "Frees the seats of activations that have not sent a heartbeat within ACTIVATION_HEARTBEAT['STALE_AFTER']."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-after', type=int, help="Seconds without a heartbeat (default: the setting)")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Count stale activations without deleting them")
+        parser.add_argument('--every', type=int, metavar='SECONDS',
+                            help="Keep running, reclaiming every SECONDS (for a background worker)")
+
+    def handle(self, *args, **options):
+        stale_after = options['stale_after'] or get_heartbeat_setting('STALE_AFTER')
+        while True:
+            reclaimed = reclaim_stale_seats(stale_after, options['batch_size'], options['dry_run'])
+            verb = "Found" if options['dry_run'] else "Reclaimed"
+            self.stdout.write(self.style.SUCCESS(
+                f"{verb} {reclaimed} activation(s) not seen for {stale_after}s."
+            ))
+            if not options['every']:
+                return
+            time.sleep(options['every'])
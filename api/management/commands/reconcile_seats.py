@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from api.cache import license_status_cache
+from api.models import Activation, License
+from api.sharding import each_shard
+from api.verdicts import refresh_verdicts
+
+
+class Command(BaseCommand):
+    help = "Repairs drift between License.active_seats and the actual number of activations."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report drift without fixing it")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        repaired = 0
+        for database in each_shard():
+            repaired += self._reconcile(database, options['batch_size'], options['dry_run'])
+
+        verb = "Found" if options['dry_run'] else "Repaired"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {repaired} license(s) with seat drift."))
+
+    def _reconcile(self, database, batch_size, dry_run):
+        drifted = License.objects.using(database).annotate(
+            actual_seats=Count('activations')
+        ).exclude(active_seats=F('actual_seats')).values_list(
+            'id', 'active_seats', 'actual_seats', 'license_key__key'
+        )
+
+        batch, repaired = [], 0
+        for license_id, active_seats, actual_seats, license_key in drifted.iterator(chunk_size=batch_size):
+            self.stdout.write(f"License {license_id}: active_seats={active_seats}, actual={actual_seats}")
+            batch.append((license_id, license_key))
+            if len(batch) >= batch_size:
+                repaired += self._save(batch, dry_run, database)
+                batch = []
+        return repaired + self._save(batch, dry_run, database)
+
+    def _save(self, batch, dry_run, database):
+        if batch and not dry_run:
+            # Counted by the UPDATE itself, like migration 0003: a seat taken or
+            # released since the scan above is not overwritten with a stale count
+            seat_counts = (
+                Activation.objects.filter(license=OuterRef('pk'))
+                .order_by()
+                .values('license')
+                .annotate(total=Count('pk'))
+                .values('total')
+            )
+            license_keys = {license_key for _, license_key in batch}
+            with transaction.atomic(using=database):
+                License.objects.using(database).filter(pk__in=[license_id for license_id, _ in batch]).update(
+                    active_seats=Coalesce(Subquery(seat_counts), 0)
+                )
+                # update() sends no signals: drop the statuses and verdicts built on the old count
+                license_status_cache.invalidate(license_keys, database)
+                refresh_verdicts(license_keys, using=database)
+        return len(batch)
@@ -0,0 +1,99 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from api.models import Activation, Brand, License, LicenseKey, Product
+from api.sharding import replicate_reference_row, shard_aliases, shard_for_key, use_shard
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies brands and products to every shard, then moves each license key (with its licenses and "
+        "activations) to the shard it hashes to. Run it after changing DATABASE_SHARD_URLS and migrating "
+        "the new shards, in a maintenance window: a key cannot be found while it is being moved."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report the keys to move without moving them")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        aliases = shard_aliases()
+        if not aliases:
+            raise CommandError("Sharding is off; set DATABASE_SHARD_URLS first.")
+
+        if not options['dry_run']:
+            copied = self._copy_reference_data()
+            self.stdout.write(f"Copied {copied} brand/product row(s) to {len(aliases) - 1} shard(s).")
+
+        moved = 0
+        for source in aliases:
+            moved += self._rebalance(source, options['batch_size'], options['dry_run'])
+
+        verb = "Found" if options['dry_run'] else "Moved"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {moved} license key(s) on the wrong shard."))
+
+    def _copy_reference_data(self):
+        copied = 0
+        # Brands first, for the products' foreign keys
+        for model in (Brand, Product):
+            for instance in model.objects.using(DEFAULT_DB_ALIAS).order_by('pk').iterator():
+                replicate_reference_row(instance)
+                copied += 1
+        return copied
+
+    def _rebalance(self, source, batch_size, dry_run):
+        """Moves the keys of `source` that hash to another shard; returns how many."""
+        moved, last_pk = 0, 0
+        while True:
+            # Keyset batches: moved keys are deleted behind the cursor
+            batch = list(LicenseKey.objects.using(source).filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+            if not batch:
+                return moved
+            last_pk = batch[-1].pk
+
+            by_target = {}
+            for lk in batch:
+                target = shard_for_key(lk.key)
+                if target != source:
+                    by_target.setdefault(target, []).append(lk)
+            for target, keys in by_target.items():
+                self.stdout.write(f"{source} -> {target}: {len(keys)} key(s)")
+                if not dry_run:
+                    self._move(source, target, keys)
+                moved += len(keys)
+
+    def _move(self, source, target, keys):
+        key_ids = [lk.pk for lk in keys]
+        licenses = list(License.objects.using(source).filter(license_key_id__in=key_ids))
+        activations = list(Activation.objects.using(source).filter(license__license_key_id__in=key_ids))
+
+        # No cross-shard transactions: the copy commits before the originals are
+        # deleted, and a copy left by an interrupted run is replaced.
+        with use_shard(target), transaction.atomic(using=target):
+            LicenseKey.objects.using(target).filter(key__in=[lk.key for lk in keys]).delete()
+            new_key_ids = self._copy(target, LicenseKey, keys, ['created_at'])
+            for license_obj in licenses:
+                license_obj.license_key_id = new_key_ids[license_obj.license_key_id]
+            new_license_ids = self._copy(target, License, licenses, ['created_at', 'updated_at'])
+            for activation in activations:
+                activation.license_id = new_license_ids[activation.license_id]
+            self._copy(target, Activation, activations, ['activated_at'])
+
+        # Through the model signals, which drop the keys' cached statuses and verdicts
+        with use_shard(source), transaction.atomic(using=source):
+            LicenseKey.objects.using(source).filter(pk__in=key_ids).delete()
+
+    def _copy(self, target, model, instances, timestamps):
+        """Inserts `instances` on `target` under new ids, timestamps kept; returns {old id: new id}."""
+        old_ids = [instance.pk for instance in instances]
+        values = [[getattr(instance, field) for field in timestamps] for instance in instances]
+        for instance in instances:
+            instance.pk = None
+        model.objects.using(target).bulk_create(instances)
+        # bulk_create stamps auto_now(_add) fields with the current time
+        for instance, row in zip(instances, values):
+            for field, value in zip(timestamps, row):
+                setattr(instance, field, value)
+        if instances:
+            model.objects.using(target).bulk_update(instances, timestamps)
+        return dict(zip(old_ids, (instance.pk for instance in instances)))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import ServiceToken
+from api.service_tokens import revoked_service_tokens
+
+
+class Command(BaseCommand):
+    help = "Revokes service tokens by jti, or every token of a brand with --brand."
+
+    def add_arguments(self, parser):
+        parser.add_argument('jtis', nargs='*')
+        parser.add_argument('--brand', default=None, help="Revoke all tokens of this brand slug")
+
+    def handle(self, *args, **options):
+        if not options['jtis'] and not options['brand']:
+            raise CommandError("Give token jtis or --brand.")
+        tokens = ServiceToken.objects.all()
+        if options['jtis']:
+            tokens = tokens.filter(jti__in=options['jtis'])
+        if options['brand']:
+            tokens = tokens.filter(brand__slug=options['brand'])
+
+        revoked = revoked_service_tokens.revoke(tokens)
+        self.stdout.write(self.style.SUCCESS(f"Revoked {revoked} service token(s)."))
@@ -0,0 +1,132 @@
+# Prometheus metrics
+#
+# PrometheusMetricsMiddleware records, per resolved route pattern (never the raw
+# path, so license keys do not become label values):
+#   - request latency and status codes,
+#   - ORM query count and time, through an execute_wrapper on every database
+#     alias (shards and replicas included).
+# Subsystems count their own events: status cache lookups (api/cache.py),
+# activation outcomes (ActivateLicenseView and its async twin) and database
+# connections opened, held and waited for (api/pooling.py).
+#
+# `GET /metrics` exposes them in the text format. Under uWSGI every worker has
+# its own counters; set PROMETHEUS_MULTIPROC_DIR to an empty directory shared by
+# the workers (uwsgi.ini does) and the endpoint aggregates all of them.
+
+import os
+import time
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+
+REQUEST_LATENCY = Histogram(
+    'license_http_request_duration_seconds', 'Request latency by route.', ['method', 'route'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUESTS = Counter('license_http_requests', 'Responses by route and status code.', ['method', 'route', 'status'])
+DB_QUERIES = Histogram(
+    'license_db_queries_per_request', 'ORM queries per request by route.', ['route'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+DB_QUERY_TIME = Histogram(
+    'license_db_query_seconds_per_request', 'Time spent in ORM queries per request by route.', ['route'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+STATUS_CACHE_LOOKUPS = Counter(
+    'license_status_cache_lookups', 'License status cache lookups by result.', ['result']
+)
+ACTIVATIONS = Counter('license_activations', 'Activation attempts by outcome.', ['outcome'])
+DB_CONNECTIONS = Gauge(
+    'license_db_connections', 'Open database connections by alias and state (in_use, idle).', ['alias', 'state'],
+    multiprocess_mode='livesum',
+)
+DB_CONNECTION_WAIT = Histogram(
+    'license_db_connection_wait_seconds', 'Time to get a database connection (connect or pool checkout).', ['alias'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+
+ACTIVATION_OUTCOMES = ('created', 'idempotent', 'seat_limit', 'inactive', 'not_found')
+
+
+def record_activation(outcome):
+    ACTIVATIONS.labels(outcome).inc()
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match else 'unmatched'
+
+
+@contextmanager
+def execute_wrapper_everywhere(wrapper):
+    """connection.execute_wrapper(wrapper) on the connection of every alias, for the current thread."""
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(wrapper))
+        yield
+
+
+class QueryTimer:
+    """execute_wrapper counting the queries of one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started_at
+
+
+class PrometheusMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started_at = time.perf_counter()
+        queries = QueryTimer()
+        with execute_wrapper_everywhere(queries):
+            response = self.get_response(request)
+        route = _route(request)
+        self._observe(request, response, route, started_at)
+        DB_QUERIES.labels(route).observe(queries.count)
+        DB_QUERY_TIME.labels(route).observe(queries.duration)
+        return response
+
+    async def __acall__(self, request):
+        # Async views run their queries in worker threads, out of reach of a
+        # wrapper installed here, so only latency and status are recorded.
+        started_at = time.perf_counter()
+        response = await self.get_response(request)
+        self._observe(request, response, _route(request), started_at)
+        return response
+
+    def _observe(self, request, response, route, started_at):
+        REQUEST_LATENCY.labels(request.method, route).observe(time.perf_counter() - started_at)
+        REQUESTS.labels(request.method, route, response.status_code).inc()
+
+
+def metrics_view(request):
+    """Prometheus exposition endpoint, aggregated across workers in multiprocess mode."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
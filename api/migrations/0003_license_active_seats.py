@@ -0,0 +1,37 @@
+# Generated by Django 5.2.9 on 2026-10-17 21:54
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_active_seats(apps, schema_editor):
+    License = apps.get_model("api", "License")
+    Activation = apps.get_model("api", "Activation")
+    # Each shard is migrated on its own: count and write on the one being migrated
+    db = schema_editor.connection.alias
+    seat_counts = (
+        Activation.objects.using(db).filter(license=OuterRef("pk"))
+        .order_by()
+        .values("license")
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    License.objects.using(db).update(active_seats=Coalesce(Subquery(seat_counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0002_alter_license_unique_together"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="license",
+            name="active_seats",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        # Without the hint the shard router keeps this operation off the shards
+        migrations.RunPython(backfill_active_seats, migrations.RunPython.noop, hints={"model_name": "license"}),
+    ]
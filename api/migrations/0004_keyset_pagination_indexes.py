@@ -0,0 +1,29 @@
+# Generated by Django 5.2.9 on 2026-10-17 22:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_license_active_seats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='brand',
+            index=models.Index(fields=['created_at', 'id'], name='brand_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='licensekey',
+            index=models.Index(fields=['created_at', 'id'], name='licensekey_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='licensekey',
+            index=models.Index(fields=['customer_email', 'created_at', 'id'], name='licensekey_email_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['created_at', 'id'], name='product_created_id_idx'),
+        ),
+    ]
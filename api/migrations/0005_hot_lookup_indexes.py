@@ -0,0 +1,21 @@
+# Generated by Django 5.2.9 on 2026-10-17 22:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='license',
+            index=models.Index(condition=models.Q(('status', 'VALID')), fields=['expires_at'], name='license_valid_expires_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='licensekey',
+            index=models.Index(fields=['customer_email', 'brand'], name='licensekey_email_brand_idx'),
+        ),
+    ]
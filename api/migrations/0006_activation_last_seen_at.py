@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-17 22:22
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activation',
+            name='last_seen_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='activation',
+            index=models.Index(fields=['last_seen_at'], name='activation_last_seen_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-17 22:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_activation_last_seen_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='license',
+            name='status',
+            field=models.CharField(choices=[('VALID', 'Valid'), ('SUSPENDED', 'Suspended'), ('CANCELLED', 'Cancelled'), ('EXPIRED', 'Expired')], default='VALID', max_length=20),
+        ),
+    ]
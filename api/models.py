@@ -1,12 +1,21 @@
-from django.db import models
+from django.db import IntegrityError, models, router, transaction
+from django.db.models import F, Prefetch, Q
 from django.utils import timezone
 import uuid
 
+from .sharding import shard_aliases
+
 class Brand(models.Model):
     name = models.CharField(max_length=255)
     slug = models.SlugField(unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination order
+            models.Index(fields=['created_at', 'id'], name='brand_created_id_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -18,24 +27,77 @@ class Product(models.Model):
 
     class Meta:
         unique_together = ('brand', 'slug')
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='product_created_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.brand.name} - {self.name}"
 
+class ShardedQuerySet(models.QuerySet):
+    def create(self, **kwargs):
+        # QuerySet.create() picks its database before the instance exists; without an
+        # explicit using(), save() lets the router place the row by its key (api/sharding.py)
+        if self._db is not None or not shard_aliases():
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+
+class LicenseKeyQuerySet(ShardedQuerySet):
+    def with_license_details(self, active_only=False):
+        """
+        Loads everything LicenseKeySerializer reads (brand, licenses, products,
+        seat counts and activations) in a fixed number of queries.
+        With `active_only`, inactive licenses are not loaded at all.
+        """
+        licenses = License.objects.with_details()
+        return self.select_related('brand').prefetch_related(
+            Prefetch('licenses', queryset=licenses.active() if active_only else licenses)
+        )
+
 class LicenseKey(models.Model):
     key = models.CharField(max_length=255, unique=True, default=uuid.uuid4)
     customer_email = models.EmailField()
     brand = models.ForeignKey(Brand, on_delete=models.CASCADE, related_name='license_keys')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = LicenseKeyQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='licensekey_created_id_idx'),
+            # Customer lookup, paginated by (created_at, id)
+            models.Index(fields=['customer_email', 'created_at', 'id'], name='licensekey_email_created_idx'),
+            # Customer's existing key for a brand (ProvisionLicenseView, bulk provisioning)
+            models.Index(fields=['customer_email', 'brand'], name='licensekey_email_brand_idx'),
+        ]
+
     def __str__(self):
         return f"{self.key} ({self.customer_email})"
 
+class LicenseQuerySet(ShardedQuerySet):
+    def with_details(self):
+        """Everything LicenseSerializer reads, in a fixed number of queries."""
+        return self.select_related('product__brand').prefetch_related('activations')
+
+    def active(self):
+        """SQL counterpart of License.is_active(), served by license_valid_expires_idx."""
+        return self.filter(Q(expires_at__isnull=True) | Q(expires_at__gte=timezone.now()), status='VALID')
+
+    def inactive(self):
+        return self.filter(~Q(status='VALID') | Q(expires_at__lt=timezone.now()))
+
+class SeatLimitReached(Exception):
+    pass
+
 class License(models.Model):
     STATUS_CHOICES = (
         ('VALID', 'Valid'),
         ('SUSPENDED', 'Suspended'),
         ('CANCELLED', 'Cancelled'),
+        # Set by `manage.py expire_licenses` once expires_at has passed; re-provisioning renews it
+        ('EXPIRED', 'Expired'),
     )
 
     license_key = models.ForeignKey(LicenseKey, on_delete=models.CASCADE, related_name='licenses')
@@ -43,11 +105,21 @@ class License(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='VALID')
     expires_at = models.DateTimeField(null=True, blank=True)
     total_seats = models.PositiveIntegerField(default=1)
+    # Denormalized count of activations, maintained by activate() and the Activation
+    # post_delete signal. `manage.py reconcile_seats` repairs any drift.
+    active_seats = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = LicenseQuerySet.as_manager()
+
     class Meta:
         unique_together = ('license_key', 'product')
+        indexes = [
+            # Only currently valid licenses, ordered by expiry: expiry sweeps and
+            # "active licenses" filters never touch suspended/cancelled rows.
+            models.Index(fields=['expires_at'], condition=Q(status='VALID'), name='license_valid_expires_idx'),
+        ]
 
     def is_active(self):
         if self.status != 'VALID':
@@ -56,6 +128,40 @@ class License(models.Model):
             return False
         return True
 
+    def activate(self, instance_id):
+        """
+        Registers `instance_id` against this license, claiming a seat atomically.
+        Returns (activation, created). Re-activating a known instance is idempotent
+        and needs no seat; raises SeatLimitReached when every seat is taken.
+        """
+        # On the license's shard, when sharded (api/sharding.py)
+        using = router.db_for_write(License, instance=self)
+        with transaction.atomic(using=using):
+            activation = self.activations.filter(instance_id=instance_id).first()
+            if activation:
+                return activation, False
+
+            # Conditional increment: the row lock taken by this UPDATE serialises
+            # concurrent claims, so total_seats can never be exceeded.
+            claimed = License.objects.using(using).filter(
+                pk=self.pk, active_seats__lt=F('total_seats')
+            ).update(active_seats=F('active_seats') + 1)
+            if not claimed:
+                raise SeatLimitReached(f"No seats remaining on license {self.pk}")
+
+            try:
+                with transaction.atomic(using=using):
+                    activation = Activation.objects.create(license=self, instance_id=instance_id)
+                created = True
+            except IntegrityError:
+                # A concurrent request registered the same instance first; give the seat back
+                License.objects.using(using).filter(pk=self.pk).update(active_seats=F('active_seats') - 1)
+                activation = self.activations.get(instance_id=instance_id)
+                created = False
+
+        self.refresh_from_db(fields=['active_seats'])
+        return activation, created
+
     def __str__(self):
         return f"{self.product.name} license for {self.license_key.key}"
 
@@ -64,9 +170,33 @@ class Activation(models.Model):
     # As stated at the assessment test, a Site URL or Machine ID would be used
     instance_id = models.CharField(max_length=255)
     activated_at = models.DateTimeField(auto_now_add=True)
+    # Advanced by heartbeats in batches (api/heartbeats.py); seats not seen for
+    # ACTIVATION_HEARTBEAT['STALE_AFTER'] are reclaimed.
+    last_seen_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    objects = ShardedQuerySet.as_manager()
 
     class Meta:
         unique_together = ('license', 'instance_id')
+        indexes = [
+            models.Index(fields=['last_seen_at'], name='activation_last_seen_idx'),
+        ]
 
     def __str__(self):
         return f"{self.instance_id} on {self.license.product.name}"
+
+class ServiceToken(models.Model):
+    """
+    A brand integration's API token (see api/service_tokens.py). Only the claims
+    are trusted at request time; rows record who was issued what, and revocations.
+    """
+    jti = models.CharField(max_length=64, unique=True)
+    brand = models.ForeignKey(Brand, on_delete=models.CASCADE, related_name='service_tokens')
+    name = models.CharField(max_length=255)
+    scopes = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    revoked_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.brand.slug})"
@@ -0,0 +1,142 @@
+# Keyset (cursor) pagination
+#
+# Pages are ordered newest first on (created_at, id), and the cursor encodes the
+# position of the last row served. The next page is fetched with
+#   WHERE created_at <= cursor.created_at
+#     AND (created_at < cursor.created_at OR id < cursor.id)
+#   ORDER BY created_at DESC, id DESC LIMIT page_size + 1
+# The first conjunct starts the (created_at, id) index range at the cursor (an OR
+# alone is only a filter over every newer row), so deep pages cost the same as
+# the first one. Unlike offsets, cursors stay stable while rows are inserted.
+#
+# Sharded models (api/sharding.py) take the first rows of every shard and merge
+# them. Shards allocate ids on their own, so two shards can both hold a row at
+# the same (created_at, id): the cursor also records the shard of the last row,
+# and ties go to shards in SHARDING['ALIASES'] order (`id <= cursor.id` on the
+# shards after it).
+
+import base64
+import binascii
+from contextlib import nullcontext
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .sharding import is_sharded, shard_aliases, use_shard
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        page_size = api_settings.PAGE_SIZE or 100
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return page_size
+        return min(requested, self.max_page_size) if requested > 0 else page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            fields = base64.urlsafe_b64decode(encoded.encode()).decode().split('|')
+            # Cursors handed out before the shard was recorded point at the first one
+            created_at, pk, shard = fields if len(fields) == 3 else [*fields, 0]
+            created_at, pk, shard = parse_datetime(created_at), int(pk), int(shard)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, pk, shard
+
+    def encode_cursor(self, position):
+        created_at, pk, shard = position
+        return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{pk}|{shard}".encode()).decode()
+
+    def filter_after(self, queryset, position, inclusive=False):
+        """
+        Rows after `position` in (-created_at, -id) order, bounded for an index range scan.
+        `inclusive` keeps a row at `position` itself, for the shards ordered after the cursor's.
+        """
+        created_at, pk = position[:2]
+        same_time = Q(id__lte=pk) if inclusive else Q(id__lt=pk)
+        return queryset.filter(created_at__lte=created_at).filter(Q(created_at__lt=created_at) | same_time)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by('-created_at', '-id')
+
+        position = self.decode_cursor(request)
+        aliases = shard_aliases() if is_sharded(queryset.model) else []
+
+        # One extra row tells us whether another page exists, without a COUNT
+        rows = []
+        for shard, alias in enumerate(aliases or [None]):
+            page = queryset if position is None else self.filter_after(queryset, position, shard > position[2])
+            with use_shard(alias) if alias else nullcontext():
+                page = list((page.using(alias) if alias else page)[:page_size + 1])
+            rows.extend((obj.created_at, obj.id, -shard, obj) for obj in page)
+        rows.sort(key=lambda row: row[:3], reverse=True)
+        rows = rows[:page_size + 1]
+        self.next_position = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            created_at, pk, shard, _ = rows[-1]
+            self.next_position = (created_at, pk, -shard)
+        return [row[3] for row in rows]
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_first_link(self):
+        return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'first': self.get_first_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'first': {'type': 'string', 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Opaque cursor taken from the `next` link.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Number of results per page (max {self.max_page_size}).',
+                'schema': {'type': 'integer'},
+            },
+        ]
@@ -0,0 +1,84 @@
+# Parsers.
+#
+# ORJSONParser and MessagePackParser are the request side of api/renderers.py.
+#
+# The streaming parsers for bulk endpoints (NDJSON, CSV) return a lazy iterator
+# over rows instead of a fully materialised list, so the view can process
+# uploads chunk by chunk while they are read.
+
+import csv
+
+import orjson
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+
+from .renderers import MSGPACK_MEDIA_TYPE, ORJSONRenderer, MessagePackRenderer, msgpack
+
+
+def _decoded_lines(stream, parser_context):
+    encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+    for line in stream:
+        yield line.decode(encoding)
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        body = stream.read() if stream is not None else b''
+        try:
+            if encoding.lower().replace('-', '') != 'utf8':
+                body = body.decode(encoding)
+            # orjson rejects NaN and Infinity, as STRICT_JSON does
+            return orjson.loads(body)
+        except (ValueError, LookupError) as exc:
+            raise ParseError(f"JSON parse error - {exc}")
+
+
+class MessagePackParser(BaseParser):
+    media_type = MSGPACK_MEDIA_TYPE
+    renderer_class = MessagePackRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read() if stream is not None else b'', raw=False)
+        except (ValueError, msgpack.UnpackException) as exc:
+            raise ParseError(f"MessagePack parse error - {exc}")
+
+
+class NDJSONParser(BaseParser):
+    """
+    Newline-delimited JSON: one object per line, blank lines are skipped.
+    Malformed lines are yielded as raw strings so they fail row validation
+    instead of aborting the whole upload.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return self._rows(stream, parser_context)
+
+    def _rows(self, stream, parser_context):
+        for line in _decoded_lines(stream, parser_context):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield orjson.loads(line)
+            except ValueError:
+                yield line
+
+
+class CSVParser(BaseParser):
+    """
+    CSV with a header row. Empty cells are dropped so serializer defaults apply.
+    """
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return self._rows(stream, parser_context)
+
+    def _rows(self, stream, parser_context):
+        for row in csv.DictReader(_decoded_lines(stream, parser_context)):
+            yield {field: value for field, value in row.items() if field and value not in ('', None)}
@@ -0,0 +1,205 @@
+# Database connections
+#
+# Configured in settings from env, next to DATABASE_URL:
+#   - persistent (default): each worker thread keeps its connection for
+#     DATABASE_CONN_MAX_AGE seconds (its max lifetime) instead of connecting
+#     per request, and pings it on the first query of a request
+#     (DATABASE_CONN_HEALTH_CHECKS) so a connection the server dropped is
+#     replaced rather than failing the request. A uWSGI process holds at most
+#     one connection per thread and alias.
+#   - pool (DATABASE_POOL=True, PostgreSQL through psycopg 3 + psycopg_pool):
+#     Django's connection pool, DATABASE_POOL_MIN_SIZE..MAX_SIZE connections per
+#     process, checked on checkout and recycled after DATABASE_CONN_MAX_AGE.
+#
+# The api.db_backends engines are the stock backends plus ConnectionStatsMixin,
+# which tracks this process's connections: open/in use/idle, opens, checkouts
+# reusing an open connection, failed health checks, and the wait for a
+# connection (connect time, or time queued for the pool). GET
+# /api/stats/database/ reports them with the server's max_connections, for
+# sizing UWSGI_PROCESSES; the wait and open counts are also Prometheus metrics.
+
+import logging
+import threading
+import time
+import weakref
+from collections import Counter, defaultdict
+
+from django.db import DatabaseError, connections
+
+from .metrics import DB_CONNECTION_WAIT, DB_CONNECTIONS
+
+logger = logging.getLogger(__name__)
+
+
+def connection_mode(settings_dict):
+    if settings_dict.get('OPTIONS', {}).get('pool'):
+        return 'pool'
+    return 'per_request' if settings_dict.get('CONN_MAX_AGE') == 0 else 'persistent'
+
+
+class ConnectionStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(Counter)
+        self._max_wait = defaultdict(float)
+        # Wrapper -> [alias, opened_at, in_use]; a wrapper dropped with its thread
+        # takes its (then closed) connection out of the counts.
+        self._open = weakref.WeakKeyDictionary()
+
+    def opened(self, wrapper, wait):
+        alias = wrapper.alias
+        with self._lock:
+            self._open[wrapper] = [alias, time.monotonic(), False]
+            self._counters[alias]['opened'] += 1
+            self._counters[alias]['wait'] += wait
+            self._max_wait[alias] = max(self._max_wait[alias], wait)
+        DB_CONNECTION_WAIT.labels(alias).observe(wait)
+        DB_CONNECTIONS.labels(alias, 'idle').inc()
+
+    def checked_out(self, wrapper, reused):
+        with self._lock:
+            entry = self._open.get(wrapper)
+            if entry is None or entry[2]:
+                return
+            entry[2] = True
+            self._counters[wrapper.alias]['checkouts'] += 1
+            self._counters[wrapper.alias]['reused'] += reused
+        DB_CONNECTIONS.labels(wrapper.alias, 'idle').dec()
+        DB_CONNECTIONS.labels(wrapper.alias, 'in_use').inc()
+
+    def released(self, wrapper):
+        with self._lock:
+            entry = self._open.get(wrapper)
+            if entry is None or not entry[2]:
+                return
+            entry[2] = False
+        DB_CONNECTIONS.labels(wrapper.alias, 'in_use').dec()
+        DB_CONNECTIONS.labels(wrapper.alias, 'idle').inc()
+
+    def closed(self, wrapper):
+        with self._lock:
+            entry = self._open.pop(wrapper, None)
+            if entry is None:
+                return
+            self._counters[wrapper.alias]['closed'] += 1
+        DB_CONNECTIONS.labels(wrapper.alias, 'in_use' if entry[2] else 'idle').dec()
+
+    def health_check_failed(self, wrapper):
+        logger.warning(f"Dropped a broken connection to database {wrapper.alias}")
+        with self._lock:
+            self._counters[wrapper.alias]['health_check_failures'] += 1
+
+    def snapshot(self):
+        """Per alias: settings, current connections and counters of this process."""
+        now = time.monotonic()
+        with self._lock:
+            entries = list(self._open.values())
+            counters = {alias: Counter(values) for alias, values in self._counters.items()}
+            max_wait = dict(self._max_wait)
+
+        result = {}
+        for alias in connections:
+            settings_dict = connections.settings[alias]
+            counter = counters.get(alias, Counter())
+            held = [entry for entry in entries if entry[0] == alias]
+            in_use = sum(1 for entry in held if entry[2])
+            result[alias] = {
+                'mode': connection_mode(settings_dict),
+                'max_age': settings_dict.get('CONN_MAX_AGE'),
+                'health_checks': settings_dict.get('CONN_HEALTH_CHECKS'),
+                'open': len(held),
+                'in_use': in_use,
+                'idle': len(held) - in_use,
+                'oldest_age_seconds': round(now - min(entry[1] for entry in held), 3) if held else None,
+                'opened': counter['opened'],
+                'closed': counter['closed'],
+                'checkouts': counter['checkouts'],
+                'reused': counter['reused'],
+                'health_check_failures': counter['health_check_failures'],
+                'wait_ms': {
+                    'total': round(counter['wait'] * 1000, 3),
+                    'avg': round(counter['wait'] * 1000 / counter['opened'], 3) if counter['opened'] else None,
+                    'max': round(max_wait.get(alias, 0.0) * 1000, 3),
+                },
+            }
+            pool = getattr(type(connections[alias]), '_connection_pools', {}).get(alias)
+            if pool is not None:
+                # psycopg_pool's own view: pool_size, pool_available, requests_waiting, ...
+                result[alias]['pool'] = pool.get_stats()
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._max_wait.clear()
+
+
+connection_stats = ConnectionStats()
+
+
+def server_connection_stats():
+    """max_connections and current connections of each PostgreSQL server, for sizing."""
+    result = {}
+    for alias in connections:
+        if connections[alias].vendor != 'postgresql':
+            continue
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(
+                    "SELECT current_setting('max_connections')::int, "
+                    "current_setting('superuser_reserved_connections')::int, "
+                    "(SELECT count(*) FROM pg_stat_activity WHERE datname = current_database())"
+                )
+                max_connections, reserved, current = cursor.fetchone()
+        except DatabaseError as exc:
+            logger.warning(f"Could not read connection limits of database {alias}: {exc}")
+            result[alias] = None
+            continue
+        result[alias] = {
+            'max_connections': max_connections,
+            'superuser_reserved_connections': reserved,
+            'connections': current,
+        }
+    return result
+
+
+class ConnectionStatsMixin:
+    """DatabaseWrapper mixin feeding connection_stats."""
+
+    _fresh = False
+    _checked_out = False
+
+    def connect(self):
+        started_at = time.perf_counter()
+        super().connect()
+        self._fresh, self._checked_out = True, False
+        connection_stats.opened(self, time.perf_counter() - started_at)
+
+    def _cursor(self, name=None):
+        cursor = super()._cursor(name)
+        if not self._checked_out:
+            # First query since the connection was opened or last released
+            self._checked_out = True
+            connection_stats.checked_out(self, reused=not self._fresh)
+            self._fresh = False
+        return cursor
+
+    def close_if_health_check_failed(self):
+        checking = self.connection is not None and self.health_check_enabled and not self.health_check_done
+        super().close_if_health_check_failed()
+        if checking and self.connection is None:
+            connection_stats.health_check_failed(self)
+
+    def close_if_unusable_or_obsolete(self):
+        # Runs at the start and end of every request
+        super().close_if_unusable_or_obsolete()
+        if self.connection is not None and self._checked_out:
+            self._checked_out = False
+            connection_stats.released(self)
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            self._checked_out = False
+            connection_stats.closed(self)
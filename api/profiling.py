@@ -0,0 +1,216 @@
+# Sampling request profiler
+#
+# Opt-in (REQUEST_PROFILER['ENABLED']); when disabled the middleware removes
+# itself at startup. A request is profiled when it wins the SAMPLE_RATE draw or
+# carries `X-Profile: <HEADER_TOKEN>`. For a profiled request:
+#   - a sampler thread snapshots the request thread's stack every INTERVAL
+#     seconds; each sample is attributed to the innermost matching phase
+#     (sql, cache, serializer, authentication, otherwise view) and kept as a
+#     folded stack for flamegraphs,
+#   - every SQL statement, on any database alias, is traced through an
+#     execute_wrapper, flagging exact duplicates (same database, SQL and params)
+#     and repeated statements (same SQL, N+1).
+# Profiles go to a per-process ring buffer, browsable at /admin/profiles/, and
+# downloadable in the folded format read by flamegraph.pl and speedscope.
+
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+
+from .metrics import execute_wrapper_everywhere
+
+DEFAULT_SETTINGS = {
+    'ENABLED': False,
+    'SAMPLE_RATE': 0.0,
+    'HEADER_TOKEN': None,
+    'INTERVAL': 0.001,
+    'BUFFER_SIZE': 100,
+}
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PHASES = ('authentication', 'view', 'serializer', 'sql', 'cache')
+# Checked innermost frame first, so a query issued by a serializer counts as sql
+PHASE_MODULES = (
+    ('sql', ('django.db.backends.',)),
+    ('cache', ('django.core.cache.', 'django_redis.')),
+    ('serializer', ('rest_framework.serializers', 'rest_framework.fields', 'rest_framework.relations',
+                    'api.serializers')),
+    ('authentication', ('rest_framework.authentication', 'rest_framework_simplejwt.')),
+)
+
+
+def get_profiler_setting(name):
+    return getattr(settings, 'REQUEST_PROFILER', {}).get(name, DEFAULT_SETTINGS[name])
+
+
+def frame_phase(module):
+    for phase, prefixes in PHASE_MODULES:
+        if module.startswith(prefixes):
+            return phase
+    return None
+
+
+class ProfileBuffer:
+    """Most recent profiles of this process, newest first."""
+
+    def __init__(self):
+        self._profiles = deque(maxlen=DEFAULT_SETTINGS['BUFFER_SIZE'])
+        self._lock = threading.Lock()
+
+    def add(self, profile):
+        with self._lock:
+            if self._profiles.maxlen != get_profiler_setting('BUFFER_SIZE'):
+                self._profiles = deque(self._profiles, maxlen=get_profiler_setting('BUFFER_SIZE'))
+            self._profiles.appendleft(profile)
+
+    def all(self):
+        with self._lock:
+            return list(self._profiles)
+
+    def get(self, profile_id):
+        return next((profile for profile in self.all() if profile['id'] == profile_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+
+
+profile_buffer = ProfileBuffer()
+
+
+def folded_stacks(profiles):
+    """Lines of 'frame;frame;frame count', merged across `profiles`."""
+    stacks = Counter()
+    for profile in profiles:
+        stacks.update(profile['stacks'])
+    return [f"{stack} {count}" for stack, count in sorted(stacks.items())]
+
+
+class StackSampler(threading.Thread):
+    def __init__(self, thread_id, root_code, interval):
+        super().__init__(daemon=True, name='request-profiler')
+        self.thread_id = thread_id
+        self.root_code = root_code
+        self.interval = interval
+        self.stacks = Counter()
+        self.phases = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self._record(frame)
+
+    def _record(self, frame):
+        names, phase = [], None
+        while frame is not None and frame.f_code is not self.root_code:
+            module = frame.f_globals.get('__name__', '?')
+            phase = phase or frame_phase(module)
+            names.append(f"{module}:{frame.f_code.co_qualname}")
+            frame = frame.f_back
+        self.phases[phase or 'view'] += 1
+        self.stacks[';'.join(reversed(names))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+class QueryTrace:
+    """execute_wrapper keeping every statement of the request."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'database': context['connection'].alias,
+                'sql': sql,
+                'params': repr(params),
+                'duration_ms': round((time.perf_counter() - started_at) * 1000, 3),
+            })
+
+    def summary(self):
+        # The same statement on several shards (a scatter) is not a duplicate
+        exact = Counter((query['database'], query['sql'], query['params']) for query in self.queries)
+        similar = Counter(query['sql'] for query in self.queries)
+        for query in self.queries:
+            query['duplicate'] = exact[(query['database'], query['sql'], query['params'])] > 1
+            query['repeated'] = similar[query['sql']]
+        return {
+            'queries': self.queries,
+            'duplicate_queries': sum(count - 1 for count in exact.values()),
+            'repeated_statements': sum(1 for count in similar.values() if count > 1),
+        }
+
+
+class RequestProfilerMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not get_profiler_setting('ENABLED'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def should_profile(self, request):
+        token = get_profiler_setting('HEADER_TOKEN')
+        if token and request.META.get(PROFILE_HEADER) == token:
+            return True
+        return random.random() < get_profiler_setting('SAMPLE_RATE')
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            # Async views hop between threads, which a per-thread sampler cannot follow
+            return self.get_response(request)
+        if not self.should_profile(request):
+            return self.get_response(request)
+        return self.profile(request)
+
+    def profile(self, request):
+        sampler = StackSampler(threading.get_ident(), self.profile.__code__, get_profiler_setting('INTERVAL'))
+        trace = QueryTrace()
+        started_at, start = timezone.now(), time.perf_counter()
+        sampler.start()
+        try:
+            with execute_wrapper_everywhere(trace):
+                response = self.get_response(request)
+        finally:
+            sampler.stop()
+        duration = time.perf_counter() - start
+
+        samples = sum(sampler.phases.values())
+        match = getattr(request, 'resolver_match', None)
+        root = f"{request.method} {match.route if match else request.path}"
+        profile_buffer.add({
+            'id': uuid.uuid4().hex,
+            'started_at': started_at,
+            'method': request.method,
+            'path': request.path,
+            'route': match.route if match else None,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 3),
+            'samples': samples,
+            # Wall time split in proportion to the samples of each phase
+            'phases_ms': {
+                phase: round(duration * 1000 * sampler.phases[phase] / samples, 3) if samples else None
+                for phase in PHASES
+            },
+            'stacks': {f"{root};{stack}" if stack else root: count for stack, count in sampler.stacks.items()},
+            **trace.summary(),
+        })
+        return response
@@ -0,0 +1,218 @@
+# Bulk provisioning
+#
+# Set-based counterpart to ProvisionLicenseView: rows are validated and resolved
+# a chunk at a time with a handful of queries per chunk, and licenses are written
+# with a single conflict-aware upsert. The brand/key rules are the same as the
+# single-item view:
+#   - an explicit license_key must belong to the row's brand (409 otherwise),
+#   - without a key, the customer's existing key for the brand is reused,
+#   - re-provisioning a (key, product) pair renews it and re-validates it.
+
+import logging
+from datetime import timedelta
+from itertools import islice
+
+from django.db import router, transaction
+from django.utils import timezone
+
+from .cache import license_status_cache
+from .key_filter import license_key_filter
+from .models import Brand, Product, LicenseKey, License
+from .serializers import ProvisionLicenseSerializer
+from .sharding import group_by_shard, scatter, shard_for_key, use_shard
+from .verdicts import refresh_verdicts
+
+logger = logging.getLogger(__name__)
+
+
+class BulkProvisioner:
+    CHUNK_SIZE = 1000
+
+    def __init__(self, chunk_size=None, brand_slug=None):
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        # Rows for any other brand are rejected (a brand's service token)
+        self.brand_slug = brand_slug
+        # Reference data is small and stable, so it is cached across chunks
+        self._brands = {}
+        self._products = {}
+
+    def provision(self, rows):
+        """
+        Provisions every row of the (possibly lazy) iterable.
+        Returns a summary with one result per row, in input order.
+        """
+        summary = {'created': 0, 'updated': 0, 'failed': 0, 'results': []}
+        rows = enumerate(rows)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            with transaction.atomic():
+                results = self._provision_chunk(chunk)
+            for result in results:
+                summary['failed' if result['status'] == 'error' else result['status']] += 1
+            summary['results'].extend(results)
+
+        logger.info(
+            f"Bulk provisioning finished: {summary['created']} created, "
+            f"{summary['updated']} updated, {summary['failed']} failed"
+        )
+        return summary
+
+    def _provision_chunk(self, chunk):
+        results = {}
+        valid = []
+        for index, row in chunk:
+            serializer = ProvisionLicenseSerializer(data=row)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index] = self._error(index, 'invalid', serializer.errors)
+
+        self._load_reference_data(valid)
+        resolved = []
+        for index, data in valid:
+            brand = self._brands.get(data['brand_slug'])
+            product = self._products.get((data['brand_slug'], data['product_slug']))
+            if self.brand_slug and data['brand_slug'] != self.brand_slug:
+                results[index] = self._error(index, 'forbidden', f"Not allowed for brand '{data['brand_slug']}'.")
+            elif not brand:
+                results[index] = self._error(index, 'not_found', "Brand not found.")
+            elif not product:
+                results[index] = self._error(index, 'not_found', "Product not found.")
+            else:
+                resolved.append((index, data, brand, product))
+
+        keys = self._resolve_license_keys(resolved, results)
+
+        # Last row wins for a repeated (key, product) pair, like sequential single calls would
+        licenses = {}
+        for index, data, brand, product in resolved:
+            if index in results:
+                continue
+            lk = keys[index]
+            licenses.setdefault(shard_for_key(lk.key), {})[(lk.id, product.id)] = License(
+                license_key=lk,
+                product=product,
+                expires_at=timezone.now() + timedelta(days=data['expiration_days']),
+                total_seats=data['total_seats'],
+                status='VALID'  # Re-validate if it was suspended
+            )
+
+        existing = set()
+        for shard, shard_licenses in licenses.items():
+            # Ids are only unique within a shard; each shard commits on its own
+            with use_shard(shard), transaction.atomic(using=router.db_for_write(License), savepoint=False):
+                existing.update(
+                    (shard, *pair) for pair in License.objects.filter(
+                        license_key_id__in={pair[0] for pair in shard_licenses},
+                        product_id__in={pair[1] for pair in shard_licenses}
+                    ).values_list('license_key_id', 'product_id')
+                )
+
+                # Bulk writes bypass the model signals, so invalidate status caches explicitly
+                shard_keys = {license_obj.license_key.key for license_obj in shard_licenses.values()}
+                license_status_cache.invalidate(shard_keys)
+                refresh_verdicts(shard_keys)
+                License.objects.bulk_create(
+                    shard_licenses.values(),
+                    update_conflicts=True,
+                    unique_fields=['license_key', 'product'],
+                    update_fields=['expires_at', 'total_seats', 'status', 'updated_at']
+                )
+
+        seen = set()
+        for index, data, brand, product in resolved:
+            if index in results:
+                continue
+            pair = (shard_for_key(keys[index].key), keys[index].id, product.id)
+            created = pair not in existing and pair not in seen
+            seen.add(pair)
+            results[index] = {
+                'row': index,
+                'status': 'created' if created else 'updated',
+                'license_key': keys[index].key,
+                'product_slug': product.slug,
+            }
+
+        return [results[index] for index, _ in chunk]
+
+    def _load_reference_data(self, valid):
+        brand_slugs = {data['brand_slug'] for _, data in valid} - set(self._brands)
+        if brand_slugs:
+            for brand in Brand.objects.filter(slug__in=brand_slugs):
+                self._brands[brand.slug] = brand
+
+        product_pairs = {
+            (data['brand_slug'], data['product_slug']) for _, data in valid
+        } - set(self._products)
+        if product_pairs:
+            products = Product.objects.filter(
+                brand__slug__in={pair[0] for pair in product_pairs},
+                slug__in={pair[1] for pair in product_pairs}
+            ).select_related('brand')
+            for product in products:
+                self._products[(product.brand.slug, product.slug)] = product
+
+    def _resolve_license_keys(self, resolved, results):
+        """Maps row index -> LicenseKey, creating missing keys in bulk. Records brand conflicts in `results`."""
+        explicit = {data['license_key'] for _, data, _, _ in resolved if data.get('license_key')}
+        implicit = {
+            (data['customer_email'], brand.id) for _, data, brand, _ in resolved if not data.get('license_key')
+        }
+
+        by_key = {}
+        for shard, shard_keys in group_by_shard(explicit).items():
+            by_key.update((lk.key, lk) for lk in LicenseKey.objects.using(shard).filter(key__in=shard_keys))
+        by_customer = {}
+        if implicit:
+            candidates = scatter(LicenseKey.objects.filter(
+                customer_email__in={pair[0] for pair in implicit},
+                brand_id__in={pair[1] for pair in implicit}
+            ).order_by('pk'))
+            for lk in candidates:
+                by_customer.setdefault((lk.customer_email, lk.brand_id), lk)
+
+        new_keys = {}
+        for _, data, brand, _ in resolved:
+            key_str = data.get('license_key')
+            if key_str and key_str not in by_key:
+                new_keys.setdefault(key_str, LicenseKey(key=key_str, customer_email=data['customer_email'], brand=brand))
+            elif not key_str and (data['customer_email'], brand.id) not in by_customer:
+                by_customer[(data['customer_email'], brand.id)] = new_keys.setdefault(
+                    (data['customer_email'], brand.id),
+                    LicenseKey(customer_email=data['customer_email'], brand=brand)
+                )
+
+        if new_keys:
+            # ignore_conflicts tolerates keys created concurrently; re-read them to get ids and owners
+            by_shard = {}
+            for new in new_keys.values():
+                by_shard.setdefault(shard_for_key(new.key), []).append(new)
+            created = {}
+            for shard, shard_new_keys in by_shard.items():
+                with use_shard(shard):
+                    LicenseKey.objects.bulk_create(shard_new_keys, ignore_conflicts=True)
+                    created.update(
+                        (lk.key, lk) for lk in LicenseKey.objects.filter(key__in=[str(new.key) for new in shard_new_keys])
+                    )
+            by_key.update(created)
+            license_key_filter.record_created(created)
+            for customer, lk in by_customer.items():
+                if lk.pk is None:
+                    by_customer[customer] = created[str(lk.key)]
+
+        keys = {}
+        for index, data, brand, _ in resolved:
+            key_str = data.get('license_key')
+            lk = by_key[key_str] if key_str else by_customer[(data['customer_email'], brand.id)]
+            if lk.brand_id != brand.id:
+                logger.warning(f"Key conflict: {key_str} belongs to brand {lk.brand_id}, not {brand.slug}")
+                results[index] = self._error(
+                    index, 'conflict', f"License key '{key_str}' is already assigned to another brand."
+                )
+            keys[index] = lk
+        return keys
+
+    def _error(self, index, code, detail):
+        return {'row': index, 'status': 'error', 'code': code, 'error': detail}
@@ -0,0 +1,60 @@
+# Fast renderers
+#
+# ORJSONRenderer replaces DRF's JSONRenderer (REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES']):
+# the same bytes for our payloads, produced by orjson instead of json.dumps. Types
+# orjson does not know (Decimal, lazy strings, querysets, ...) go through DRF's
+# JSONEncoder, and datetimes are written like DRF does (isoformat, 'Z' for UTC).
+# Pretty-printed output (?format=json with `indent`, the browsable API) is left
+# to JSONRenderer.
+#
+# MessagePackRenderer serves 'application/msgpack' to clients asking for it in
+# Accept, for brand integrations that prefer a binary format. It is installed
+# only when the optional msgpack package is; values msgpack has no type for are
+# encoded as in JSON, so both formats carry the same data.
+#
+# The matching parsers live in api/parsers.py; `manage.py benchmark_renderers`
+# compares them on license status payloads.
+
+import orjson
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import msgpack
+except ImportError:  # Optional: only needed for the MessagePack content type
+    msgpack = None
+
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+MSGPACK_MEDIA_TYPE = 'application/msgpack'
+
+_default = JSONEncoder().default
+
+
+class ORJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits, which json.dumps still handles
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.ensure_ascii and not ret.isascii():
+            return super().render(data, accepted_media_type, renderer_context)
+        # Like JSONRenderer, keep the output a strict JavaScript subset
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = MSGPACK_MEDIA_TYPE
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # Datetimes as strings too: msgpack's timestamp extension is not understood by most clients
+        return msgpack.packb(data, default=_default, use_bin_type=True)
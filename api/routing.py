@@ -0,0 +1,192 @@
+# Read replicas
+#
+# Replicas are configured with DATABASE_REPLICA_URLS and become the aliases in
+# READ_REPLICAS['ALIASES']. ReplicaRouter only sends a read to a replica while a
+# view using ReplicaReadMixin handles a safe request; everything else (writes,
+# transactions, management commands, other views) stays on `default`.
+#
+# Read-your-writes: a client is pinned to the primary for STICKY_SECONDS
+#   - after any successful write it makes (PrimaryPinningMiddleware; the client
+#     is the authenticated user, or the client IP for public endpoints), and
+#   - for a license key whenever its status cache entry is invalidated, so a
+#     lagging replica cannot put a pre-write status back into the cache.
+# Pins live in the shared cache, so they hold across workers.
+#
+# Each replica's lag is measured at most every LAG_CHECK_INTERVAL seconds per
+# process; replicas more than MAX_LAG seconds behind, or unreachable, are
+# skipped until the next check. With no usable replica, reads go to the primary.
+
+import contextvars
+import logging
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'ALIASES': [],
+    'STICKY_SECONDS': 15,
+    'MAX_LAG': 5,
+    'LAG_CHECK_INTERVAL': 5,
+}
+POSTGRES_LAG_SQL = (
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+# Database chosen for the reads of the current request, if not the primary
+_read_database = contextvars.ContextVar('read_database', default=None)
+
+
+def get_replica_setting(name):
+    return getattr(settings, 'READ_REPLICAS', {}).get(name, DEFAULT_SETTINGS[name])
+
+
+def current_read_database():
+    return _read_database.get()
+
+
+class ReplicaLagMonitor:
+    def __init__(self):
+        self._lags = {}
+        self._lock = threading.Lock()
+
+    def measure(self, alias):
+        """Seconds the replica is behind; None when it cannot be reached."""
+        try:
+            with connections[alias].cursor() as cursor:
+                if connections[alias].vendor != 'postgresql':
+                    return 0.0
+                cursor.execute(POSTGRES_LAG_SQL)
+                return float(cursor.fetchone()[0])
+        except DatabaseError as exc:
+            logger.warning(f"Replica {alias} is unavailable: {exc}")
+            return None
+
+    def lag(self, alias):
+        now = time.monotonic()
+        checked_at, lag = self._lags.get(alias, (None, None))
+        if checked_at is None or now - checked_at > get_replica_setting('LAG_CHECK_INTERVAL'):
+            with self._lock:
+                checked_at, lag = self._lags.get(alias, (None, None))
+                if checked_at is None or now - checked_at > get_replica_setting('LAG_CHECK_INTERVAL'):
+                    lag = self.measure(alias)
+                    self._lags[alias] = (now, lag)
+        return lag
+
+    def usable(self):
+        max_lag = get_replica_setting('MAX_LAG')
+        return [
+            alias for alias in get_replica_setting('ALIASES')
+            if (lag := self.lag(alias)) is not None and lag <= max_lag
+        ]
+
+    def reset(self):
+        with self._lock:
+            self._lags.clear()
+
+
+replica_lag_monitor = ReplicaLagMonitor()
+
+
+def pin_key(identity):
+    return f"db_pin_{identity}"
+
+
+def pin_to_primary(identities):
+    """Sends reads for `identities` to the primary for the next STICKY_SECONDS."""
+    if not get_replica_setting('ALIASES'):
+        return
+    cache.set_many({pin_key(identity): True for identity in identities}, get_replica_setting('STICKY_SECONDS'))
+
+
+def client_identity(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f"user_{user.pk}"
+    # Same proxy-aware client address as the throttles
+    return f"ip_{BaseThrottle().get_ident(request)}"
+
+
+def choose_read_database(identities):
+    """A usable replica alias for a read by `identities`, or None for the primary."""
+    if not get_replica_setting('ALIASES'):
+        return None
+    if cache.get_many([pin_key(identity) for identity in identities]):
+        return None
+    usable = replica_lag_monitor.usable()
+    return random.choice(usable) if usable else None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaReadMixin:
+    """
+    For DRF views whose safe requests may be served from a replica. `replica_key_kwarg`
+    names a URL kwarg holding a license key, whose pin is honoured as well.
+    """
+    replica_key_kwarg = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            identities = [client_identity(request)]
+            if self.replica_key_kwarg and self.replica_key_kwarg in kwargs:
+                identities.append(f"license_key_{kwargs[self.replica_key_kwarg]}")
+            self._read_database_token = _read_database.set(choose_read_database(identities))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_read_database_token', None)
+        if token is not None:
+            _read_database.reset(token)
+            self._read_database_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class PrimaryPinningMiddleware:
+    """Pins the client to the primary after each successful write it makes."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS and response.status_code < 400 and get_replica_setting('ALIASES'):
+            pin_to_primary([client_identity(request)])
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if request.method not in SAFE_METHODS and response.status_code < 400 and get_replica_setting('ALIASES'):
+            # The async views are public, so the client is its address; request.user
+            # may need the database, which cannot be touched from here.
+            identity = f"ip_{BaseThrottle().get_ident(request)}"
+            await cache.aset_many({pin_key(identity): True}, get_replica_setting('STICKY_SECONDS'))
+        return response
@@ -2,6 +2,7 @@
 
 from rest_framework import serializers
 from .models import Brand, Product, LicenseKey, License, Activation
+from .signing import issue_license_token
 
 class BrandSerializer(serializers.ModelSerializer):
     class Meta:
@@ -20,17 +21,27 @@ class ActivationSerializer(serializers.ModelSerializer):
 
 class LicenseSerializer(serializers.ModelSerializer):
     product_name = serializers.ReadOnlyField(source='product.name')
+    product_slug = serializers.ReadOnlyField(source='product.slug')
     brand_name = serializers.ReadOnlyField(source='product.brand.name')
     activations = ActivationSerializer(many=True, read_only=True)
-    active_seats = serializers.IntegerField(source='activations.count', read_only=True)
 
     class Meta:
         model = License
         fields = [
-            'id', 'product', 'product_name', 'brand_name', 'status', 
+            'id', 'product', 'product_name', 'product_slug', 'brand_name', 'status', 
             'expires_at', 'total_seats', 'active_seats', 'activations', 'created_at'
         ]
 
+class LicenseActivationSerializer(LicenseSerializer):
+    # Signed entitlement products can verify offline, see api/signing.py
+    offline_token = serializers.SerializerMethodField()
+
+    class Meta(LicenseSerializer.Meta):
+        fields = LicenseSerializer.Meta.fields + ['offline_token']
+
+    def get_offline_token(self, obj) -> str:
+        return issue_license_token(obj, self.context['instance_id'], obj.active_seats)
+
 class LicenseKeySerializer(serializers.ModelSerializer):
     licenses = LicenseSerializer(many=True, read_only=True)
     brand_name = serializers.ReadOnlyField(source='brand.name')
@@ -51,3 +62,40 @@ class ActivateLicenseSerializer(serializers.Serializer):
     license_key = serializers.CharField()
     instance_id = serializers.CharField()
     product_slug = serializers.SlugField()
+
+class BatchLicenseValidationSerializer(serializers.Serializer):
+    # Upper bound keeps a single request within a predictable query/response size
+    MAX_ITEMS = 500
+
+    items = ActivateLicenseSerializer(many=True, allow_empty=False, max_length=MAX_ITEMS)
+
+class LicenseVerdictSerializer(serializers.Serializer):
+    VERDICT_CHOICES = ('valid', 'not_activated', 'inactive', 'not_found')
+
+    license_key = serializers.CharField()
+    product_slug = serializers.SlugField()
+    instance_id = serializers.CharField()
+    verdict = serializers.ChoiceField(choices=VERDICT_CHOICES)
+    status = serializers.CharField(allow_null=True)
+    expires_at = serializers.DateTimeField(allow_null=True)
+    total_seats = serializers.IntegerField(allow_null=True)
+    active_seats = serializers.IntegerField(allow_null=True)
+
+class LicenseVerdictDetailSerializer(LicenseVerdictSerializer):
+    """Payload of the verdict endpoint; instance_id is optional there."""
+    instance_id = serializers.CharField(allow_null=True)
+    seats_remaining = serializers.IntegerField(allow_null=True)
+
+class BulkProvisionResultSerializer(serializers.Serializer):
+    row = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=('created', 'updated', 'error'))
+    license_key = serializers.CharField(required=False)
+    product_slug = serializers.SlugField(required=False)
+    code = serializers.ChoiceField(choices=('invalid', 'forbidden', 'not_found', 'conflict'), required=False)
+    error = serializers.JSONField(required=False)
+
+class BulkProvisionSummarySerializer(serializers.Serializer):
+    created = serializers.IntegerField()
+    updated = serializers.IntegerField()
+    failed = serializers.IntegerField()
+    results = BulkProvisionResultSerializer(many=True)
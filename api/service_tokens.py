@@ -0,0 +1,176 @@
+# Brand service tokens
+#
+# Brand integrations authenticate with long-lived JWTs issued by
+# `manage.py issue_service_token`, signed like the user tokens (SIMPLE_JWT)
+# but with token_type 'brand_service' and two extra claims:
+#   - brand: the slug of the only brand the token may act for,
+#   - scopes: the endpoints it may call, matched against a view's
+#     `service_token_scope` (views without one reject service tokens).
+# ServiceTokenAuthentication trusts the verified claims and never loads a User
+# row. The only state consulted is the revocation list: revoked, unexpired jtis,
+# cached in the shared cache and copied per process for LOCAL_TIMEOUT seconds,
+# so a revocation takes effect everywhere within LOCAL_TIMEOUT seconds with no
+# database query per request.
+#
+# Views limit service tokens to their brand through check_brand_scope() and
+# token_brand(); user JWTs keep their existing, unrestricted access.
+
+import threading
+import time
+from datetime import timedelta
+
+import jwt
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework.exceptions import PermissionDenied
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import Token
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .models import ServiceToken
+
+DEFAULT_SETTINGS = {
+    'LIFETIME': 365 * 86400,
+    'CACHE_TIMEOUT': 300,
+    'LOCAL_TIMEOUT': 5,
+}
+SCOPES = ('licenses:provision', 'licenses:read')
+REVOCATIONS_CACHE_KEY = 'service_token_revocations'
+
+
+def get_service_token_setting(name):
+    return getattr(settings, 'SERVICE_TOKENS', {}).get(name, DEFAULT_SETTINGS[name])
+
+
+class BrandServiceToken(Token):
+    token_type = 'brand_service'
+    lifetime = timedelta(seconds=DEFAULT_SETTINGS['LIFETIME'])
+
+
+def issue_service_token(brand, scopes, name, lifetime=None):
+    """Records and returns a new (ServiceToken, encoded token) for `brand`."""
+    unknown = set(scopes) - set(SCOPES)
+    if unknown:
+        raise ValueError(f"Unknown scope(s): {', '.join(sorted(unknown))}")
+    token = BrandServiceToken()
+    token.set_exp(lifetime=timedelta(seconds=lifetime or get_service_token_setting('LIFETIME')))
+    token['brand'] = brand.slug
+    token['scopes'] = sorted(scopes)
+    token['name'] = name
+    record = ServiceToken.objects.create(
+        jti=token[api_settings.JTI_CLAIM], brand=brand, name=name, scopes=token['scopes'],
+        expires_at=datetime_from_epoch(token['exp']),
+    )
+    return record, str(token)
+
+
+class RevocationList:
+    def __init__(self):
+        self._revoked = frozenset()
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        revoked = cache.get(REVOCATIONS_CACHE_KEY)
+        if revoked is None:
+            # Expired tokens fail verification anyway, so they drop off the list
+            revoked = list(
+                ServiceToken.objects.filter(revoked_at__isnull=False, expires_at__gt=timezone.now())
+                .values_list('jti', flat=True)
+            )
+            cache.set(REVOCATIONS_CACHE_KEY, revoked, get_service_token_setting('CACHE_TIMEOUT'))
+        return frozenset(revoked)
+
+    def is_revoked(self, jti):
+        now = time.monotonic()
+        if self._loaded_at is None or now - self._loaded_at > get_service_token_setting('LOCAL_TIMEOUT'):
+            with self._lock:
+                if self._loaded_at is None or now - self._loaded_at > get_service_token_setting('LOCAL_TIMEOUT'):
+                    self._revoked = self._load()
+                    self._loaded_at = now
+        return jti in self._revoked
+
+    def revoke(self, tokens):
+        """Revokes the ServiceToken rows of `tokens`; returns how many were still active."""
+        revoked = tokens.filter(revoked_at__isnull=True).update(revoked_at=timezone.now())
+        cache.delete(REVOCATIONS_CACHE_KEY)
+        self.clear_local()
+        return revoked
+
+    def clear_local(self):
+        with self._lock:
+            self._loaded_at = None
+
+
+revoked_service_tokens = RevocationList()
+
+
+class ServiceTokenUser(TokenUser):
+    """request.user for a service token, built from its claims alone."""
+
+    def __str__(self):
+        return f"service token '{self.token.get('name', '')}' of brand {self.brand_slug}"
+
+    @cached_property
+    def id(self):
+        return f"service-{self.token[api_settings.JTI_CLAIM]}"
+
+    @cached_property
+    def brand_slug(self):
+        return self.token['brand']
+
+    @cached_property
+    def scopes(self):
+        return frozenset(self.token.get('scopes', ()))
+
+
+def is_service_token(raw_token):
+    try:
+        claims = jwt.decode(raw_token, options={'verify_signature': False})
+    except jwt.InvalidTokenError:
+        return False
+    return claims.get(api_settings.TOKEN_TYPE_CLAIM) == BrandServiceToken.token_type
+
+
+class ServiceTokenAuthentication(JWTAuthentication):
+    """
+    Authenticates brand service tokens without a database query; other bearer
+    tokens are left to the next authentication class.
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None or not is_service_token(raw_token):
+            return None
+
+        try:
+            token = BrandServiceToken(raw_token)
+        except TokenError as exc:
+            raise InvalidToken(exc.args[0])
+        if revoked_service_tokens.is_revoked(token[api_settings.JTI_CLAIM]):
+            raise AuthenticationFailed("Token has been revoked.", code='token_revoked')
+
+        view = request.parser_context.get('view') if request.parser_context else None
+        scope = getattr(view, 'service_token_scope', None)
+        if scope is None or scope not in token.get('scopes', ()):
+            raise PermissionDenied("This service token is not allowed to use this endpoint.")
+        return ServiceTokenUser(token), token
+
+
+def token_brand(request):
+    """Slug of the brand a service token is limited to; None for users."""
+    return getattr(request.user, 'brand_slug', None)
+
+
+def check_brand_scope(request, brand_slug):
+    brand = token_brand(request)
+    if brand is not None and brand != brand_slug:
+        raise PermissionDenied(f"This service token can only act for brand '{brand}'.")
@@ -0,0 +1,217 @@
+# Hash-sharded license storage
+#
+# With DATABASE_SHARD_URLS set, LicenseKey, License and Activation rows live on
+# one of SHARDING['ALIASES'] (`default` first, then `shard_1`...): the shard of
+# a key is fixed by a hash of LicenseKey.key, and a key's licenses and
+# activations sit next to it. Brand and Product are reference data: written to
+# `default` and copied, with the same primary keys, to every other shard by the
+# signals in api/signals.py, so foreign keys and joins stay shard-local. Users,
+# service tokens and the other apps only live on `default`.
+#
+# ShardRouter sends queries on sharded models to
+#   - the shard of the instance they concern (related managers, saves; a new
+#     LicenseKey goes to the shard of its key, and a new license or activation
+#     to the shard of its parent: the sharded models' create() leaves the
+#     choice to save(), as QuerySet.create() picks one before the instance exists), else
+#   - the shard selected for the current request or job with use_shard() or
+#     use_shard_of(license_key), which is how ActivateLicenseView,
+#     LicenseStatusView and the other per-key paths touch exactly one shard.
+# Without either, they fall through to the next router (and `default`).
+#
+# Paths that are not about one key fan out: scatter() runs a queryset on every
+# shard and concatenates the results (customer lookup, the key filter), and
+# each_shard() runs a job once per shard (expiry, seat reclamation, exports).
+# There are no cross-shard transactions; each shard commits on its own.
+#
+# Changing the shard list moves most keys. `manage.py reshard` copies reference
+# data to new shards and moves every key (with its licenses and activations) to
+# the shard it now hashes to. A key cannot be found until it has been moved, so
+# reshard in a maintenance window.
+
+import contextvars
+import hashlib
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+DEFAULT_SETTINGS = {
+    'ALIASES': [],
+}
+SHARDED_MODELS = {'licensekey', 'license', 'activation'}
+REFERENCE_MODELS = {'brand', 'product'}
+
+# Shard selected for the queries of the current request or job
+_current_shard = contextvars.ContextVar('current_shard', default=None)
+
+
+def get_shard_setting(name):
+    return getattr(settings, 'SHARDING', {}).get(name, DEFAULT_SETTINGS[name])
+
+
+def shard_aliases():
+    return list(get_shard_setting('ALIASES'))
+
+
+def shard_for_key(license_key, aliases=None):
+    """Alias of the shard holding `license_key`; None when sharding is off."""
+    aliases = shard_aliases() if aliases is None else aliases
+    if not aliases:
+        return None
+    digest = hashlib.blake2b(str(license_key).encode(), digest_size=8).digest()
+    return aliases[int.from_bytes(digest, 'little') % len(aliases)]
+
+
+def current_shard():
+    return _current_shard.get()
+
+
+@contextmanager
+def use_shard(alias):
+    """Routes sharded queries without an instance to `alias` (None: no shard) within the block."""
+    token = _current_shard.set(alias)
+    try:
+        yield alias
+    finally:
+        _current_shard.reset(token)
+
+
+def use_shard_of(license_key):
+    return use_shard(shard_for_key(license_key))
+
+
+def shard_databases():
+    """Every shard alias for QuerySet.using(); [None] (the routers' choice) when sharding is off."""
+    return shard_aliases() or [None]
+
+
+def each_shard():
+    """Yields every shard alias (None when sharding is off), selected with use_shard()."""
+    for alias in shard_databases():
+        with use_shard(alias):
+            yield alias
+
+
+def group_by_shard(license_keys):
+    """{shard alias: [keys]} for `license_keys`; a single None group when sharding is off."""
+    groups = {}
+    for license_key in license_keys:
+        groups.setdefault(shard_for_key(license_key), []).append(license_key)
+    return groups
+
+
+def scatter(queryset):
+    """Evaluates `queryset` on every shard and returns the concatenated results."""
+    aliases = shard_aliases()
+    if not aliases or not is_sharded(queryset.model):
+        return list(queryset)
+    results = []
+    for alias in aliases:
+        with use_shard(alias):
+            results.extend(queryset.using(alias))
+    return results
+
+
+def is_sharded(model):
+    return model._meta.app_label == 'api' and model._meta.model_name in SHARDED_MODELS
+
+
+def is_reference(model):
+    return model._meta.app_label == 'api' and model._meta.model_name in REFERENCE_MODELS
+
+
+def replicate_reference_row(instance):
+    """Copies a Brand or Product row saved on `default` to every other shard."""
+    model = type(instance)
+    values = {field.attname: getattr(instance, field.attname) for field in model._meta.concrete_fields}
+    for alias in shard_aliases():
+        if alias != DEFAULT_DB_ALIAS:
+            # raw: stored as is (created_at included), like loaddata
+            model(**values).save_base(using=alias, raw=True)
+
+
+def delete_reference_row(instance):
+    """Deletes a Brand or Product row, and what cascades from it, on every other shard."""
+    model = type(instance)
+    for alias in shard_aliases():
+        if alias == DEFAULT_DB_ALIAS:
+            continue
+        with use_shard(alias):
+            for relation in model._meta.related_objects:
+                if is_sharded(relation.related_model) or is_reference(relation.related_model):
+                    relation.related_model.objects.using(alias).filter(**{relation.field.name: instance.pk}).delete()
+            # Not QuerySet.delete(): its collector would look for the rows that only live on `default`
+            connection = connections[alias]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {connection.ops.quote_name(model._meta.db_table)} "
+                    f"WHERE {connection.ops.quote_name(model._meta.pk.column)} = %s",
+                    [instance.pk]
+                )
+
+
+class ShardKeyMixin:
+    """
+    For DRF views about a single license key: their queries go to its shard. The
+    key is the `shard_key_kwarg` URL kwarg, or the `shard_key_field` of the body.
+    """
+    shard_key_kwarg = None
+    shard_key_field = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if not shard_aliases():
+            return
+        license_key = kwargs.get(self.shard_key_kwarg) if self.shard_key_kwarg else None
+        if license_key is None and self.shard_key_field and isinstance(request.data, dict):
+            license_key = request.data.get(self.shard_key_field)
+        if isinstance(license_key, str):
+            self._shard_token = _current_shard.set(shard_for_key(license_key))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_shard_token', None)
+        if token is not None:
+            _current_shard.reset(token)
+            self._shard_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ShardRouter:
+    def _shard(self, model, hints):
+        instance = hints.get('instance')
+        if instance is not None and is_sharded(type(instance)):
+            # Before `_state.db`, which assigning a brand sets to `default` on a new key
+            if instance._meta.model_name == 'licensekey' and instance._state.adding:
+                return shard_for_key(instance.key)
+            if instance._state.db in shard_aliases():
+                return instance._state.db
+        return _current_shard.get()
+
+    def db_for_read(self, model, **hints):
+        if not shard_aliases():
+            return None
+        if is_sharded(model):
+            return self._shard(model, hints)
+        if is_reference(model):
+            # Every shard holds a copy
+            return _current_shard.get()
+        return None
+
+    def db_for_write(self, model, **hints):
+        if not shard_aliases():
+            return None
+        if is_sharded(model):
+            return self._shard(model, hints)
+        if is_reference(model):
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if shard_aliases() and is_sharded(type(obj1)) and is_sharded(type(obj2)):
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == DEFAULT_DB_ALIAS or db not in shard_aliases():
+            return None
+        return app_label == 'api' and model_name in SHARDED_MODELS | REFERENCE_MODELS
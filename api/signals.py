@@ -0,0 +1,91 @@
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import license_status_cache
+from .key_filter import license_key_filter
+from .models import Activation, Brand, License, LicenseKey, Product
+from .sharding import delete_reference_row, each_shard, replicate_reference_row, shard_aliases
+from .verdicts import refresh_verdicts
+
+
+def license_keys_for_license(license_id, license_obj=None, using=None):
+    """Key string(s) owning a license, without a query when the relation is already loaded."""
+    if license_obj is not None and License.license_key.is_cached(license_obj):
+        return [license_obj.license_key.key]
+    # The license may already be gone when this runs for a cascaded delete
+    return list(LicenseKey.objects.using(using).filter(licenses__id=license_id).values_list('key', flat=True))
+
+
+@receiver(post_delete, sender=Activation)
+def release_seat(sender, instance, using, **kwargs):
+    # Keeps License.active_seats in step with deletes from the admin or querysets.
+    # A no-op when the license itself is being deleted (cascade).
+    License.objects.using(using).filter(pk=instance.license_id, active_seats__gt=0).update(
+        active_seats=F('active_seats') - 1
+    )
+
+
+@receiver(post_save, sender=LicenseKey)
+@receiver(post_delete, sender=LicenseKey)
+def invalidate_license_key_status(sender, instance, using, **kwargs):
+    # The write may not have selected the key's shard (the admin, scripts): its commit is on `using`
+    license_status_cache.invalidate([instance.key], using)
+
+
+@receiver(post_save, sender=LicenseKey)
+def register_license_key(sender, instance, created, **kwargs):
+    if created:
+        license_key_filter.record_created([instance.key])
+
+
+@receiver(post_save, sender=License)
+@receiver(post_delete, sender=License)
+def invalidate_license_status(sender, instance, using, **kwargs):
+    keys = license_keys_for_license(instance.pk, instance, using)
+    license_status_cache.invalidate(keys, using)
+    refresh_verdicts(keys, using=using)
+
+
+@receiver(post_save, sender=Activation)
+@receiver(post_delete, sender=Activation)
+def invalidate_activation_status(sender, instance, using, **kwargs):
+    license_obj = instance.license if Activation.license.is_cached(instance) else None
+    keys = license_keys_for_license(instance.license_id, license_obj, using)
+    license_status_cache.invalidate(keys, using)
+    refresh_verdicts(keys, [instance.instance_id], using)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Brand)
+def invalidate_renamed_reference_data(sender, instance, created, using, **kwargs):
+    # Status payloads embed product and brand names
+    if created or (using != DEFAULT_DB_ALIAS and using in shard_aliases()):
+        return
+    batch = []
+    for _ in each_shard():
+        keys = LicenseKey.objects.filter(
+            **({'licenses__product': instance} if sender is Product else {'brand': instance})
+        ).values_list('key', flat=True).distinct()
+        for key in keys.iterator(chunk_size=1000):
+            batch.append(key)
+            if len(batch) >= 1000:
+                license_status_cache.invalidate(batch)
+                batch = []
+    license_status_cache.invalidate(batch)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Brand)
+def replicate_reference_data(sender, instance, using, **kwargs):
+    # Every shard holds a copy of the brands and products (see api/sharding.py)
+    if shard_aliases() and using == DEFAULT_DB_ALIAS:
+        replicate_reference_row(instance)
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Brand)
+def delete_replicated_reference_data(sender, instance, using, **kwargs):
+    if shard_aliases() and using == DEFAULT_DB_ALIAS:
+        delete_reference_row(instance)
@@ -0,0 +1,141 @@
+# Offline license tokens
+#
+# After a successful activation the product receives a compact EdDSA-signed JWT
+# describing its entitlement. Products verify it locally with the public keys
+# published at /api/keys/ and only need to call the service again once the
+# token's refresh deadline (`exp`) has passed.
+#
+# Key rotation: every `<kid>.pem` file in LICENSE_SIGNING_KEY_DIR is published,
+# but only LICENSE_SIGNING_ACTIVE_KID signs new tokens. Retired keys can be kept
+# as public-only `<kid>.pub.pem` files until their last tokens expire. Each
+# process loads the keys once (checked at startup by api/checks.py), so a new
+# key or active kid only takes effect once every worker has been restarted:
+# publish the new key and restart, then switch the active kid and restart again.
+
+import logging
+from functools import lru_cache
+from pathlib import Path
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from jwt.algorithms import OKPAlgorithm
+
+logger = logging.getLogger(__name__)
+
+ALGORITHM = 'EdDSA'
+EPHEMERAL_KID = 'ephemeral'
+
+
+class SigningKey:
+    def __init__(self, kid, public_key, private_key=None):
+        self.kid = kid
+        self.public_key = public_key
+        self.private_key = private_key
+
+    def to_jwk(self):
+        jwk = OKPAlgorithm.to_jwk(self.public_key, as_dict=True)
+        jwk.update({'kid': self.kid, 'alg': ALGORITHM, 'use': 'sig'})
+        return jwk
+
+
+def generate_key_pair():
+    """Returns a new (private_pem, public_pem) Ed25519 key pair."""
+    private_key = Ed25519PrivateKey.generate()
+    private_pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    )
+    public_pem = private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return private_pem, public_pem
+
+
+def _load_key_dir(key_dir):
+    keys = {}
+    for path in sorted(Path(key_dir).glob('*.pem')):
+        data = path.read_bytes()
+        if path.name.endswith('.pub.pem'):
+            kid = path.name[:-len('.pub.pem')]
+            keys.setdefault(kid, SigningKey(kid, serialization.load_pem_public_key(data)))
+        else:
+            kid = path.stem
+            private_key = serialization.load_pem_private_key(data, password=None)
+            keys[kid] = SigningKey(kid, private_key.public_key(), private_key)
+    return keys
+
+
+@lru_cache(maxsize=1)
+def get_signing_keys():
+    """
+    Returns ({kid: SigningKey}, active_kid), cached for the life of the process.
+    Without a configured key directory, development settings (and the tests) get
+    an ephemeral key; tokens die with the process and every worker has its own.
+    """
+    key_dir = getattr(settings, 'LICENSE_SIGNING_KEY_DIR', None)
+    if not key_dir:
+        if not getattr(settings, 'LICENSE_SIGNING_EPHEMERAL_KEY', False):
+            raise ImproperlyConfigured(
+                "LICENSE_SIGNING_KEY_DIR is not set; create a key there with `manage.py generate_signing_key`"
+            )
+        logger.warning("LICENSE_SIGNING_KEY_DIR is not set, using an ephemeral signing key")
+        private_key = Ed25519PrivateKey.generate()
+        return {EPHEMERAL_KID: SigningKey(EPHEMERAL_KID, private_key.public_key(), private_key)}, EPHEMERAL_KID
+
+    keys = _load_key_dir(key_dir)
+    active_kid = getattr(settings, 'LICENSE_SIGNING_ACTIVE_KID', None)
+    if active_kid is None and len(keys) == 1:
+        active_kid = next(iter(keys))
+    if active_kid not in keys or keys[active_kid].private_key is None:
+        raise ImproperlyConfigured(
+            f"LICENSE_SIGNING_ACTIVE_KID '{active_kid}' has no private key in {key_dir}"
+        )
+    return keys, active_kid
+
+
+def get_public_jwks():
+    keys, _ = get_signing_keys()
+    return {'keys': [signing_key.to_jwk() for signing_key in keys.values()]}
+
+
+def issue_license_token(license_obj, instance_id, active_seats):
+    """
+    Signs the entitlement of `instance_id` on `license_obj`.
+    The token expires at the refresh deadline, or earlier if the license does.
+    """
+    keys, active_kid = get_signing_keys()
+    now = timezone.now()
+    refresh_deadline = now + settings.LICENSE_TOKEN_LIFETIME
+    if license_obj.expires_at and license_obj.expires_at < refresh_deadline:
+        refresh_deadline = license_obj.expires_at
+
+    claims = {
+        'iss': settings.LICENSE_TOKEN_ISSUER,
+        'sub': license_obj.license_key.key,
+        'product': license_obj.product.slug,
+        'instance_id': instance_id,
+        'status': license_obj.status,
+        'expires_at': license_obj.expires_at.isoformat() if license_obj.expires_at else None,
+        'total_seats': license_obj.total_seats,
+        'active_seats': active_seats,
+        'iat': int(now.timestamp()),
+        'exp': int(refresh_deadline.timestamp()),
+    }
+    return jwt.encode(claims, keys[active_kid].private_key, algorithm=ALGORITHM, headers={'kid': active_kid})
+
+
+def verify_license_token(token):
+    """Reference verifier, equivalent to what products do with the published JWKS."""
+    keys, _ = get_signing_keys()
+    kid = jwt.get_unverified_header(token).get('kid')
+    if kid not in keys:
+        raise jwt.InvalidTokenError(f"Unknown signing key '{kid}'")
+    return jwt.decode(
+        token, keys[kid].public_key, algorithms=[ALGORITHM], issuer=settings.LICENSE_TOKEN_ISSUER
+    )
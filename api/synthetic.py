@@ -0,0 +1,248 @@
+# Synthetic data generation for benchmarks
+#
+# Generates brands, products, license keys, licenses and activations with the
+# skew seen in production rather than uniform noise:
+#   - brand sizes follow a Zipf distribution, so a few brands own most keys,
+#   - customers are Zipf-distributed too, giving power customers many keys,
+#   - most keys hold a single license, a long tail holds several products,
+#   - seat counts are heavy-tailed (mostly 1-5, occasionally thousands), seat
+#     usage ranges from untouched to full, and a tail of installs has gone quiet.
+# Output is fully determined by the seed and the epoch: timestamps are laid out
+# relative to it, not to the time of the run (pass a recent epoch for expiry
+# dates and quiet installs relative to today). Rows get explicit primary keys and
+# are streamed in chunks: COPY on PostgreSQL, multi-row executemany elsewhere. ORM
+# signals are bypassed, so License.active_seats is written to match the generated
+# activations and new keys are registered with the key filter per chunk.
+# With sharding on (api/sharding.py) brands and products are written to every
+# shard, and each key goes, with its licenses and activations, to the shard it
+# hashes to; primary keys are allocated above the maximum of every shard.
+#
+# Meant for benchmark databases: do not run it while the API is taking writes,
+# as primary keys are allocated from the current maximum.
+
+import bisect
+import csv
+import io
+import itertools
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max
+
+from .key_filter import license_key_filter
+from .models import Activation, Brand, License, LicenseKey, Product
+from .sharding import shard_databases, shard_for_key
+
+COLUMNS = {
+    Brand: ('id', 'name', 'slug', 'created_at'),
+    Product: ('id', 'brand', 'name', 'slug', 'created_at'),
+    LicenseKey: ('id', 'key', 'customer_email', 'brand', 'created_at'),
+    License: ('id', 'license_key', 'product', 'status', 'expires_at', 'total_seats', 'active_seats',
+              'created_at', 'updated_at'),
+    Activation: ('id', 'license', 'instance_id', 'activated_at', 'last_seen_at'),
+}
+STATUS_WEIGHTS = (('VALID', 90), ('SUSPENDED', 7), ('CANCELLED', 3))
+HISTORY_DAYS = 730
+DEFAULT_EPOCH = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def zipf_cum_weights(count, exponent):
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+class SyntheticDataGenerator:
+    def __init__(self, brands=20, products_per_brand=5, keys=100000, customers=None, seed=0,
+                 chunk_size=10000, register_keys=True, progress=None, epoch=DEFAULT_EPOCH):
+        self.brand_count = brands
+        self.products_per_brand = products_per_brand
+        self.key_count = keys
+        self.customer_count = customers or max(1, keys // 3)
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.register_keys = register_keys
+        self.progress = progress
+        self.rng = random.Random(seed)
+        # The newest timestamp of the data set
+        self.now = epoch
+        self.counts = dict.fromkeys(COLUMNS, 0)
+
+    # Writers
+
+    def _table(self, model):
+        columns = [model._meta.get_field(name).column for name in COLUMNS[model]]
+        return model._meta.db_table, columns
+
+    def _write(self, model, rows, using):
+        if not rows:
+            return
+        table, columns = self._table(model)
+        connection = connections[using]
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(rows)
+                sql = f"COPY {quote(table)} ({', '.join(map(quote, columns))}) FROM STDIN WITH (FORMAT csv)"
+                if is_psycopg3:
+                    with cursor.copy(sql) as copy:
+                        copy.write(buffer.getvalue())
+                else:
+                    buffer.seek(0)
+                    cursor.copy_expert(sql, buffer)
+            else:
+                adapt = connection.ops.adapt_datetimefield_value
+                datetimes = [i for i, name in enumerate(COLUMNS[model]) if name.endswith('_at')]
+                rows = [list(row) for row in rows]
+                for row in rows:
+                    for i in datetimes:
+                        row[i] = adapt(row[i])
+                cursor.executemany(
+                    f"INSERT INTO {quote(table)} ({', '.join(map(quote, columns))}) "
+                    f"VALUES ({', '.join(['%s'] * len(columns))})",
+                    rows
+                )
+
+    def _reset_sequences(self, using):
+        connection = connections[using]
+        statements = connection.ops.sequence_reset_sql(no_style(), list(COLUMNS))
+        if statements:
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+
+    def _databases(self):
+        return [alias or DEFAULT_DB_ALIAS for alias in shard_databases()]
+
+    def _shard_of(self, license_key):
+        return shard_for_key(license_key) or DEFAULT_DB_ALIAS
+
+    def _write_sharded(self, key_rows, license_rows, activation_rows):
+        """Writes a chunk, each key with its licenses and activations on the key's shard."""
+        key_shards = {row[0]: self._shard_of(row[1]) for row in key_rows}
+        license_shards = {row[0]: key_shards[row[1]] for row in license_rows}
+        groups = {}
+        for model, rows, shard_of in ((LicenseKey, key_rows, lambda row: key_shards[row[0]]),
+                                      (License, license_rows, lambda row: key_shards[row[1]]),
+                                      (Activation, activation_rows, lambda row: license_shards[row[1]])):
+            for row in rows:
+                groups.setdefault(shard_of(row), {}).setdefault(model, []).append(row)
+        # No cross-shard transactions: each shard commits its part on its own
+        for using, rows_by_model in groups.items():
+            with transaction.atomic(using=using):
+                for model in (LicenseKey, License, Activation):
+                    self._write(model, rows_by_model.get(model), using)
+        for model, rows in ((LicenseKey, key_rows), (License, license_rows), (Activation, activation_rows)):
+            self.counts[model] += len(rows)
+
+    # Generation
+
+    def _created_at(self, position, total):
+        # Spread over the history window in id order, like organically grown data
+        return self.now - timedelta(days=HISTORY_DAYS * (1 - position / max(1, total)))
+
+    def _next_ids(self):
+        # Above the maximum of every shard, so a row can be written to any of them
+        return {
+            model: max(model.objects.using(using).aggregate(top=Max('id'))['top'] or 0
+                       for using in self._databases()) + 1
+            for model in COLUMNS
+        }
+
+    def _reference_data(self, next_ids):
+        brand_rows, product_rows, products = [], [], []
+        for b in range(self.brand_count):
+            brand_id = next_ids[Brand] + b
+            brand_rows.append((brand_id, f"Synthetic Brand {self.seed}-{b}", f"gen-{self.seed}-brand-{b}",
+                               self._created_at(b, self.brand_count)))
+            brand_products = []
+            for p in range(self.products_per_brand):
+                product_id = next_ids[Product] + b * self.products_per_brand + p
+                product_rows.append((product_id, brand_id, f"Product {p}", f"product-{p}",
+                                     self._created_at(b, self.brand_count)))
+                brand_products.append(product_id)
+            products.append((brand_id, brand_products))
+        return brand_rows, product_rows, products
+
+    def _seats(self):
+        total = min(5000, int(self.rng.paretovariate(1.3)))
+        used = int(round(total * self.rng.betavariate(0.6, 1.2)))
+        return total, used
+
+    def _chunk(self, start, stop, products, next_ids, brand_weights, customer_weights):
+        rng = self.rng
+        key_rows, license_rows, activation_rows = [], [], []
+        statuses, status_weights = zip(*STATUS_WEIGHTS)
+        for position in range(start, stop):
+            key_id = next_ids[LicenseKey] + position
+            created_at = self._created_at(position, self.key_count)
+            brand_id, brand_products = products[bisect.bisect(brand_weights, rng.random() * brand_weights[-1])]
+            customer = bisect.bisect(customer_weights, rng.random() * customer_weights[-1])
+            key_rows.append((key_id, str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                             f"customer{customer}@example.com", brand_id, created_at))
+
+            license_count = min(len(brand_products), int(rng.paretovariate(2.5)))
+            for product_id in rng.sample(brand_products, license_count):
+                license_id = next_ids[License] + self.counts[License] + len(license_rows)
+                total_seats, used_seats = self._seats()
+                license_rows.append((
+                    license_id, key_id, product_id, rng.choices(statuses, status_weights)[0],
+                    created_at + timedelta(days=rng.randint(30, 3 * 365)), total_seats, used_seats,
+                    created_at, created_at,
+                ))
+                for seat in range(used_seats):
+                    activation_id = next_ids[Activation] + self.counts[Activation] + len(activation_rows)
+                    activated_at = created_at + timedelta(minutes=seat)
+                    # Most installs pinged within a day or two; a long tail went quiet
+                    quiet_days = min(HISTORY_DAYS, rng.paretovariate(1.0) - 1)
+                    last_seen_at = max(activated_at, self.now - timedelta(days=quiet_days))
+                    activation_rows.append((activation_id, license_id, f"host-{seat}.customer{customer}.example.com",
+                                            activated_at, last_seen_at))
+        return key_rows, license_rows, activation_rows
+
+    def generate(self):
+        """Writes the whole data set and returns the row count per model name."""
+        if Brand.objects.filter(slug=f"gen-{self.seed}-brand-0").exists():
+            raise ValueError(f"Data for seed {self.seed} already exists; use another seed.")
+
+        started_at = time.monotonic()
+        next_ids = self._next_ids()
+        brand_rows, product_rows, products = self._reference_data(next_ids)
+        brand_weights = zipf_cum_weights(self.brand_count, 1.2)
+        customer_weights = zipf_cum_weights(self.customer_count, 0.9)
+        # Every shard holds a copy of the reference data
+        for using in self._databases():
+            with transaction.atomic(using=using):
+                self._write(Brand, brand_rows, using)
+                self._write(Product, product_rows, using)
+        self.counts[Brand] += len(brand_rows)
+        self.counts[Product] += len(product_rows)
+
+        for start in range(0, self.key_count, self.chunk_size):
+            stop = min(start + self.chunk_size, self.key_count)
+            key_rows, license_rows, activation_rows = self._chunk(
+                start, stop, products, next_ids, brand_weights, customer_weights
+            )
+            self._write_sharded(key_rows, license_rows, activation_rows)
+            if self.register_keys:
+                license_key_filter.record_created(row[1] for row in key_rows)
+            if self.progress:
+                self.progress(self.stats(started_at))
+
+        for using in self._databases():
+            self._reset_sequences(using)
+        return self.stats(started_at)
+
+    def stats(self, started_at):
+        elapsed = time.monotonic() - started_at
+        rows = sum(self.counts.values())
+        return {
+            'rows': {model.__name__: count for model, count in self.counts.items()},
+            'elapsed': round(elapsed, 2),
+            'rows_per_second': int(rows / elapsed) if elapsed else None,
+        }
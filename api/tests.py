@@ -1,13 +1,69 @@
-from django.test import TestCase
+from django.test import LiveServerTestCase, TestCase
 from django.urls import reverse
 from rest_framework import status
-from rest_framework.test import APIClient
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.views import APIView
 from django.contrib.auth.models import User
-from api.models import Brand, Product, LicenseKey, License, Activation
+from api.models import Brand, Product, LicenseKey, License, Activation, SeatLimitReached, ServiceToken
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
+import csv
+from contextlib import contextmanager
+import io
+import itertools
+from importlib import import_module
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import jwt
+from asgiref.sync import sync_to_async
+from django.core.management import CommandError, call_command
+from django.db.models import Count, F, Max
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connection, connections
+from unittest import skipUnless
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from api.cache import license_status_cache
+from api.exports import EXPORT_FIELDS
+from api.key_filter import BloomFilter, license_key_filter
+from api.pagination import KeysetPagination
+from api.management.commands import reconcile_seats
+from api.provisioning import BulkProvisioner
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import SystemCheckError
+from django.core.cache import cache
+from api import heartbeats, loadtest, metrics, pooling, profiling, routing, service_tokens, sharding, throttling
+from unittest import mock
+from api.profiling import profile_buffer
+from prometheus_client import REGISTRY
+from api.signing import get_signing_keys, verify_license_token
+from api.checks import check_signing_keys
+from api.verdicts import verdict_key, verdict_store
+from api.parsers import ORJSONParser
+from api.renderers import ORJSONRenderer, msgpack
+from rest_framework.renderers import JSONRenderer
+from django.utils.translation import gettext_lazy
+import decimal
+import uuid
+from collections import Counter
+
+@contextmanager
+def quiet_heartbeat_buffer():
+    """A heartbeat buffer for the views that only the test flushes (no flusher thread)."""
+    buffer = heartbeats.HeartbeatBuffer()
+    buffer._flusher_pid = os.getpid()
+    with mock.patch('api.views.heartbeat_buffer', buffer), mock.patch('api.async_views.heartbeat_buffer', buffer):
+        yield buffer
+
 
 class LicenseAPITestCase(TestCase):
+    databases = '__all__'
+
     def setUp(self):
         # Create a user
         self.user = User.objects.create_superuser(username='admin', password='password123', email='admin@test.com')
@@ -119,4 +175,1781 @@ class LicenseAPITestCase(TestCase):
         
         response = self.client.get(reverse('customer-license-list'), {'email': 'lookup@test.com'})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(len(response.data['results']), 2)
+
+class BatchLicenseValidationTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.brand = Brand.objects.create(name="Brand One", slug="brand-one")
+        self.product = Product.objects.create(brand=self.brand, name="Product A", slug="prod-a")
+        self.expires_at = timezone.now() + timedelta(days=30)
+
+    def _provision(self, key, status='VALID', total_seats=2, instances=()):
+        lk = LicenseKey.objects.create(key=key, brand=self.brand, customer_email=f"{key}@test.com")
+        license_obj = License.objects.create(
+            license_key=lk, product=self.product, status=status,
+            expires_at=self.expires_at, total_seats=total_seats
+        )
+        for instance_id in instances:
+            license_obj.activate(instance_id)
+        return license_obj
+
+    def test_batch_verdicts(self):
+        self._provision("key-valid", instances=["site1.com"])
+        self._provision("key-suspended", status='SUSPENDED')
+
+        items = [
+            {"license_key": "key-valid", "product_slug": "prod-a", "instance_id": "site1.com"},
+            {"license_key": "key-valid", "product_slug": "prod-a", "instance_id": "site2.com"},
+            {"license_key": "key-suspended", "product_slug": "prod-a", "instance_id": "site1.com"},
+            {"license_key": "missing", "product_slug": "prod-a", "instance_id": "site1.com"},
+        ]
+        response = self.client.post(reverse('batch-license-validation'), {"items": items}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [result['verdict'] for result in response.data],
+            ['valid', 'not_activated', 'inactive', 'not_found']
+        )
+        self.assertEqual(response.data[0]['active_seats'], 1)
+        self.assertIsNone(response.data[3]['status'])
+
+    def test_batch_query_count_is_constant(self):
+        items = []
+        for i in range(20):
+            self._provision(f"key-{i}", instances=[f"site{i}.com"])
+            items.append({"license_key": f"key-{i}", "product_slug": "prod-a", "instance_id": f"site{i}.com"})
+
+        with self.assertNumQueries(2):
+            response = self.client.post(reverse('batch-license-validation'), {"items": items}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(all(result['verdict'] == 'valid' for result in response.data))
+
+    def test_batch_size_limit(self):
+        items = [
+            {"license_key": "k", "product_slug": "prod-a", "instance_id": str(i)}
+            for i in range(501)
+        ]
+        response = self.client.post(reverse('batch-license-validation'), {"items": items}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class OfflineLicenseTokenTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.client = APIClient()
+        brand = Brand.objects.create(name="Brand One", slug="brand-one")
+        product = Product.objects.create(brand=brand, name="Product A", slug="prod-a")
+        lk = LicenseKey.objects.create(key="offline-key", brand=brand, customer_email="offline@test.com")
+        self.license = License.objects.create(
+            license_key=lk, product=product, total_seats=3,
+            expires_at=timezone.now() + timedelta(days=2)
+        )
+        get_signing_keys.cache_clear()
+        self.addCleanup(get_signing_keys.cache_clear)
+
+    def _activate(self):
+        return self.client.post(reverse('activate-license'), {
+            "license_key": "offline-key",
+            "product_slug": "prod-a",
+            "instance_id": "site1.com"
+        })
+
+    def test_activation_returns_verifiable_token(self):
+        response = self._activate()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        claims = verify_license_token(response.data['offline_token'])
+        self.assertEqual(claims['sub'], "offline-key")
+        self.assertEqual(claims['product'], "prod-a")
+        self.assertEqual(claims['instance_id'], "site1.com")
+        self.assertEqual(claims['active_seats'], 1)
+        # The refresh deadline never outlives the license itself
+        self.assertLessEqual(claims['exp'], int(self.license.expires_at.timestamp()))
+
+    def test_key_dir_is_required_outside_development(self):
+        with override_settings(LICENSE_SIGNING_KEY_DIR=None, LICENSE_SIGNING_EPHEMERAL_KEY=False):
+            with self.assertRaises(ImproperlyConfigured):
+                get_signing_keys()
+            # Reported at startup rather than on the first activation
+            self.assertEqual([error.id for error in check_signing_keys(None)], ['api.E001'])
+            with self.assertRaises(SystemCheckError):
+                call_command('check')
+
+    def test_key_rotation(self):
+        with tempfile.TemporaryDirectory() as key_dir:
+            call_command('generate_signing_key', 'old', key_dir=key_dir)
+            with override_settings(LICENSE_SIGNING_KEY_DIR=key_dir, LICENSE_SIGNING_ACTIVE_KID='old'):
+                get_signing_keys.cache_clear()
+                old_token = self._activate().data['offline_token']
+
+            call_command('generate_signing_key', 'new', key_dir=key_dir)
+            with override_settings(LICENSE_SIGNING_KEY_DIR=key_dir, LICENSE_SIGNING_ACTIVE_KID='new'):
+                get_signing_keys.cache_clear()
+                response = self.client.get(reverse('license-signing-keys'))
+                self.assertEqual({jwk['kid'] for jwk in response.data['keys']}, {'old', 'new'})
+
+                # Tokens signed with the retired key remain valid after rotation
+                self.assertEqual(verify_license_token(old_token)['sub'], "offline-key")
+                new_token = self._activate().data['offline_token']
+                self.assertEqual(jwt.get_unverified_header(new_token)['kid'], 'new')
+
+class LicenseReadQueryBudgetTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(username='admin', password='password123', email='admin@test.com')
+        self.client = APIClient()
+        self.brand = Brand.objects.create(name="Brand One", slug="brand-one")
+        self.products = [
+            Product.objects.create(brand=self.brand, name=f"Product {i}", slug=f"prod-{i}")
+            for i in range(5)
+        ]
+
+    def _create_key(self, key, licenses, activations):
+        lk = LicenseKey.objects.create(key=key, brand=self.brand, customer_email="budget@test.com")
+        for product in self.products[:licenses]:
+            license_obj = License.objects.create(license_key=lk, product=product, total_seats=activations)
+            for i in range(activations):
+                license_obj.activate(f"site{i}.com")
+        return lk
+
+    def test_status_query_budget_is_constant(self):
+        for key, licenses, activations in [("small-key", 1, 1), ("large-key", 5, 4)]:
+            self._create_key(key, licenses, activations)
+            with self.assertNumQueries(3, using=sharding.shard_for_key(key) or DEFAULT_DB_ALIAS):
+                response = self.client.get(reverse('license-status', args=[key]))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(response.data['licenses']), licenses)
+            self.assertEqual(response.data['licenses'][0]['active_seats'], activations)
+
+    def test_customer_lookup_query_budget_is_constant(self):
+        self.client.force_authenticate(self.user)
+        for i in range(10):
+            self._create_key(f"key-{i}", 3, 2)
+
+        # Key, license and activation lookups; independent of the number of keys
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('customer-license-list'), {'email': 'budget@test.com'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 10)
+
+class SeatAccountingTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        brand = Brand.objects.create(name="Brand One", slug="brand-one")
+        product = Product.objects.create(brand=brand, name="Product A", slug="prod-a")
+        lk = LicenseKey.objects.create(key="seat-key", brand=brand, customer_email="seats@test.com")
+        self.license = License.objects.create(license_key=lk, product=product, total_seats=2)
+
+    def test_activate_maintains_counter(self):
+        self.assertTrue(self.license.activate("site1.com")[1])
+        self.assertFalse(self.license.activate("site1.com")[1])
+        self.license.activate("site2.com")
+        self.assertEqual(self.license.active_seats, 2)
+
+        with self.assertRaises(SeatLimitReached):
+            self.license.activate("site3.com")
+        # An existing instance never needs a free seat
+        self.assertFalse(self.license.activate("site2.com")[1])
+
+        self.license.activations.filter(instance_id="site1.com").delete()
+        self.license.refresh_from_db()
+        self.assertEqual(self.license.active_seats, 1)
+        self.assertTrue(self.license.activate("site3.com")[1])
+
+    def test_reconcile_seats(self):
+        self.license.activate("site1.com")
+        # Simulate drift from a write that bypassed activate()
+        Activation.objects.create(license=self.license, instance_id="site2.com")
+        with sharding.use_shard_of("seat-key"):
+            License.objects.filter(pk=self.license.pk).update(active_seats=0)
+        license_status_cache.set("seat-key", {"key": "seat-key"})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reconcile_seats', stdout=io.StringIO())
+        self.license.refresh_from_db()
+        self.assertEqual(self.license.active_seats, 2)
+        # The cached status still showed the drifted count
+        self.assertIsNone(license_status_cache.get("seat-key"))
+
+    def test_reconcile_seats_counts_at_write_time(self):
+        command = reconcile_seats.Command(stdout=io.StringIO())
+        with sharding.use_shard_of("seat-key") as shard:
+            License.objects.filter(pk=self.license.pk).update(active_seats=5)
+            # A seat taken between the scan and the repair is counted
+            Activation.objects.create(license=self.license, instance_id="site1.com")
+            command._save([(self.license.pk, "seat-key")], False, shard)
+        self.license.refresh_from_db()
+        self.assertEqual(self.license.active_seats, 1)
+
+class BulkProvisionTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(username='admin', password='password123', email='admin@test.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.brand = Brand.objects.create(name="Brand One", slug="brand-one")
+        Product.objects.create(brand=self.brand, name="Product A", slug="prod-a")
+        Product.objects.create(brand=self.brand, name="Product B", slug="prod-b")
+        other_brand = Brand.objects.create(name="Brand Two", slug="brand-two")
+        LicenseKey.objects.create(key="key-two", brand=other_brand, customer_email="other@test.com")
+
+    def test_bulk_provision_json(self):
+        existing = LicenseKey.objects.create(key="existing", brand=self.brand, customer_email="a@test.com")
+        License.objects.create(license_key=existing, product=Product.objects.get(slug="prod-a"), status='SUSPENDED')
+
+        rows = [
+            {"brand_slug": "brand-one", "product_slug": "prod-a", "customer_email": "a@test.com", "total_seats": 3},
+            {"brand_slug": "brand-one", "product_slug": "prod-b", "customer_email": "a@test.com"},
+            {"brand_slug": "brand-one", "product_slug": "prod-a", "customer_email": "new@test.com", "license_key": "fresh"},
+            {"brand_slug": "brand-one", "product_slug": "prod-a", "customer_email": "x@test.com", "license_key": "key-two"},
+            {"brand_slug": "brand-one", "product_slug": "missing", "customer_email": "x@test.com"},
+            {"brand_slug": "brand-one", "customer_email": "x@test.com"},
+        ]
+        response = self.client.post(reverse('bulk-provision-license'), rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['updated', 'created', 'created', 'error', 'error', 'error']
+        )
+        self.assertEqual(
+            [result.get('code') for result in response.data['results'][3:]],
+            ['conflict', 'not_found', 'invalid']
+        )
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['failed']), (2, 1, 3))
+
+        # Existing customer key is reused and the suspended license re-validated
+        self.assertEqual(response.data['results'][1]['license_key'], "existing")
+        renewed = existing.licenses.get(product__slug="prod-a")
+        self.assertEqual((renewed.status, renewed.total_seats), ('VALID', 3))
+        with sharding.use_shard_of("fresh"):
+            self.assertEqual(LicenseKey.objects.get(key="fresh").customer_email, "new@test.com")
+
+    def test_bulk_provision_ndjson_and_csv(self):
+        ndjson = (
+            '{"brand_slug": "brand-one", "product_slug": "prod-a", "customer_email": "b@test.com"}\n'
+            'not json\n'
+            '{"brand_slug": "brand-one", "product_slug": "prod-b", "customer_email": "b@test.com"}\n'
+        )
+        response = self.client.post(
+            reverse('bulk-provision-license'), ndjson, content_type='application/x-ndjson'
+        )
+        self.assertEqual([r['status'] for r in response.data['results']], ['created', 'error', 'created'])
+        # Both products land on the same auto-generated key
+        self.assertEqual(len(sharding.scatter(LicenseKey.objects.filter(customer_email="b@test.com"))), 1)
+
+        csv_body = (
+            "brand_slug,product_slug,customer_email,total_seats,license_key\n"
+            "brand-one,prod-a,c@test.com,5,\n"
+            "brand-one,prod-a,c@test.com,7,\n"
+        )
+        response = self.client.post(reverse('bulk-provision-license'), csv_body, content_type='text/csv')
+        self.assertEqual([r['status'] for r in response.data['results']], ['created', 'updated'])
+        licenses = sharding.scatter(License.objects.filter(license_key__customer_email="c@test.com"))
+        self.assertEqual([license_obj.total_seats for license_obj in licenses], [7])
+
+    def test_bulk_provision_rejects_non_list_bodies(self):
+        for body in ('5', 'null', '"brand-one"', '{"rows": []}'):
+            response = self.client.post(reverse('bulk-provision-license'), body, content_type='application/json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, body)
+        self.assertFalse(License.objects.exists())
+
+    def test_bulk_provision_query_count_per_chunk(self):
+        rows = [
+            {"brand_slug": "brand-one", "product_slug": "prod-a", "customer_email": f"user{i}@test.com"}
+            for i in range(50)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('bulk-provision-license'), rows, format='json')
+        self.assertEqual(response.data['created'], 50)
+        self.assertLess(len(queries), 15)
+
+class LicenseStatusCacheTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.brand = Brand.objects.create(name="Brand One", slug="brand-one")
+        self.product = Product.objects.create(brand=self.brand, name="Product A", slug="prod-a")
+        self.lk = LicenseKey.objects.create(key="cached-key", brand=self.brand, customer_email="cache@test.com")
+        self.license = License.objects.create(license_key=self.lk, product=self.product)
+        license_status_cache.clear_local()
+
+    def _status(self):
+        return self.client.get(reverse('license-status', args=["cached-key"])).data
+
+    def test_hot_key_is_served_without_queries(self):
+        self._status()
+        with self.assertNumQueries(0):
+            self.assertEqual(self._status()['key'], "cached-key")
+
+    def test_writes_invalidate_status(self):
+        self.assertEqual(self._status()['licenses'][0]['status'], 'VALID')
+
+        # Suspension (e.g. from the admin) is visible immediately
+        self.license.status = 'SUSPENDED'
+        self.license.save()
+        self.assertEqual(self._status()['licenses'][0]['status'], 'SUSPENDED')
+
+        self.license.activate("site1.com")
+        self.assertEqual(self._status()['licenses'][0]['active_seats'], 1)
+
+        self.license.activations.all().delete()
+        self.assertEqual(self._status()['licenses'][0]['activations'], [])
+
+        self.product.name = "Product A Pro"
+        self.product.save()
+        self.assertEqual(self._status()['licenses'][0]['product_name'], "Product A Pro")
+
+    def test_bulk_provisioning_invalidates_status(self):
+        self._status()
+        BulkProvisioner().provision([{
+            "brand_slug": "brand-one", "product_slug": "prod-a",
+            "customer_email": "cache@test.com", "license_key": "cached-key", "total_seats": 9
+        }])
+        self.assertEqual(self._status()['licenses'][0]['total_seats'], 9)
+
+    def test_local_tier_evicts_least_recently_used(self):
+        with override_settings(LICENSE_STATUS_CACHE={'LOCAL_MAX_ENTRIES': 2}):
+            evictions = license_status_cache.local.evictions
+            for key in ("a", "b", "c"):
+                license_status_cache.set(key, {"key": key})
+            self.assertEqual(license_status_cache.local.evictions, evictions + 1)
+            self.assertEqual(license_status_cache.local.get(license_status_cache.make_key("a")), (False, None))
+
+@override_settings(LICENSE_KEY_FILTER={**settings.LICENSE_KEY_FILTER, 'ENABLED': True})
+class LicenseKeyFilterTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.client = APIClient()
+        brand = Brand.objects.create(name="Brand One", slug="brand-one")
+        self.brand = brand
+        LicenseKey.objects.create(key="known-key", brand=brand, customer_email="filter@test.com")
+        license_key_filter.rebuild()
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f"key-{i}")
+        self.assertTrue(all(f"key-{i}" in bloom for i in range(1000)))
+        false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_unknown_keys_are_rejected_without_queries(self):
+        self.client.get(reverse('license-status', args=["guessed-key"]))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('license-status', args=["guessed-key"]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        with self.assertNumQueries(0):
+            response = self.client.post(reverse('activate-license'), {
+                "license_key": "guessed-key", "product_slug": "prod-a", "instance_id": "site1.com"
+            })
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_negative_cache_covers_false_positives(self):
+        license_key_filter._bloom.add("phantom-key")
+        self.client.get(reverse('license-status', args=["phantom-key"]))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('license-status', args=["phantom-key"]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # Creating the key clears its negative entry
+        LicenseKey.objects.create(key="phantom-key", brand=self.brand, customer_email="filter@test.com")
+        response = self.client.get(reverse('license-status', args=["phantom-key"]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_stale_filter_is_rebuilt_in_the_background(self):
+        license_key_filter._built_at -= 3600
+        with mock.patch.object(threading, 'Thread') as thread, self.assertNumQueries(0):
+            self.assertTrue(license_key_filter.might_exist("known-key"))
+            self.assertFalse(license_key_filter.might_exist("guessed-key"))
+        # One rebuild at a time; the old filter answers meanwhile
+        thread.assert_called_once_with(target=license_key_filter._rebuild_in_background,
+                                       name='license-key-filter', daemon=True)
+        with mock.patch.object(license_key_filter, 'rebuild'), mock.patch.object(connections, 'close_all'):
+            license_key_filter._rebuild_in_background()
+        self.assertFalse(license_key_filter._build_lock.locked())
+
+    def test_off_by_default_with_a_per_process_cache(self):
+        self.assertIn(settings.CACHES['default']['BACKEND'], settings.LOCAL_CACHE_BACKENDS)
+        with override_settings(LICENSE_KEY_FILTER={}):
+            self.assertTrue(license_key_filter.might_exist("guessed-key"))
+
+    def test_keys_created_elsewhere_are_not_rejected(self):
+        # Another worker's signal only reaches this process through the shared recent marker
+        LicenseKey.objects.bulk_create([
+            LicenseKey(key="remote-key", brand=self.brand, customer_email="filter@test.com")
+        ])
+        self.assertFalse(license_key_filter.might_exist("remote-key"))
+        cache.set(license_key_filter.recent_key("remote-key"), True)
+        response = self.client.get(reverse('license-status', args=["remote-key"]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+class ThrottlingTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.client = APIClient()
+        brand = Brand.objects.create(name="Brand One", slug="brand-one")
+        LicenseKey.objects.create(key="throttled-key", brand=brand, customer_email="throttle@test.com")
+        cache.clear()
+        throttling.blocked_locally.clear()
+
+    def _rates(self, rates):
+        return override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates})
+
+    def test_license_key_window(self):
+        with self._rates({'status.license_key': '2/min'}):
+            for _ in range(2):
+                response = self.client.get(reverse('license-status', args=["throttled-key"]))
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            # Rejected before any ORM work, the second time without touching the shared cache
+            for _ in range(2):
+                with self.assertNumQueries(0):
+                    response = self.client.get(reverse('license-status', args=["throttled-key"]))
+                self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+                self.assertIn('Retry-After', response)
+
+            # Other keys have their own window
+            response = self.client.get(reverse('license-status', args=["other-key"]))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        counts = throttling.throttle_stats.snapshot()['status.license_key']
+        self.assertGreaterEqual(counts['rejected'], 2)
+        self.assertGreaterEqual(counts['rejected_in_process'], 1)
+
+    def test_window_slides(self):
+        throttle = throttling.ClientIPThrottle()
+        view = type('View', (), {'throttle_scope': 'activate', 'kwargs': {}})()
+        request = type('Request', (), {'META': {'REMOTE_ADDR': '10.0.0.1'}})()
+        now = [1000.0]
+        throttle.timer = lambda: now[0]
+
+        with self._rates({'activate.ip': '60/min'}):
+            # 6s slots; 1000.0 is 4s into one
+            self.assertTrue(all(throttle.allow_request(request, view) for _ in range(30)))
+            now[0] += 30
+            self.assertTrue(all(throttle.allow_request(request, view) for _ in range(30)))
+            self.assertFalse(throttle.allow_request(request, view))
+            # The first 30 leave the window when it slides past their slot
+            self.assertAlmostEqual(throttle.wait(), 26.0)
+
+            throttling.blocked_locally.clear()
+            now[0] += 26
+            self.assertTrue(all(throttle.allow_request(request, view) for _ in range(30)))
+            self.assertFalse(throttle.allow_request(request, view))
+
+    def test_concurrent_requests_cannot_share_a_reading(self):
+        throttle = throttling.ClientIPThrottle()
+        view = type('View', (), {'throttle_scope': 'activate', 'kwargs': {}})()
+        request = type('Request', (), {'META': {'REMOTE_ADDR': '10.0.0.2'}})()
+        admitted = []
+
+        def hit():
+            admitted.append(throttling.ClientIPThrottle().allow_request(request, view))
+
+        with self._rates({'activate.ip': '5/min'}):
+            threads = [threading.Thread(target=hit) for _ in range(20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(admitted.count(True), 5)
+            self.assertFalse(throttle.allow_request(request, view))
+
+    def test_client_ip_ignores_forwarded_for(self):
+        request = type('Request', (), {'META': {'REMOTE_ADDR': '10.0.0.3', 'HTTP_X_FORWARDED_FOR': '1.2.3.4'}})()
+        self.assertEqual(throttling.ClientIPThrottle().get_ident(request), '10.0.0.3')
+
+class AsyncLicenseViewsTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        brand = Brand.objects.create(name="Brand One", slug="brand-one")
+        product = Product.objects.create(brand=brand, name="Product A", slug="prod-a")
+        lk = LicenseKey.objects.create(key="async-key", brand=brand, customer_email="async@test.com")
+        License.objects.create(
+            license_key=lk, product=product, total_seats=1, expires_at=timezone.now() + timedelta(days=30)
+        )
+
+    async def _activate(self, instance_id):
+        return await self.async_client.post(
+            reverse('async-activate-license'),
+            {"license_key": "async-key", "product_slug": "prod-a", "instance_id": instance_id},
+            content_type='application/json'
+        )
+
+    async def test_async_activation_flow(self):
+        response = await self._activate("site1.com")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['active_seats'], 1)
+        self.assertEqual(response.json()['activations'][0]['instance_id'], "site1.com")
+        self.assertIn('offline_token', response.json())
+
+        # Idempotent for the same instance, seat limit for a new one
+        self.assertEqual((await self._activate("site1.com")).status_code, status.HTTP_200_OK)
+        response = await self._activate("site2.com")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        response = await self.async_client.post(
+            reverse('async-activate-license'), {"license_key": "async-key"}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(ACTIVATION_HEARTBEAT={'FLUSH_INTERVAL': 3600, 'MAX_PENDING': 1})
+    async def test_idempotent_async_activation_fills_heartbeat_buffer(self):
+        self.assertEqual((await self._activate("site1.com")).status_code, status.HTTP_200_OK)
+        with sharding.use_shard_of("async-key"):
+            await Activation.objects.filter(instance_id="site1.com").aupdate(last_seen_at=timezone.now() - timedelta(days=3))
+        with quiet_heartbeat_buffer() as buffer:
+            # Records a heartbeat into a full buffer: the flush is left to the flusher thread
+            response = await self._activate("site1.com")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(buffer._wake.is_set())
+            self.assertEqual(await sync_to_async(buffer.flush_if_due)(), 1)
+
+    async def test_async_status_matches_sync_view(self):
+        response = await self.async_client.get(reverse('async-license-status', args=["async-key"]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        sync_response = await sync_to_async(self.client.get)(reverse('license-status', args=["async-key"]))
+        self.assertEqual(response.json(), sync_response.json())
+
+        response = await self.async_client.get(reverse('async-license-status', args=["unknown-key"]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class KeysetPaginationTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(username='admin', password='password123', email='admin@test.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.brand = Brand.objects.create(name="Brand One", slug="brand-one")
+        # Identical timestamps exercise the id tie-breaker
+        created_at = timezone.now()
+        for i in range(7):
+            lk = LicenseKey.objects.create(key=f"page-key-{i}", brand=self.brand, customer_email="pages@test.com")
+            with sharding.use_shard_of(lk.key):
+                LicenseKey.objects.filter(pk=lk.pk).update(created_at=created_at - timedelta(minutes=i // 2))
+
+    def _collect(self, url, params):
+        keys, pages = [], 0
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            keys.extend(item['key'] for item in response.data['results'])
+            pages += 1
+            if not response.data['next']:
+                return keys, pages
+            response = self.client.get(response.data['next'])
+
+    def test_cursor_walks_every_row_once(self):
+        keys, pages = self._collect(reverse('customer-license-list'), {'email': 'pages@test.com', 'page_size': 3})
+        self.assertEqual(pages, 3)
+        if len(settings.SHARDING['ALIASES']) > 1:
+            # Ids are allocated per shard, so only the timestamps order the pairs
+            self.assertEqual([int(key[-1]) // 2 for key in keys], [0, 0, 1, 1, 2, 2, 3])
+            self.assertCountEqual(keys, [f"page-key-{i}" for i in range(7)])
+        else:
+            self.assertEqual(keys, [f"page-key-{i}" for i in [1, 0, 3, 2, 5, 4, 6]])
+
+    def test_deep_page_query_is_keyset_bounded(self):
+        Brand.objects.create(name="Brand Two", slug="brand-two")
+        response = self.client.get(reverse('brand-list'), {'page_size': 1})
+        self.assertEqual(response.data['results'][0]['slug'], "brand-two")
+
+        # Rows inserted in front of the cursor do not shift later pages
+        Brand.objects.create(name="Brand Three", slug="brand-three")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(response.data['next'])
+        self.assertEqual([brand['slug'] for brand in response.data['results']], ["brand-one"])
+        self.assertNotIn('OFFSET', queries[-1]['sql'].upper())
+        self.assertNotIn('COUNT(', queries[-1]['sql'].upper())
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('product-list'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class BrandLicenseExportTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(username='admin', password='password123', email='admin@test.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.brand = Brand.objects.create(name="Brand One", slug="brand-one")
+        product = Product.objects.create(brand=self.brand, name="Product A", slug="prod-a")
+        lk = LicenseKey.objects.create(key="export-key", brand=self.brand, customer_email="export@test.com")
+        license_obj = License.objects.create(license_key=lk, product=product, total_seats=2)
+        license_obj.activate("site1.com")
+        license_obj.activate("site2.com")
+        LicenseKey.objects.create(key="bare-key", brand=self.brand, customer_email="bare@test.com")
+
+        other_brand = Brand.objects.create(name="Brand Two", slug="brand-two")
+        LicenseKey.objects.create(key="other-key", brand=other_brand, customer_email="other@test.com")
+
+    def _export(self, output):
+        response = self.client.get(reverse('brand-license-export', args=["brand-one"]), {'output': output})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_export(self):
+        rows = [json.loads(line) for line in self._export('ndjson').splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual({row['license_key'] for row in rows}, {"export-key", "bare-key"})
+        self.assertEqual(
+            sorted(row['instance_id'] for row in rows if row['instance_id']), ["site1.com", "site2.com"]
+        )
+        bare = next(row for row in rows if row['license_key'] == "bare-key")
+        self.assertIsNone(bare['product_slug'])
+
+    def test_csv_export_and_command_match(self):
+        rows = list(csv.DictReader(io.StringIO(self._export('csv'))))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(list(rows[0].keys()), EXPORT_FIELDS)
+
+        out = io.StringIO()
+        call_command('export_licenses', 'brand-one', export_format='csv', stdout=out)
+        self.assertEqual(sorted(out.getvalue().splitlines()), sorted(self._export('csv').splitlines()))
+
+    def test_unknown_format(self):
+        response = self.client.get(reverse('brand-license-export', args=["brand-one"]), {'output': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+@skipUnless(connection.vendor in ('postgresql', 'sqlite'), "Query plans are only checked on PostgreSQL and SQLite")
+class HotQueryPlanTestCase(TestCase):
+    """
+    Fails when a hot lookup can no longer be answered from an index.
+    On PostgreSQL sequential scans and sorts are disabled for the transaction,
+    so the planner only falls back to them when no usable index exists.
+    """
+    databases = '__all__'
+
+
+    def setUp(self):
+        self.brand = Brand.objects.create(name="Brand One", slug="brand-one")
+        self.product = Product.objects.create(brand=self.brand, name="Product A", slug="prod-a")
+        self.lk = LicenseKey.objects.create(key="plan-key", brand=self.brand, customer_email="plan@test.com")
+        License.objects.create(license_key=self.lk, product=self.product)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute("SET LOCAL enable_sort = off")
+
+    def _plan_nodes(self, queryset):
+        if connection.vendor == 'postgresql':
+            nodes, pending = [], [json.loads(queryset.explain(format='json'))[0]['Plan']]
+            while pending:
+                node = pending.pop()
+                nodes.append(f"{node['Node Type']} {node.get('Relation Name', '')}".strip())
+                pending.extend(node.get('Plans', []))
+            return nodes
+        # SQLite: "<id> <parent> <unused> <detail>"
+        return [line.split(' ', 3)[-1] for line in queryset.explain().splitlines()]
+
+    def assertIndexOnly(self, queryset, ordered=False):
+        nodes = self._plan_nodes(queryset)
+        for node in nodes:
+            self.assertFalse(node.startswith('Seq Scan'), f"Sequential scan in plan: {nodes}")
+            self.assertFalse(re.fullmatch(r'SCAN \w+', node), f"Full table scan in plan: {nodes}")
+            if ordered:
+                self.assertFalse(node == 'Sort' or 'TEMP B-TREE' in node, f"Sort in plan: {nodes}")
+
+    def test_license_key_by_key(self):
+        self.assertIndexOnly(LicenseKey.objects.filter(key="plan-key"))
+
+    def test_license_key_by_customer_and_brand(self):
+        self.assertIndexOnly(LicenseKey.objects.filter(customer_email="plan@test.com", brand=self.brand))
+
+    def test_license_by_key_and_product_slug(self):
+        self.assertIndexOnly(
+            License.objects.filter(license_key=self.lk, product__slug="prod-a").order_by('-created_at')[:1]
+        )
+
+    def test_customer_lookup_page(self):
+        self.assertIndexOnly(
+            LicenseKey.objects.filter(customer_email="plan@test.com").order_by('-created_at', '-id')[:101],
+            ordered=True
+        )
+
+    def assertRangeStartsAt(self, queryset, column):
+        if connection.vendor == 'postgresql':
+            conditions, pending = [], [json.loads(queryset.explain(format='json'))[0]['Plan']]
+            while pending:
+                node = pending.pop()
+                conditions.append(node.get('Index Cond', ''))
+                pending.extend(node.get('Plans', []))
+        else:
+            conditions = self._plan_nodes(queryset)
+        self.assertTrue(any(re.search(rf'{column}\s*<', condition) for condition in conditions),
+                        f"{column} does not bound the index range: {conditions}")
+
+    def test_list_pages(self):
+        for model in (Brand, Product, LicenseKey):
+            self.assertIndexOnly(model.objects.order_by('-created_at', '-id')[:101], ordered=True)
+
+    def test_cursor_pages(self):
+        # A deep page starts its index range at the cursor instead of filtering every newer row
+        position = (timezone.now(), 1000)
+        pages = [model.objects.order_by('-created_at', '-id') for model in (Brand, Product, LicenseKey)]
+        pages.append(LicenseKey.objects.filter(customer_email="plan@test.com").order_by('-created_at', '-id'))
+        for queryset in pages:
+            page = KeysetPagination().filter_after(queryset, position)[:101]
+            self.assertIndexOnly(page, ordered=True)
+            self.assertRangeStartsAt(page, 'created_at')
+
+    def test_valid_licenses_by_expiry(self):
+        self.assertIndexOnly(License.objects.filter(status='VALID', expires_at__lt=timezone.now()))
+
+    def test_batch_validation_lookups(self):
+        self.assertIndexOnly(
+            License.objects.filter(license_key__key__in=["plan-key"], product__slug__in=["prod-a"])
+            .select_related('license_key', 'product')
+        )
+        self.assertIndexOnly(Activation.objects.filter(license_id__in=[1, 2], instance_id__in=["site1.com"]))
+
+
+class LoadTestHarnessTestCase(TestCase):
+    def test_parse_mix(self):
+        self.assertEqual(loadtest.parse_mix("status=70, activate=30"), {'status': 70, 'activate': 30})
+        for mix in ("status=70,unknown=30", "status=abc", "status=-1", "status=0"):
+            with self.assertRaises(ValueError):
+                loadtest.parse_mix(mix)
+
+    def test_summary_percentiles(self):
+        samples = {'status': [(ms / 1000, ms != 100) for ms in range(1, 101)]}
+        report = loadtest.summarize(samples, elapsed=2)
+        self.assertEqual(report['operations']['status'], {
+            'requests': 100, 'errors': 1, 'throughput': 50.0,
+            'p50_ms': 50.0, 'p95_ms': 95.0, 'p99_ms': 99.0,
+        })
+
+    def test_baseline_comparison(self):
+        baseline = loadtest.summarize({'status': [(0.010, True)] * 100}, elapsed=1)
+        same = loadtest.summarize({'status': [(0.0105, True)] * 100}, elapsed=1)
+        slower = loadtest.summarize({'status': [(0.020, True)] * 50}, elapsed=1)
+        self.assertEqual(loadtest.compare_to_baseline(same, baseline, tolerance=0.1), [])
+        regressions = loadtest.compare_to_baseline(slower, baseline, tolerance=0.1)
+        self.assertIn("status p99_ms: 10.0 -> 20.0", regressions)
+        self.assertIn("status throughput: 100.0 -> 50.0 req/s", regressions)
+
+
+@override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}})
+class LoadTestLiveServerTestCase(LiveServerTestCase):
+    databases = '__all__'
+
+    def test_short_run_against_live_server(self):
+        User.objects.create_superuser(username='admin', password='password123', email='admin@test.com')
+        brand = Brand.objects.create(name="Brand One", slug="brand-one")
+        Product.objects.create(brand=brand, name="Product A", slug="prod-a")
+
+        token = loadtest.obtain_token(self.live_server_url, 'admin', 'password123')
+        run = loadtest.LoadTest(
+            self.live_server_url, token, 'brand-one', 'prod-a', loadtest.parse_mix(loadtest.DEFAULT_MIX),
+            # The live server shares one in-memory SQLite connection across threads
+            concurrency=1 if connection.vendor == 'sqlite' else 4, duration=0.5, keys=3, seed=1
+        )
+        report = run.run()
+
+        self.assertGreater(report['requests'], 0)
+        self.assertEqual(sum(op['errors'] for op in report['operations'].values()), 0, report)
+        self.assertEqual(len(sharding.scatter(LicenseKey.objects.filter(customer_email__startswith=f'load-{run.run_id}'))),
+                         3 + report['operations'].get('provision', {}).get('requests', 0))
+
+
+class SyntheticDataTestCase(TestCase):
+    databases = '__all__'
+
+    def _generate(self, seed=7, **options):
+        call_command('generate_data', brands=5, products_per_brand=3, keys=500, chunk_size=200, seed=seed,
+                     stdout=io.StringIO(), stderr=io.StringIO(), **options)
+        return sorted(sharding.scatter(
+            LicenseKey.objects.values_list('key', 'customer_email', 'brand__slug', 'created_at')
+        ))
+
+    def test_generates_consistent_skewed_data(self):
+        self._generate()
+        databases = sharding.shard_databases()
+        self.assertEqual(sum(LicenseKey.objects.using(db).count() for db in databases), 500)
+        self.assertGreaterEqual(sum(License.objects.using(db).count() for db in databases), 500)
+        for db in databases:
+            # Every shard holds the brands and products its keys point at
+            self.assertEqual(Product.objects.using(db).count(), 15)
+            for key in LicenseKey.objects.using(db).values_list('key', flat=True):
+                self.assertEqual(sharding.shard_for_key(key), db)
+
+            seat_counts = License.objects.using(db).annotate(actual=Count('activations'))
+            self.assertFalse(seat_counts.exclude(active_seats=F('actual')).exists())
+            self.assertFalse(License.objects.using(db).filter(active_seats__gt=F('total_seats')).exists())
+
+        brand_sizes = Counter()
+        for db in databases:
+            brand_sizes.update(dict(Brand.objects.using(db).annotate(keys=Count('license_keys')).values_list('slug', 'keys')))
+        brand_sizes = sorted(brand_sizes.values())
+        self.assertGreater(brand_sizes[-1], 2 * brand_sizes[0])
+
+        # Sequences continue after the explicit ids
+        brand = Brand.objects.create(name="After", slug="after")
+        self.assertGreater(brand.id, Brand.objects.exclude(pk=brand.pk).aggregate(top=Max('id'))['top'])
+        # New keys are registered with the key filter
+        self.assertTrue(license_key_filter.might_exist(sharding.scatter(LicenseKey.objects.all())[-1].key))
+
+    def test_output_is_determined_by_seed(self):
+        first = self._generate()
+        Brand.objects.all().delete()
+        self.assertEqual(self._generate(), first)
+        with self.assertRaises(CommandError):
+            self._generate()
+
+    def test_timestamps_are_relative_to_epoch(self):
+        keys = self._generate(epoch='2024-06-30T12:00:00+00:00')
+        newest = max(created_at for *_, created_at in keys)
+        self.assertLessEqual(newest, datetime(2024, 6, 30, 12, tzinfo=dt_timezone.utc))
+        self.assertGreater(newest, datetime(2024, 6, 1, tzinfo=dt_timezone.utc))
+        with self.assertRaises(CommandError):
+            self._generate(seed=8, epoch='yesterday')
+
+
+class MetricsTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        license_status_cache.clear_local()
+        brand = Brand.objects.create(name="Brand One", slug="brand-one")
+        self.product = Product.objects.create(brand=brand, name="Product A", slug="prod-a")
+        self.lk = LicenseKey.objects.create(key="metrics-key", brand=brand, customer_email="m@test.com")
+        self.license = License.objects.create(license_key=self.lk, product=self.product, total_seats=1)
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_request_latency_status_and_queries_per_route(self):
+        route = 'api/status/<str:key>/'
+        requests_before = self.sample('license_http_requests_total', method='GET', route=route, status='200')
+        latency_before = self.sample('license_http_request_duration_seconds_count', method='GET', route=route)
+        queries_before = self.sample('license_db_queries_per_request_sum', route=route)
+
+        self.client.get(reverse('license-status', kwargs={'key': 'metrics-key'}))
+
+        self.assertEqual(self.sample('license_http_requests_total', method='GET', route=route, status='200'),
+                         requests_before + 1)
+        self.assertEqual(self.sample('license_http_request_duration_seconds_count', method='GET', route=route),
+                         latency_before + 1)
+        self.assertGreater(self.sample('license_db_queries_per_request_sum', route=route), queries_before)
+
+    def test_queries_are_counted_on_every_database(self):
+        timer = metrics.QueryTimer()
+        with metrics.execute_wrapper_everywhere(timer):
+            # Shards and replicas included
+            for alias in connections:
+                self.assertIn(timer, connections[alias].execute_wrappers)
+        self.assertTrue(all(timer not in connections[alias].execute_wrappers for alias in connections))
+
+    def test_status_cache_lookups(self):
+        misses = self.sample('license_status_cache_lookups_total', result='miss')
+        local_hits = self.sample('license_status_cache_lookups_total', result='local_hit')
+        url = reverse('license-status', kwargs={'key': 'metrics-key'})
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(self.sample('license_status_cache_lookups_total', result='miss'), misses + 1)
+        self.assertEqual(self.sample('license_status_cache_lookups_total', result='local_hit'), local_hits + 1)
+
+    def test_activation_outcomes(self):
+        before = {
+            outcome: self.sample('license_activations_total', outcome=outcome)
+            for outcome in ('created', 'idempotent', 'seat_limit', 'inactive', 'not_found')
+        }
+        url = reverse('activate-license')
+        payload = {'license_key': 'metrics-key', 'product_slug': 'prod-a', 'instance_id': 'a.com'}
+        self.client.post(url, payload)
+        self.client.post(url, payload)
+        self.client.post(url, {**payload, 'instance_id': 'b.com'})
+        self.client.post(url, {**payload, 'license_key': 'unknown-key'})
+        License.objects.filter(pk=self.license.pk).update(status='SUSPENDED')
+        self.client.post(url, payload)
+
+        for outcome in before:
+            self.assertEqual(self.sample('license_activations_total', outcome=outcome), before[outcome] + 1, outcome)
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('license-status', kwargs={'key': 'metrics-key'}))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('text/plain', response['Content-Type'])
+        self.assertIn(b'license_http_request_duration_seconds_bucket', response.content)
+        self.assertNotIn(b'metrics-key', response.content)
+
+
+@override_settings(REQUEST_PROFILER={'ENABLED': True, 'SAMPLE_RATE': 0, 'HEADER_TOKEN': 'secret', 'INTERVAL': 0.0005})
+class RequestProfilerTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        profile_buffer.clear()
+        license_status_cache.clear_local()
+        cache.clear()
+        brand = Brand.objects.create(name="Brand One", slug="brand-one")
+        product = Product.objects.create(brand=brand, name="Product A", slug="prod-a")
+        lk = LicenseKey.objects.create(key="profiled-key", brand=brand, customer_email="p@test.com")
+        License.objects.create(license_key=lk, product=product)
+        self.url = reverse('license-status', kwargs={'key': 'profiled-key'})
+
+    def test_only_sampled_or_flagged_requests_are_profiled(self):
+        self.client.get(self.url)
+        self.client.get(self.url, HTTP_X_PROFILE='wrong')
+        self.assertEqual(profile_buffer.all(), [])
+
+        license_status_cache.invalidate(['profiled-key'])
+        self.client.get(self.url, HTTP_X_PROFILE='secret')
+        profile, = profile_buffer.all()
+        self.assertEqual((profile['method'], profile['route'], profile['status']),
+                         ('GET', 'api/status/<str:key>/', 200))
+        self.assertTrue(profile['queries'])
+        self.assertTrue(any('api_licensekey' in query['sql'] for query in profile['queries']))
+        self.assertEqual(set(profile['phases_ms']), {'authentication', 'view', 'serializer', 'sql', 'cache'})
+        for stack in profile['stacks']:
+            self.assertTrue(stack.startswith('GET api/status/<str:key>/'))
+
+    def test_disabled_profiler_is_removed(self):
+        with override_settings(REQUEST_PROFILER={'ENABLED': False, 'HEADER_TOKEN': 'secret'}):
+            self.client.get(self.url, HTTP_X_PROFILE='secret')
+        self.assertEqual(profile_buffer.all(), [])
+
+    def test_duplicate_query_detection(self):
+        trace = profiling.QueryTrace()
+        execute = lambda sql, params, many, context: None
+        context = {'connection': connection}
+        for params in ([1], [1], [2]):
+            trace(execute, "SELECT * FROM api_license WHERE id = %s", params, False, context)
+        trace(execute, "SELECT 1", None, False, context)
+        # The same query on another shard is a scatter, not a duplicate
+        trace(execute, "SELECT 1", None, False, {'connection': mock.Mock(alias='shard_1')})
+        summary = trace.summary()
+        self.assertEqual(summary['duplicate_queries'], 1)
+        self.assertEqual(summary['repeated_statements'], 2)
+        self.assertEqual([query['duplicate'] for query in summary['queries']], [True, True, False, False, False])
+        self.assertEqual(summary['queries'][-1]['database'], 'shard_1')
+
+    def test_phase_attribution(self):
+        self.assertEqual(profiling.frame_phase('django.db.backends.sqlite3.base'), 'sql')
+        self.assertEqual(profiling.frame_phase('django.core.cache.backends.locmem'), 'cache')
+        self.assertEqual(profiling.frame_phase('api.serializers'), 'serializer')
+        self.assertEqual(profiling.frame_phase('rest_framework_simplejwt.authentication'), 'authentication')
+        self.assertIsNone(profiling.frame_phase('api.views'))
+
+    def test_admin_page_and_folded_download(self):
+        profile_buffer.add({
+            'id': 'abc', 'started_at': timezone.now(), 'method': 'GET', 'path': '/api/status/x/',
+            'route': 'api/status/<str:key>/', 'status': 200, 'duration_ms': 3.0, 'samples': 3,
+            'phases_ms': dict.fromkeys(profiling.PHASES, 1.0), 'queries': [], 'duplicate_queries': 0,
+            'repeated_statements': 0, 'stacks': {'GET api/status/<str:key>/;api.views:LicenseStatusView.get': 3},
+        })
+        url = reverse('request-profiles')
+        self.assertEqual(self.client.get(url).status_code, 302)  # Login required
+
+        User.objects.create_superuser(username='admin', password='password123', email='admin@test.com')
+        self.client.login(username='admin', password='password123')
+        self.assertContains(self.client.get(url), '/api/status/x/')
+        self.assertContains(self.client.get(url, {'id': 'abc'}), 'Time by phase')
+        self.assertEqual(self.client.get(url, {'id': 'missing'}).status_code, 404)
+        download = self.client.get(url, {'download': 'folded'})
+        self.assertEqual(download.content, b'GET api/status/<str:key>/;api.views:LicenseStatusView.get 3\n')
+
+
+@override_settings(ACTIVATION_HEARTBEAT={'FLUSH_INTERVAL': 3600, 'MAX_PENDING': 100, 'STALE_AFTER': 86400})
+class ActivationHeartbeatTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        license_status_cache.clear_local()
+        heartbeats.heartbeat_buffer.flush()
+        brand = Brand.objects.create(name="Brand One", slug="brand-one")
+        self.product = Product.objects.create(brand=brand, name="Product A", slug="prod-a")
+        self.lk = LicenseKey.objects.create(key="beat-key", brand=brand, customer_email="b@test.com")
+        self.license = License.objects.create(license_key=self.lk, product=self.product, total_seats=3)
+        self.activation, _ = self.license.activate('site1.com')
+        self.url = reverse('activation-heartbeat')
+        self.payload = {'license_key': 'beat-key', 'product_slug': 'prod-a', 'instance_id': 'site1.com'}
+
+    def test_heartbeats_are_coalesced_into_batched_updates(self):
+        long_ago = timezone.now() - timedelta(days=3)
+        Activation.objects.filter(pk=self.activation.pk).update(last_seen_at=long_ago)
+
+        self.client.get(reverse('license-status', kwargs={'key': 'beat-key'}))
+        with self.assertNumQueries(0):
+            for _ in range(50):
+                response = self.client.post(self.url, self.payload, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.activation.refresh_from_db()
+        self.assertEqual(self.activation.last_seen_at, long_ago)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(heartbeats.heartbeat_buffer.flush(), 1)
+        self.activation.refresh_from_db()
+        self.assertGreater(self.activation.last_seen_at, timezone.now() - timedelta(minutes=2))
+
+    def test_flushes_when_buffer_is_full(self):
+        with override_settings(ACTIVATION_HEARTBEAT={'FLUSH_INTERVAL': 3600, 'MAX_PENDING': 1}):
+            Activation.objects.filter(pk=self.activation.pk).update(last_seen_at=timezone.now() - timedelta(days=3))
+            self.client.get(reverse('license-status', kwargs={'key': 'beat-key'}))
+            with quiet_heartbeat_buffer() as buffer:
+                with self.assertNumQueries(0):
+                    self.client.post(self.url, self.payload, content_type='application/json')
+                # The request only wakes the flusher thread, which writes them
+                self.assertTrue(buffer._wake.is_set())
+                self.assertEqual(buffer.flush_if_due(), 1)
+        self.activation.refresh_from_db()
+        self.assertGreater(self.activation.last_seen_at, timezone.now() - timedelta(minutes=2))
+
+    def test_failed_flush_keeps_heartbeats(self):
+        Activation.objects.filter(pk=self.activation.pk).update(last_seen_at=timezone.now() - timedelta(days=3))
+        self.client.get(reverse('license-status', kwargs={'key': 'beat-key'}))
+        with quiet_heartbeat_buffer() as buffer:
+            self.client.post(self.url, self.payload, content_type='application/json')
+        with mock.patch.object(heartbeats.Activation.objects, 'filter', side_effect=DatabaseError("down")):
+            with self.assertRaises(DatabaseError):
+                buffer.flush()
+        self.assertEqual(buffer.stats()['pending'], 1)
+        self.assertEqual(buffer.flush(), 1)
+        self.activation.refresh_from_db()
+        self.assertGreater(self.activation.last_seen_at, timezone.now() - timedelta(minutes=2))
+
+    def test_quiet_buffer_is_flushed_in_the_background(self):
+        Activation.objects.filter(pk=self.activation.pk).update(last_seen_at=timezone.now() - timedelta(days=3))
+        with mock.patch.object(heartbeats.HeartbeatBuffer, '_start_flusher'):
+            self.client.post(self.url, self.payload, content_type='application/json')
+        # No further ping arrives; the flusher thread checks the buffer every FLUSHER_TICK
+        self.assertEqual(heartbeats.heartbeat_buffer.flush_if_due(), 0)
+        with mock.patch.object(heartbeats.time, 'monotonic', return_value=time.monotonic() + 3600):
+            self.assertEqual(heartbeats.heartbeat_buffer.flush_if_due(), 1)
+        self.activation.refresh_from_db()
+        self.assertGreater(self.activation.last_seen_at, timezone.now() - timedelta(minutes=2))
+
+    def test_flusher_thread_runs_once_per_process(self):
+        buffer = heartbeats.HeartbeatBuffer()
+        with mock.patch.object(heartbeats.threading, 'Thread') as thread:
+            buffer.record(1)
+            buffer.record(2)
+        thread.assert_called_once_with(target=buffer._run_flusher, name='heartbeat-flusher', daemon=True)
+
+    def test_unknown_instance_and_inactive_license(self):
+        response = self.client.post(self.url, {**self.payload, 'instance_id': 'other.com'}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(self.url, {**self.payload, 'license_key': 'nope'}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.license.status = 'SUSPENDED'
+        self.license.save()
+        response = self.client.post(self.url, self.payload, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_reclaims_stale_seats(self):
+        self.license.activate('site2.com')
+        self.license.activate('site3.com')
+        other = License.objects.create(license_key=self.lk, product=Product.objects.create(
+            brand=self.product.brand, name="Product B", slug="prod-b"))
+        other.activate('site1.com')
+        self.client.get(reverse('license-status', kwargs={'key': 'beat-key'}))  # cached
+        Activation.objects.exclude(instance_id='site3.com').update(last_seen_at=timezone.now() - timedelta(days=2))
+
+        out = io.StringIO()
+        call_command('reclaim_stale_seats', '--dry-run', stdout=out)
+        self.assertIn("Found 3 activation(s)", out.getvalue())
+        self.assertEqual(Activation.objects.count(), 4)
+
+        call_command('reclaim_stale_seats', '--batch-size', '2', stdout=io.StringIO())
+        self.assertEqual(list(Activation.objects.values_list('instance_id', flat=True)), ['site3.com'])
+        self.license.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.license.active_seats, other.active_seats), (1, 0))
+        # Cached status no longer lists the reclaimed installs
+        data = self.client.get(reverse('license-status', kwargs={'key': 'beat-key'})).data
+        self.assertEqual(sum(len(license_data['activations']) for license_data in data['licenses']), 1)
+        # The reclaimed install gets a 404 and can activate again
+        response = self.client.post(self.url, self.payload, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class LicenseExpiryTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        license_status_cache.clear_local()
+        self.user = User.objects.create_superuser(username='admin', password='password123', email='admin@test.com')
+        self.brand = Brand.objects.create(name="Brand One", slug="brand-one")
+        now = timezone.now()
+        self.licenses = {}
+        for name, license_status, expires_at in (
+            ('current', 'VALID', now + timedelta(days=30)),
+            ('perpetual', 'VALID', None),
+            ('lapsed', 'VALID', now - timedelta(days=1)),
+            ('suspended', 'SUSPENDED', now + timedelta(days=30)),
+        ):
+            product = Product.objects.create(brand=self.brand, name=name, slug=name)
+            lk = LicenseKey.objects.create(key=f"{name}-key", brand=self.brand, customer_email="c@test.com")
+            self.licenses[name] = License.objects.create(
+                license_key=lk, product=product, status=license_status, expires_at=expires_at
+            )
+
+    def test_active_queryset_matches_is_active(self):
+        active = set(sharding.scatter(License.objects.active().values_list('product__slug', flat=True)))
+        self.assertEqual(active, {'current', 'perpetual'})
+        self.assertEqual(active, {obj.product.slug for obj in sharding.scatter(License.objects.all()) if obj.is_active()})
+        self.assertEqual(set(sharding.scatter(License.objects.inactive().values_list('product__slug', flat=True))),
+                         {'lapsed', 'suspended'})
+
+    def test_sweeper_expires_lapsed_licenses_and_invalidates_status(self):
+        url = reverse('license-status', kwargs={'key': 'lapsed-key'})
+        self.assertEqual(self.client.get(url).data['licenses'][0]['status'], 'VALID')
+
+        out = io.StringIO()
+        call_command('expire_licenses', '--dry-run', stdout=out)
+        self.assertIn("Found 1 license(s)", out.getvalue())
+        self.assertEqual(len(sharding.scatter(License.objects.filter(status='EXPIRED'))), 0)
+
+        shard = sharding.shard_for_key('lapsed-key') or DEFAULT_DB_ALIAS
+        with CaptureQueriesContext(connections[shard]) as queries:
+            call_command('expire_licenses', stdout=io.StringIO())
+        self.assertEqual(sum(query['sql'].startswith('UPDATE') for query in queries.captured_queries), 1)
+        self.assertEqual(
+            dict(sharding.scatter(License.objects.values_list('product__slug', 'status'))),
+            {'current': 'VALID', 'perpetual': 'VALID', 'lapsed': 'EXPIRED', 'suspended': 'SUSPENDED'}
+        )
+        self.assertEqual(self.client.get(url).data['licenses'][0]['status'], 'EXPIRED')
+
+    def test_active_only_lookups_and_exports(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(reverse('customer-license-list'), {'email': 'c@test.com', 'active': 'true'})
+        slugs = {license_data['product_slug'] for key in response.data['results'] for license_data in key['licenses']}
+        self.assertEqual(slugs, {'current', 'perpetual'})
+
+        response = client.get(reverse('brand-license-export', kwargs={'slug': 'brand-one'}), {'active': 'true'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual({row['product_slug'] for row in rows}, {'current', 'perpetual'})
+        self.assertEqual({row['license_key'] for row in rows}, {'current-key', 'perpetual-key'})
+
+
+# Read replicas only serve `default`: the shards' data is not routed to them
+@override_settings(READ_REPLICAS={'ALIASES': ['replica'], 'STICKY_SECONDS': 30, 'MAX_LAG': 5}, SHARDING={'ALIASES': []})
+class ReplicaRoutingTestCase(TestCase):
+    """
+    The test database has no replica alias, so the router's choice is recorded
+    while every query still runs on the primary.
+    """
+
+    def setUp(self):
+        cache.clear()
+        license_status_cache.clear_local()
+        routing.replica_lag_monitor.reset()
+        self.user = User.objects.create_superuser(username='admin', password='password123', email='admin@test.com')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        brand = Brand.objects.create(name="Brand One", slug="brand-one")
+        self.product = Product.objects.create(brand=brand, name="Product A", slug="prod-a")
+        lk = LicenseKey.objects.create(key="replica-key", brand=brand, customer_email="r@test.com")
+        License.objects.create(license_key=lk, product=self.product, total_seats=5)
+        cache.clear()  # Drop the pins left by creating the fixtures
+
+        self.chosen = []
+        real_read = routing.ReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            self.chosen.append(real_read(router, model, **hints))
+            return None
+        patcher = mock.patch.object(routing.ReplicaRouter, 'db_for_read', record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        lag_patcher = mock.patch.object(routing.replica_lag_monitor, 'measure', return_value=0.5)
+        self.measure = lag_patcher.start()
+        self.addCleanup(lag_patcher.stop)
+
+    def status(self):
+        license_status_cache.clear_local()
+        cache.delete(license_status_cache.make_key('replica-key'))
+        self.chosen.clear()
+        self.client.get(reverse('license-status', kwargs={'key': 'replica-key'}))
+        return set(self.chosen)
+
+    def test_reads_of_listed_views_go_to_a_replica(self):
+        self.assertEqual(self.status(), {'replica'})
+        self.chosen.clear()
+        self.api.get(reverse('brand-list'))
+        self.assertEqual(set(self.chosen), {'replica'})
+
+        # Other views and code outside a request read from the primary
+        self.chosen.clear()
+        self.api.get(reverse('brand-license-export', kwargs={'slug': 'brand-one'}))
+        list(Brand.objects.all())
+        self.assertEqual(set(self.chosen), {None})
+
+    def test_written_license_key_reads_from_primary(self):
+        payload = {'license_key': 'replica-key', 'product_slug': 'prod-a', 'instance_id': 'site1.com'}
+        self.client.post(reverse('activate-license'), payload)
+        # Pinned by key, not just for the activating client
+        self.assertTrue(cache.get(routing.pin_key('ip_127.0.0.1')))
+        cache.delete(routing.pin_key('ip_127.0.0.1'))
+        self.assertEqual(self.status(), {None})
+
+        # Once the pin expires, the replica serves the key again
+        cache.delete(routing.pin_key('license_key_replica-key'))
+        self.assertEqual(self.status(), {'replica'})
+
+    def test_writing_client_reads_its_own_writes(self):
+        self.api.post(reverse('brand-list'), {'name': 'Brand Two', 'slug': 'brand-two'})
+        self.chosen.clear()
+        self.api.get(reverse('brand-list'))
+        self.assertEqual(set(self.chosen), {None})
+
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(username='other', password='x', is_staff=True))
+        self.chosen.clear()
+        other.get(reverse('brand-list'))
+        self.assertEqual(set(self.chosen), {'replica'})
+
+    def test_lagging_or_unreachable_replica_falls_back_to_primary(self):
+        self.measure.return_value = 30
+        self.assertEqual(self.status(), {None})
+        routing.replica_lag_monitor.reset()
+        self.measure.return_value = None
+        self.assertEqual(self.status(), {None})
+
+        # Lag is re-measured only once per LAG_CHECK_INTERVAL
+        routing.replica_lag_monitor.reset()
+        self.measure.return_value = 0
+        self.status()
+        self.status()
+        self.assertEqual(self.measure.call_count, 3)
+
+
+class ConnectionPoolingTestCase(TestCase):
+    def setUp(self):
+        # A second connection, so opening, releasing and closing it does not disturb
+        # the test transaction. SQLite ignores closing the in-memory test database,
+        # so it gets a database file instead.
+        settings_dict = dict(connection.settings_dict)
+        if connection.vendor == 'sqlite':
+            settings_dict['NAME'] = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False).name
+            self.addCleanup(os.unlink, settings_dict['NAME'])
+        self.wrapper = type(connections[DEFAULT_DB_ALIAS])(settings_dict, DEFAULT_DB_ALIAS)
+        self.addCleanup(self.wrapper.close)
+        pooling.connection_stats.reset()
+
+    def query(self):
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+
+    def stats(self):
+        return pooling.connection_stats.snapshot()[DEFAULT_DB_ALIAS]
+
+    def test_connections_are_persistent_and_health_checked(self):
+        database = settings.DATABASES[DEFAULT_DB_ALIAS]
+        self.assertTrue(database['ENGINE'].startswith('api.db_backends.'))
+        self.assertTrue(database['CONN_HEALTH_CHECKS'])
+        self.assertIn(pooling.connection_mode(database), ('persistent', 'pool'))
+
+    def test_connection_is_reused_across_requests(self):
+        open_before = self.stats()['open']
+        self.query()
+        self.query()
+        stats = self.stats()
+        self.assertEqual((stats['opened'], stats['checkouts'], stats['reused']), (1, 1, 0))
+        self.assertEqual(stats['open'], open_before + 1)
+        self.assertGreater(stats['wait_ms']['max'], 0)
+
+        # End of request: the connection stays open, idle, and serves the next request
+        in_use = stats['in_use']
+        self.wrapper.close_if_unusable_or_obsolete()
+        self.assertEqual(self.stats()['in_use'], in_use - 1)
+        self.query()
+        stats = self.stats()
+        self.assertEqual((stats['opened'], stats['checkouts'], stats['reused']), (1, 2, 1))
+
+        self.wrapper.close()
+        stats = self.stats()
+        self.assertEqual((stats['open'], stats['closed']), (open_before, 1))
+
+    def test_broken_connection_is_replaced_on_checkout(self):
+        self.query()
+        self.wrapper.close_if_unusable_or_obsolete()
+        with mock.patch.object(self.wrapper, 'is_usable', return_value=False):
+            self.query()
+        stats = self.stats()
+        self.assertEqual((stats['health_check_failures'], stats['opened'], stats['closed']), (1, 2, 1))
+
+    def test_stats_endpoint(self):
+        url = reverse('database-stats')
+        api = APIClient()
+        api.force_authenticate(User.objects.create_user(username='user', password='x'))
+        self.assertEqual(api.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        api.force_authenticate(User.objects.create_superuser(username='admin', password='x', email='a@test.com'))
+        response = api.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        default = response.data['connections'][DEFAULT_DB_ALIAS]
+        self.assertGreaterEqual(default['in_use'], 1)
+        self.assertEqual(default['open'], default['in_use'] + default['idle'])
+        if connection.vendor == 'postgresql':
+            self.assertGreater(response.data['servers'][DEFAULT_DB_ALIAS]['max_connections'], 0)
+        self.assertIn('license_db_connection_wait_seconds', api.get('/metrics').content.decode())
+
+
+class ServiceTokenTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        service_tokens.revoked_service_tokens.clear_local()
+        self.brand = Brand.objects.create(name="Brand One", slug="brand-one")
+        Product.objects.create(brand=self.brand, name="Product A", slug="prod-a")
+        other = Brand.objects.create(name="Brand Two", slug="brand-two")
+        Product.objects.create(brand=other, name="Product B", slug="prod-b")
+        self.record, token = service_tokens.issue_service_token(self.brand, service_tokens.SCOPES, 'billing sync')
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def provision(self, brand_slug='brand-one', product_slug='prod-a', api=None):
+        return (api or self.api).post(reverse('provision-license'), {
+            'brand_slug': brand_slug, 'product_slug': product_slug,
+            'customer_email': 'c@test.com', 'total_seats': 2, 'expiration_days': 30,
+        })
+
+    def test_provisions_for_its_brand_without_loading_a_user(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.provision()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse([q for q in queries.captured_queries if 'auth_user' in q['sql']])
+
+        # Only the revocation list is read, and only once per LOCAL_TIMEOUT
+        with CaptureQueriesContext(connection) as queries:
+            self.provision()
+        self.assertFalse([q for q in queries.captured_queries if 'servicetoken' in q['sql']])
+
+    def test_brand_scope_is_enforced(self):
+        self.assertEqual(self.provision('brand-two', 'prod-b').status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(LicenseKey.objects.filter(brand__slug='brand-two').exists())
+
+        rows = [
+            {'brand_slug': 'brand-one', 'product_slug': 'prod-a', 'customer_email': 'a@test.com',
+             'total_seats': 1, 'expiration_days': 30},
+            {'brand_slug': 'brand-two', 'product_slug': 'prod-b', 'customer_email': 'b@test.com',
+             'total_seats': 1, 'expiration_days': 30},
+        ]
+        results = self.api.post(reverse('bulk-provision-license'), rows, format='json').data['results']
+        self.assertEqual([result['status'] for result in results], ['created', 'error'])
+        self.assertEqual(results[1]['code'], 'forbidden')
+
+        export = reverse('brand-license-export', kwargs={'slug': 'brand-two'})
+        self.assertEqual(self.api.get(export).status_code, status.HTTP_403_FORBIDDEN)
+
+        # Customer lookup only shows the token's brand
+        LicenseKey.objects.create(brand=Brand.objects.get(slug='brand-two'), customer_email='a@test.com')
+        response = self.api.get(reverse('customer-license-list'), {'email': 'a@test.com'})
+        self.assertEqual([key['brand_name'] for key in response.data['results']], ['Brand One'])
+
+    def test_scopes_limit_endpoints(self):
+        _, token = service_tokens.issue_service_token(self.brand, ['licenses:read'], 'reporting')
+        reader = APIClient()
+        reader.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(self.provision(api=reader).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(reader.get(reverse('customer-license-list')).status_code, status.HTTP_200_OK)
+        # Views without a service_token_scope reject service tokens altogether
+        self.assertEqual(self.api.get(reverse('brand-list')).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.api.get(reverse('cache-stats')).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_revoked_or_tampered_tokens_are_rejected(self):
+        self.assertEqual(self.provision().status_code, status.HTTP_201_CREATED)
+        call_command('revoke_service_token', self.record.jti, stdout=io.StringIO())
+        self.assertEqual(self.provision().status_code, status.HTTP_401_UNAUTHORIZED)
+
+        _, token = service_tokens.issue_service_token(self.brand, service_tokens.SCOPES, 'other')
+        header, payload, signature = token.split('.')
+        tampered = APIClient()
+        tampered.credentials(HTTP_AUTHORIZATION=f'Bearer {header}.{payload}.{signature[::-1]}')
+        self.assertEqual(self.provision(api=tampered).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_issue_command(self):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('issue_service_token', 'brand-one', '--name', 'crm', '--scope', 'licenses:read',
+                     stdout=out, stderr=err)
+        token = out.getvalue().strip()
+        record = ServiceToken.objects.get(name='crm')
+        self.assertIn(record.jti, err.getvalue())
+        self.assertEqual(record.scopes, ['licenses:read'])
+        claims = jwt.decode(token, options={'verify_signature': False})
+        self.assertEqual((claims['brand'], claims['jti']), ('brand-one', record.jti))
+
+        with self.assertRaises(CommandError):
+            call_command('issue_service_token', 'missing', '--name', 'x')
+
+
+class ConditionalStatusTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        license_status_cache.clear_local()
+        brand = Brand.objects.create(name="Brand One", slug="brand-one")
+        Product.objects.create(brand=brand, name="Product A", slug="prod-a")
+        lk = LicenseKey.objects.create(key="etag-key", brand=brand, customer_email="e@test.com")
+        License.objects.create(license_key=lk, product=Product.objects.get(slug='prod-a'), total_seats=5)
+        self.url = reverse('license-status', kwargs={'key': 'etag-key'})
+
+    def test_unchanged_status_is_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=5')
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual((response.content, response['ETag']), (b'', etag))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"other", W/{etag}').status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+
+        # Served from the status cache, the payload keeps the ETag it was cached with
+        self.assertEqual(self.client.get(self.url)['ETag'], etag)
+
+    def test_changes_retire_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.post(reverse('activate-license'),
+                         {'license_key': 'etag-key', 'product_slug': 'prod-a', 'instance_id': 'site1.com'})
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['licenses'][0]['active_seats'], 1)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # An evicted version is replaced, never reissued
+        etag = response['ETag']
+        cache.clear()
+        license_status_cache.clear_local()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    @override_settings(LICENSE_KEY_FILTER={**settings.LICENSE_KEY_FILTER, 'ENABLED': True})
+    def test_unknown_keys_get_no_version(self):
+        url = reverse('license-status', kwargs={'key': 'unknown-key'})
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='*').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIsNone(cache.get(license_status_cache.make_version_key('unknown-key')))
+
+    async def test_async_view_answers_not_modified(self):
+        url = reverse('async-license-status', args=['etag-key'])
+        response = await self.async_client.get(url)
+        etag = response['ETag']
+        sync_response = await sync_to_async(self.client.get)(self.url)
+        self.assertEqual(sync_response['ETag'], etag)
+
+        response = await self.async_client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=5')
+
+
+class LicenseVerdictTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        license_status_cache.clear_local()
+        verdict_store.local.clear()
+        brand = Brand.objects.create(name="Brand One", slug="brand-one")
+        self.product = Product.objects.create(brand=brand, name="Product A", slug="prod-a")
+        lk = LicenseKey.objects.create(key="verdict-key", brand=brand, customer_email="v@test.com")
+        self.license = License.objects.create(license_key=lk, product=self.product, total_seats=2)
+        self.url = reverse('license-verdict', kwargs={'key': 'verdict-key', 'product_slug': 'prod-a'})
+        self.shard = sharding.shard_for_key('verdict-key') or DEFAULT_DB_ALIAS
+
+    def test_verdict_is_computed_once_then_cached(self):
+        with self.assertNumQueries(1, using=self.shard):
+            response = self.client.get(self.url, {'instance_id': 'site1.com'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['verdict'], 'not_activated')
+        self.assertEqual((response.data['seats_remaining'], response.data['instance_id']), (2, 'site1.com'))
+
+        verdict_store.local.clear()
+        with self.assertNumQueries(0, using=self.shard):
+            response = self.client.get(self.url, {'instance_id': 'site1.com'})
+        self.assertEqual(response.data['verdict'], 'not_activated')
+        self.assertEqual(self.client.get(self.url).data['verdict'], 'valid')
+
+    def test_writes_refresh_verdicts(self):
+        with self.captureOnCommitCallbacks(using=self.shard, execute=True):
+            self.client.post(reverse('activate-license'),
+                             {'license_key': 'verdict-key', 'product_slug': 'prod-a', 'instance_id': 'site1.com'})
+        with self.assertNumQueries(0, using=self.shard):
+            instance = self.client.get(self.url, {'instance_id': 'site1.com'}).data
+            product = self.client.get(self.url).data
+        self.assertEqual((instance['verdict'], instance['seats_remaining']), ('valid', 1))
+        self.assertEqual((product['verdict'], product['active_seats']), ('valid', 1))
+
+        with self.captureOnCommitCallbacks(using=self.shard, execute=True):
+            self.license.status = 'SUSPENDED'
+            self.license.save()
+        with self.assertNumQueries(0, using=self.shard):
+            self.assertEqual(self.client.get(self.url).data['verdict'], 'inactive')
+        # Instance verdicts are refreshed by their own activation only; the rest are recomputed
+        with self.assertNumQueries(1, using=self.shard):
+            self.assertEqual(self.client.get(self.url, {'instance_id': 'site1.com'}).data['verdict'], 'inactive')
+
+    def test_outdated_verdicts_are_ignored(self):
+        self.assertEqual(self.client.get(self.url).data['total_seats'], 2)
+        # A write whose refresh never ran still retires the cached verdict
+        License.objects.using(self.shard).filter(pk=self.license.pk).update(total_seats=10)
+        license_status_cache.invalidate(['verdict-key'])
+        verdict_store.local.clear()
+        self.assertEqual(self.client.get(self.url).data['total_seats'], 10)
+
+        # So does expiry, which happens without any write
+        License.objects.using(self.shard).filter(pk=self.license.pk).update(expires_at=timezone.now() - timedelta(days=1))
+        entry = cache.get(verdict_key('verdict-key', 'prod-a'))
+        cache.set(verdict_key('verdict-key', 'prod-a'), (entry[0], entry[1], time.time() - 1))
+        verdict_store.local.clear()
+        self.assertEqual(self.client.get(self.url).data['verdict'], 'inactive')
+
+    def test_unknown_license_is_not_found(self):
+        url = reverse('license-verdict', kwargs={'key': 'verdict-key', 'product_slug': 'other'})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data['verdict'], 'not_found')
+        self.assertIsNone(cache.get(verdict_key('verdict-key', 'other')))
+
+
+class RendererTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(username='admin', password='password123', email='admin@test.com')
+        brand = Brand.objects.create(name="Brand One", slug="brand-one")
+        product = Product.objects.create(brand=brand, name="Product A", slug="prod-a")
+        lk = LicenseKey.objects.create(key="render-key", brand=brand, customer_email="r@test.com")
+        License.objects.create(license_key=lk, product=product, total_seats=5)
+
+    def test_orjson_matches_json_renderer(self):
+        data = {
+            'at': timezone.now(), 'id': uuid.uuid4(), 'price': decimal.Decimal('1.50'), 'label': gettext_lazy("Seats"),
+            'text': "caf\u00e9 \u2028", 'nested': [{'n': 1, 'ok': True, 'none': None}], 'big': 2 ** 70, 7: 'int key',
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(ORJSONRenderer().render(data, 'application/json; indent=2'),
+                         JSONRenderer().render(data, 'application/json; indent=2'))
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+
+    def test_api_uses_orjson(self):
+        response = self.client.get(reverse('license-status', kwargs={'key': 'render-key'}))
+        self.assertIsInstance(response.accepted_renderer, ORJSONRenderer)
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(reverse('provision-license'), b'{"customer_email": ', content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("JSON parse error", response.data['detail'])
+        self.assertEqual(ORJSONParser().parse(io.BytesIO('{"a": "\u00e9"}'.encode('utf-16')),
+                                              parser_context={'encoding': 'utf-16'}), {'a': '\u00e9'})
+
+    @skipUnless(msgpack, "msgpack is not installed")
+    def test_msgpack_content_negotiation(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(reverse('license-status', kwargs={'key': 'render-key'}), HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), json.loads(JSONRenderer().render(response.data)))
+
+        body = msgpack.packb([{'customer_email': 'm@test.com', 'brand_slug': 'brand-one', 'product_slug': 'prod-a'}])
+        response = client.post(reverse('bulk-provision-license'), body, content_type='application/msgpack')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 1)
+
+    def test_benchmark_command(self):
+        out = io.StringIO()
+        call_command('benchmark_renderers', keys=10, page_size=5, repeat=1, stdout=out, stderr=io.StringIO())
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0].split()[:3], ['payload', 'format', 'render_us'])
+        self.assertEqual({line.split()[1] for line in lines[1:]}, {'json', 'orjson'} | ({'msgpack'} if msgpack else set()))
+
+        LicenseKey.objects.all().delete()
+        with self.assertRaises(CommandError):
+            call_command('benchmark_renderers', stdout=io.StringIO(), stderr=io.StringIO())
+
+
+@override_settings(SHARDING={'ALIASES': []})
+class ShardRoutingTestCase(TestCase):
+    """
+    Sharding is off unless a test turns it on, and then the router's choices
+    are checked directly; no query reaches a shard.
+    """
+    ALIASES = ['default', 'shard_1', 'shard_2']
+
+    def test_shard_for_key_is_stable_and_balanced(self):
+        self.assertIsNone(sharding.shard_for_key('any-key'))
+        keys = [f"key-{index}" for index in range(3000)]
+        shards = [sharding.shard_for_key(key, self.ALIASES) for key in keys]
+        self.assertEqual(shards, [sharding.shard_for_key(key, self.ALIASES) for key in keys])
+        for alias in self.ALIASES:
+            self.assertAlmostEqual(shards.count(alias) / len(keys), 1 / 3, delta=0.05)
+        key = uuid.uuid4()
+        self.assertEqual(sharding.shard_for_key(key, self.ALIASES), sharding.shard_for_key(str(key), self.ALIASES))
+
+    def test_router(self):
+        router = sharding.ShardRouter()
+        self.assertIsNone(router.db_for_write(License))
+
+        with override_settings(SHARDING={'ALIASES': self.ALIASES}):
+            brand = Brand(pk=1, name="Brand One", slug="brand-one")
+            lk = LicenseKey(key='routed-key', brand=brand, customer_email='s@test.com')
+            # A new key goes to its own shard, though assigning the brand set _state.db
+            self.assertEqual(router.db_for_write(LicenseKey, instance=lk), sharding.shard_for_key('routed-key'))
+
+            lk._state.adding, lk._state.db = False, 'shard_2'
+            self.assertEqual(router.db_for_read(License, instance=lk), 'shard_2')
+            self.assertIsNone(router.db_for_read(License))
+            with sharding.use_shard_of('routed-key'):
+                self.assertEqual(router.db_for_read(Activation), sharding.shard_for_key('routed-key'))
+                self.assertEqual(router.db_for_read(Product), sharding.shard_for_key('routed-key'))
+                self.assertEqual(router.db_for_write(Brand), DEFAULT_DB_ALIAS)
+                self.assertIsNone(router.db_for_read(User))
+            self.assertIsNone(sharding.current_shard())
+
+            other = LicenseKey(key='other-key')
+            other._state.db = 'shard_1'
+            self.assertFalse(router.allow_relation(lk, other))
+            self.assertTrue(router.allow_migrate('shard_1', 'api', 'activation'))
+            self.assertTrue(router.allow_migrate('shard_1', 'api', 'brand'))
+            self.assertFalse(router.allow_migrate('shard_1', 'api', 'servicetoken'))
+            self.assertFalse(router.allow_migrate('shard_1', 'auth', 'user'))
+            self.assertIsNone(router.allow_migrate(DEFAULT_DB_ALIAS, 'api', 'license'))
+
+            # Data migrations run on the shards too, through their model hint
+            backfill = import_module('api.migrations.0003_license_active_seats').Migration.operations[-1]
+            self.assertTrue(router.allow_migrate('shard_1', 'api', **backfill.hints))
+
+    def test_shard_key_mixin_selects_the_key_shard(self):
+        class ProbeView(sharding.ShardKeyMixin, APIView):
+            authentication_classes = []
+            permission_classes = []
+            shard_key_kwarg = 'key'
+
+            def get(self, request, key):
+                return Response({'shard': sharding.current_shard()})
+
+        with override_settings(SHARDING={'ALIASES': self.ALIASES}):
+            response = ProbeView.as_view()(APIRequestFactory().get('/'), key='probe-key')
+            self.assertEqual(response.data['shard'], sharding.shard_for_key('probe-key'))
+            self.assertIsNone(sharding.current_shard())
+        # Without shards, the views keep the routers' choice
+        self.assertIsNone(ProbeView.as_view()(APIRequestFactory().get('/'), key='probe-key').data['shard'])
+
+    def test_reshard_needs_shards(self):
+        with self.assertRaises(CommandError):
+            call_command('reshard', stdout=io.StringIO())
+
+
+@skipUnless(len(settings.SHARDING['ALIASES']) > 1, "set DATABASE_SHARD_URLS to test against real shards")
+class ShardedStorageTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        license_status_cache.clear_local()
+        verdict_store.local.clear()
+        self.aliases = settings.SHARDING['ALIASES']
+        self.user = User.objects.create_superuser(username='admin', password='password123', email='admin@test.com')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.brand = Brand.objects.create(name="Brand One", slug="brand-one")
+        self.product = Product.objects.create(brand=self.brand, name="Product A", slug="prod-a")
+
+    def test_reference_data_is_on_every_shard(self):
+        for alias in self.aliases:
+            self.assertTrue(Product.objects.using(alias).filter(pk=self.product.pk, brand_id=self.brand.pk).exists())
+
+    def test_keys_live_on_their_shard(self):
+        rows = [{'brand_slug': 'brand-one', 'product_slug': 'prod-a', 'customer_email': f"c{index}@test.com",
+                 'license_key': f"sharded-{index}"} for index in range(20)]
+        response = self.api.post(reverse('bulk-provision-license'), rows, format='json')
+        self.assertEqual(response.data['created'], 20)
+        response = self.api.post(reverse('provision-license'), {
+            'brand_slug': 'brand-one', 'product_slug': 'prod-a', 'customer_email': 'c0@test.com', 'license_key': ''
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)  # c0's existing key, found on its shard
+
+        for index in range(20):
+            key = f"sharded-{index}"
+            self.assertEqual([alias for alias in self.aliases if LicenseKey.objects.using(alias).filter(key=key).exists()],
+                             [sharding.shard_for_key(key)])
+
+        key = 'sharded-3'
+        home = sharding.shard_for_key(key)
+        queries = {alias: CaptureQueriesContext(connections[alias]) for alias in self.aliases}
+        for context in queries.values():
+            context.__enter__()
+        response = self.client.post(reverse('activate-license'),
+                                     {'license_key': key, 'product_slug': 'prod-a', 'instance_id': 'site1.com'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(reverse('license-status', kwargs={'key': key})).status_code, status.HTTP_200_OK)
+        for alias, context in queries.items():
+            context.__exit__(None, None, None)
+            # Only the key filter, built once per process, reads the other shards
+            self.assertTrue(alias == home or all('"key"' in query['sql'] or 'COUNT' in query['sql']
+                                                 for query in context.captured_queries), alias)
+
+        response = self.api.get(reverse('customer-license-list'), {'email': 'c3@test.com'})
+        self.assertEqual([item['key'] for item in response.data['results']], [key])
+
+    def test_cursor_pages_keep_rows_sharing_an_id(self):
+        created_at = timezone.now()
+        # A key on each shard, all with the same created_at and id
+        keys = {}
+        for index in itertools.count():
+            keys.setdefault(sharding.shard_for_key(f"tie-{index}"), f"tie-{index}")
+            if len(keys) == len(self.aliases):
+                break
+        for key in keys.values():
+            lk = LicenseKey.objects.create(id=10 ** 6, key=key, brand=self.brand, customer_email='tie@test.com')
+            with sharding.use_shard_of(key):
+                LicenseKey.objects.filter(pk=lk.pk).update(created_at=created_at)
+
+        served, url = [], reverse('customer-license-list')
+        response = self.api.get(url, {'email': 'tie@test.com', 'page_size': 1})
+        while True:
+            served.extend(item['key'] for item in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.api.get(response.data['next'])
+        self.assertEqual(served, [keys[alias] for alias in self.aliases])
+
+    def test_reshard_moves_keys_to_their_shard(self):
+        with override_settings(SHARDING={'ALIASES': [DEFAULT_DB_ALIAS]}):
+            for index in range(20):
+                lk = LicenseKey.objects.create(key=f"moved-{index}", brand=self.brand, customer_email='m@test.com')
+                license_obj = License.objects.create(license_key=lk, product=self.product, total_seats=2)
+                license_obj.activate('site1.com')
+
+        out = io.StringIO()
+        call_command('reshard', stdout=out)
+        self.assertIn("Moved", out.getvalue())
+        for index in range(20):
+            key = f"moved-{index}"
+            home = sharding.shard_for_key(key)
+            license_obj = License.objects.using(home).select_related('license_key').get(license_key__key=key)
+            self.assertEqual(license_obj.active_seats, 1)
+            self.assertEqual(license_obj.activations.count(), 1)
+            if home != DEFAULT_DB_ALIAS:
+                self.assertFalse(LicenseKey.objects.filter(key=key).exists())
+        self.assertEqual(sum(LicenseKey.objects.using(alias).count() for alias in self.aliases), 20)
+
+        out = io.StringIO()
+        call_command('reshard', '--dry-run', stdout=out)
+        self.assertIn("Found 0", out.getvalue())
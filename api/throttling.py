@@ -0,0 +1,202 @@
+# Sliding-window throttling for the public license endpoints
+#
+# Views opt in with a `throttle_scope`; each throttle class derives an identity
+# (client IP, license key or brand) and looks up the rate for
+# '<scope>.<kind>' in REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], e.g.
+# 'activate.license_key': '30/min'. A scope/kind without a rate is not throttled.
+#
+# An identity may make `num` requests in any window of `period`, so clients can
+# burst up to the full rate and are then held to the average. The window is
+# made of SLOTS counters in the shared cache: a request takes its place with an
+# atomic incr() on the current slot and is admitted when the slots of the
+# window add up to at most `num`, so concurrent requests (other threads or
+# workers) can never all pass on the same reading. Once an identity is over
+# its rate it is also blocked in-process until the window has slid far enough,
+# so abusive traffic is shed without a cache round trip. Throttles run in
+# APIView.initial(), before any ORM work.
+
+import hashlib
+import threading
+import time
+
+from django.core.cache import cache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from .cache import LocalLRUCache
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+LOCAL_MAX_ENTRIES = 10000
+# Counters per window; the window slides by period / SLOTS
+SLOTS = 10
+
+
+def parse_rate(rate):
+    """'30/min' -> (requests per window, window length in seconds)."""
+    num, period = rate.split('/')
+    return int(num), PERIODS[period[0]]
+
+
+class ThrottleStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rejected = {}
+
+    def record_rejection(self, rate_key, fast_path):
+        with self._lock:
+            counts = self._rejected.setdefault(rate_key, {'rejected': 0, 'rejected_in_process': 0})
+            counts['rejected'] += 1
+            if fast_path:
+                counts['rejected_in_process'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {rate_key: dict(counts) for rate_key, counts in self._rejected.items()}
+
+
+throttle_stats = ThrottleStats()
+# Identities known to be over their rate, mapped to the time their next request fits
+blocked_locally = LocalLRUCache()
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    kind = None
+    timer = time.time
+
+    def get_identity(self, request, view):
+        """Returns the value to throttle on, or None when the request carries none."""
+        raise NotImplementedError('.get_identity() must be overridden')
+
+    def _prepare(self, request, view):
+        """Returns (rate_key, window_key, num, period) or None when the request is not throttled."""
+        scope = getattr(view, 'throttle_scope', None)
+        rate_key = f"{scope}.{self.kind}"
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(rate_key) if scope else None
+        if not rate:
+            return None
+        identity = self.get_identity(request, view)
+        if not identity:
+            return None
+        digest = hashlib.blake2b(str(identity).encode(), digest_size=16).hexdigest()
+        return (rate_key, f"throttle_{rate_key}_{digest}") + parse_rate(rate)
+
+    def _blocked_in_process(self, rate_key, window_key, now):
+        # Fast path: this process already knows the identity is over its rate
+        blocked, blocked_until = blocked_locally.get(window_key)
+        if blocked:
+            self._wait = max(0, blocked_until - now)
+            throttle_stats.record_rejection(rate_key, fast_path=True)
+        return blocked
+
+    def _window(self, window_key, period, now):
+        """(slot length, current slot, slot cache keys from the current one back) for `now`."""
+        slot_length = period / SLOTS
+        slot = int(now // slot_length)
+        return slot_length, slot, [f"{window_key}_{slot - offset}" for offset in range(SLOTS)]
+
+    def _admit(self, rate_key, window_key, num, now, slot, slot_length, taken, earlier):
+        """
+        Whether the request, `taken`-th in its slot, fits with the `earlier`
+        slots' counts (newest first). Otherwise sets the wait and blocks in-process.
+        """
+        excess = taken + sum(earlier) - num
+        if excess <= 0:
+            return True
+        # Wait until enough of the oldest requests have left the window
+        leaves_at, freed = slot, 0
+        for offset, count in enumerate(reversed(earlier)):
+            freed += count
+            if freed >= excess:
+                leaves_at = slot - (SLOTS - 1) + offset
+                break
+        self._wait = (leaves_at + SLOTS) * slot_length - now
+        blocked_locally.set(window_key, now + self._wait, self._wait, LOCAL_MAX_ENTRIES)
+        throttle_stats.record_rejection(rate_key, fast_path=False)
+        return False
+
+    def allow_request(self, request, view):
+        self._wait = None
+        prepared = self._prepare(request, view)
+        if prepared is None:
+            return True
+        rate_key, window_key, num, period = prepared
+        now = self.timer()
+        if self._blocked_in_process(rate_key, window_key, now):
+            return False
+
+        slot_length, slot, keys = self._window(window_key, period, now)
+        try:
+            taken = cache.incr(keys[0])
+        except ValueError:
+            # First request of the slot; a concurrent one may create it first
+            taken = 1 if cache.add(keys[0], 1, int(period + slot_length) + 1) else cache.incr(keys[0])
+        counts = cache.get_many(keys[1:])
+        if self._admit(rate_key, window_key, num, now, slot, slot_length, taken,
+                       [counts.get(key, 0) for key in keys[1:]]):
+            return True
+        try:
+            # A rejected request does not use up the window
+            cache.decr(keys[0])
+        except ValueError:
+            pass
+        return False
+
+    async def aallow_request(self, request, view):
+        """allow_request() for async views, using the async cache API."""
+        self._wait = None
+        prepared = self._prepare(request, view)
+        if prepared is None:
+            return True
+        rate_key, window_key, num, period = prepared
+        now = self.timer()
+        if self._blocked_in_process(rate_key, window_key, now):
+            return False
+
+        slot_length, slot, keys = self._window(window_key, period, now)
+        try:
+            taken = await cache.aincr(keys[0])
+        except ValueError:
+            added = await cache.aadd(keys[0], 1, int(period + slot_length) + 1)
+            taken = 1 if added else await cache.aincr(keys[0])
+        counts = await cache.aget_many(keys[1:])
+        if self._admit(rate_key, window_key, num, now, slot, slot_length, taken,
+                       [counts.get(key, 0) for key in keys[1:]]):
+            return True
+        try:
+            await cache.adecr(keys[0])
+        except ValueError:
+            pass
+        return False
+
+    def wait(self):
+        return self._wait
+
+
+class ClientIPThrottle(SlidingWindowThrottle):
+    kind = 'ip'
+
+    def get_identity(self, request, view):
+        return self.get_ident(request)
+
+
+def _request_value(request, view, name):
+    if name in view.kwargs:
+        return view.kwargs[name]
+    # DRF requests expose the parsed body as .data; async views set it themselves
+    data = getattr(request, 'data', None)
+    return data.get(name) if hasattr(data, 'get') else None
+
+
+class LicenseKeyThrottle(SlidingWindowThrottle):
+    kind = 'license_key'
+
+    def get_identity(self, request, view):
+        return _request_value(request, view, 'key') or _request_value(request, view, 'license_key')
+
+
+class BrandThrottle(SlidingWindowThrottle):
+    kind = 'brand'
+
+    def get_identity(self, request, view):
+        # A service token's brand, even when the body names several
+        return getattr(request.user, 'brand_slug', None) or _request_value(request, view, 'brand_slug')
@@ -1,15 +1,29 @@
 from django.urls import path
+from .async_views import AsyncActivateLicenseView, AsyncLicenseStatusView
 from .views import (
     BrandListCreateView, ProductListCreateView,
     ProvisionLicenseView, ActivateLicenseView, 
-    LicenseStatusView, CustomerLicenseListView
+    LicenseStatusView, LicenseVerdictView, CustomerLicenseListView, BatchLicenseValidationView,
+    LicenseSigningKeysView, BulkProvisionLicenseView,
+    CacheStatsView, ThrottleStatsView, DatabaseStatsView, BrandLicenseExportView, ActivationHeartbeatView
 )
 
 urlpatterns = [
     path('brands/', BrandListCreateView.as_view(), name='brand-list'),
+    path('brands/<slug:slug>/export/', BrandLicenseExportView.as_view(), name='brand-license-export'),
     path('products/', ProductListCreateView.as_view(), name='product-list'),
     path('provision/', ProvisionLicenseView.as_view(), name='provision-license'),
+    path('provision/bulk/', BulkProvisionLicenseView.as_view(), name='bulk-provision-license'),
     path('activate/', ActivateLicenseView.as_view(), name='activate-license'),
+    path('heartbeat/', ActivationHeartbeatView.as_view(), name='activation-heartbeat'),
+    path('validate/batch/', BatchLicenseValidationView.as_view(), name='batch-license-validation'),
+    path('keys/', LicenseSigningKeysView.as_view(), name='license-signing-keys'),
     path('status/<str:key>/', LicenseStatusView.as_view(), name='license-status'),
+    path('verdict/<str:key>/<slug:product_slug>/', LicenseVerdictView.as_view(), name='license-verdict'),
+    path('stats/cache/', CacheStatsView.as_view(), name='cache-stats'),
+    path('stats/throttling/', ThrottleStatsView.as_view(), name='throttle-stats'),
+    path('stats/database/', DatabaseStatsView.as_view(), name='database-stats'),
+    path('async/activate/', AsyncActivateLicenseView.as_view(), name='async-activate-license'),
+    path('async/status/<str:key>/', AsyncLicenseStatusView.as_view(), name='async-license-status'),
     path('customer-lookup/', CustomerLicenseListView.as_view(), name='customer-license-list'),
 ]
@@ -0,0 +1,182 @@
+# Precomputed license verdicts
+#
+# GET /api/verdict/<key>/<product_slug>/?instance_id=... answers what a product
+# actually asks ("am I licensed on this install, how many seats are left") with
+# a flat payload, instead of the full LicenseKeySerializer tree.
+#
+# Verdicts live in the shared cache per (key, product) and per (key, product,
+# instance), each tagged with the key's status version (api/cache.py):
+#   - writes recompute them once they commit: the (key, product) verdicts of
+#     the changed keys and, for activations, the verdict of that instance
+#     (refresh_verdicts(), called after license_status_cache.invalidate()),
+#   - a read is one get_many of the entry and the current version (or an
+#     in-process hit for LOCAL_TIMEOUT seconds, like the status cache; the
+#     process's verdicts of a key are kept together and dropped by its
+#     refreshes); an entry
+#     tagged with an older version, or past its license's expiry, is ignored,
+#   - otherwise the verdict is computed with a single query and stored.
+# Every write drops the key's version first, so a verdict never outlives the
+# write that changed it, even when a refresh is missed or races another.
+
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from .cache import LocalLRUCache, get_cache_setting, license_status_cache
+from .key_filter import license_key_filter
+from .models import Activation, License
+from .serializers import LicenseVerdictDetailSerializer
+from .sharding import current_shard, group_by_shard, use_shard, use_shard_of
+
+
+def verdict_key(license_key, product_slug, instance_id=None):
+    suffix = f"_{instance_id}" if instance_id is not None else ''
+    return f"license_verdict_{license_key}_{product_slug}{suffix}"
+
+
+def build_verdict(license_key, product_slug, instance_id, license_obj, activated=False):
+    verdict = {
+        'license_key': license_key,
+        'product_slug': product_slug,
+        'instance_id': instance_id,
+        'verdict': 'not_found',
+        'status': None,
+        'expires_at': None,
+        'total_seats': None,
+        'active_seats': None,
+        'seats_remaining': None,
+    }
+    if license_obj is not None:
+        if not license_obj.is_active():
+            verdict['verdict'] = 'inactive'
+        elif instance_id is None or activated:
+            verdict['verdict'] = 'valid'
+        else:
+            verdict['verdict'] = 'not_activated'
+        verdict.update({
+            'status': license_obj.status,
+            'expires_at': license_obj.expires_at,
+            'total_seats': license_obj.total_seats,
+            'active_seats': license_obj.active_seats,
+            'seats_remaining': max(license_obj.total_seats - license_obj.active_seats, 0),
+        })
+    return dict(LicenseVerdictDetailSerializer(verdict).data)
+
+
+def _entry(version, payload, license_obj):
+    # A valid verdict turns inactive at expiry, without any write
+    expires_at = license_obj.expires_at.timestamp() if license_obj and license_obj.expires_at else None
+    return version, payload, expires_at
+
+
+class VerdictStore:
+    def __init__(self):
+        self.local = LocalLRUCache()
+        self._stats_lock = threading.Lock()
+        self._stats = dict.fromkeys(('local_hits', 'shared_hits', 'misses', 'stale', 'refreshed'), 0)
+
+    def _count(self, stat, amount=1):
+        with self._stats_lock:
+            self._stats[stat] += amount
+
+    def get(self, license_key, product_slug, instance_id=None):
+        """The verdict payload, from the cache when current, else from one query."""
+        cache_key = verdict_key(license_key, product_slug, instance_id)
+        now = time.time()
+        found, local = self.local.get(license_key)
+        entry = local.get(cache_key) if found else None
+        if entry is not None and (entry[1] is None or entry[1] > now):
+            self._count('local_hits')
+            return entry[0]
+
+        version_key = license_status_cache.make_version_key(license_key)
+        values = cache.get_many([cache_key, version_key])
+        entry, version = values.get(cache_key), values.get(version_key)
+        current = entry is not None and version is not None and entry[0] == version
+        if current and (entry[2] is None or entry[2] > now):
+            self._count('shared_hits')
+            if not found:
+                # Expires as a whole, LOCAL_TIMEOUT seconds after its first verdict
+                local = {}
+                self.local.set(license_key, local, get_cache_setting('LOCAL_TIMEOUT'),
+                               get_cache_setting('LOCAL_MAX_ENTRIES'))
+            local[cache_key] = entry[1:]
+            return entry[1]
+
+        self._count('stale' if entry is not None else 'misses')
+        return self.compute(license_key, product_slug, instance_id)
+
+    def compute(self, license_key, product_slug, instance_id=None):
+        if not license_key_filter.might_exist(license_key):
+            return build_verdict(license_key, product_slug, instance_id, None)
+        # Read before the license, so the entry can only be tagged too old
+        version = license_status_cache.version(license_key)
+        licenses = License.objects.filter(license_key__key=license_key, product__slug=product_slug)
+        if instance_id is not None:
+            licenses = licenses.annotate(activated=Exists(
+                Activation.objects.filter(license=OuterRef('pk'), instance_id=instance_id)
+            ))
+        with use_shard_of(license_key):
+            license_obj = licenses.first()
+        payload = build_verdict(
+            license_key, product_slug, instance_id, license_obj, getattr(license_obj, 'activated', False)
+        )
+        if license_obj is not None and version is not None:
+            cache.set(verdict_key(license_key, product_slug, instance_id), _entry(version, payload, license_obj),
+                      get_cache_setting('TIMEOUT'))
+        return payload
+
+    def refresh(self, license_keys, instance_ids=()):
+        """Recomputes and stores the verdicts of `license_keys` (and `instance_ids` on them)."""
+        # A key created in this process may still hold its default UUID
+        license_keys, instance_ids = set(map(str, license_keys)), set(instance_ids)
+        if not license_keys:
+            return
+        versions = license_status_cache.versions(license_keys)
+        entries = {}
+        for shard, shard_keys in group_by_shard(license_keys).items():
+            with use_shard(shard):
+                licenses = list(
+                    License.objects.filter(license_key__key__in=shard_keys).select_related('license_key', 'product')
+                )
+                activated = set(
+                    Activation.objects.filter(license__in=licenses, instance_id__in=instance_ids)
+                    .values_list('license_id', 'instance_id')
+                ) if instance_ids and licenses else set()
+
+            for license_obj in licenses:
+                key, slug = license_obj.license_key.key, license_obj.product.slug
+                for instance_id in (None, *instance_ids):
+                    payload = build_verdict(
+                        key, slug, instance_id, license_obj, (license_obj.id, instance_id) in activated
+                    )
+                    entries[verdict_key(key, slug, instance_id)] = _entry(versions[key], payload, license_obj)
+        cache.set_many(entries, get_cache_setting('TIMEOUT'))
+        self.local.delete_many(license_keys)
+        self._count('refreshed', len(entries))
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['local_keys'] = len(self.local)
+        return stats
+
+
+verdict_store = VerdictStore()
+
+
+def refresh_verdicts(license_keys, instance_ids=(), using=None):
+    """
+    Recomputes verdicts once the transaction writing the keys on `using` (by
+    default the current shard) commits. Call it after
+    license_status_cache.invalidate(), whose version drop must come first.
+    """
+    license_keys, instance_ids = list(license_keys), list(instance_ids)
+    if license_keys:
+        # Robust: a cache outage must not fail a write that already committed
+        transaction.on_commit(
+            lambda: verdict_store.refresh(license_keys, instance_ids), using=using or current_shard(), robust=True
+        )
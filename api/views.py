@@ -1,13 +1,24 @@
 from rest_framework import status, views, permissions, generics
 from rest_framework.response import Response
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from datetime import timedelta
-from .models import Brand, Product, LicenseKey, License, Activation
+from collections.abc import Iterator
+from .models import Brand, Product, LicenseKey, License, Activation, SeatLimitReached
+from .signing import get_public_jwks
+from .throttling import throttle_stats
+from .exports import EXPORT_FORMATS, export_lines
+from .parsers import ORJSONParser, NDJSONParser, CSVParser, MessagePackParser
+from .renderers import msgpack
+from .provisioning import BulkProvisioner
 from .serializers import (
     BrandSerializer, ProductSerializer,
-    LicenseKeySerializer, LicenseSerializer, 
-    ProvisionLicenseSerializer, ActivateLicenseSerializer
+    LicenseKeySerializer, LicenseSerializer, LicenseActivationSerializer,
+    ProvisionLicenseSerializer, ActivateLicenseSerializer,
+    BatchLicenseValidationSerializer, LicenseVerdictSerializer, LicenseVerdictDetailSerializer,
+    BulkProvisionSummarySerializer
 )
 from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiParameter, OpenApiTypes
 from rest_framework_simplejwt.views import (
@@ -15,7 +26,15 @@ from rest_framework_simplejwt.views import (
     TokenRefreshView,
 )
 import logging
-from django.core.cache import cache
+from .cache import add_status_headers, etag_matches, license_status_cache, status_etag
+from .key_filter import get_license_key_or_404, license_key_filter
+from .heartbeats import heartbeat_buffer
+from .metrics import record_activation
+from .pooling import connection_stats, server_connection_stats
+from .routing import ReplicaReadMixin
+from .sharding import ShardKeyMixin, group_by_shard, scatter, use_shard, use_shard_of
+from .service_tokens import check_brand_scope, token_brand
+from .verdicts import verdict_store
 
 # Configure logger
 logger = logging.getLogger(__name__)
@@ -32,12 +51,15 @@ class DecoratedTokenObtainPairView(TokenObtainPairView):
 class DecoratedTokenRefreshView(TokenRefreshView):
     pass
 
-class ProvisionLicenseView(views.APIView):
+class ProvisionLicenseView(ShardKeyMixin, views.APIView):
     """
     US1: Brand can provision a license.
     Allows a brand to create a license key or add a product to an existing key.
     """
     permission_classes = [permissions.IsAuthenticated] 
+    throttle_scope = 'provision'
+    service_token_scope = 'licenses:provision'
+    shard_key_field = 'license_key'
 
     @extend_schema(request=ProvisionLicenseSerializer, responses={201: LicenseKeySerializer}, tags=['License'])
     def post(self, request):
@@ -45,6 +67,7 @@ class ProvisionLicenseView(views.APIView):
         serializer = ProvisionLicenseSerializer(data=request.data)
         if serializer.is_valid():
             data = serializer.validated_data
+            check_brand_scope(request, data['brand_slug'])
             brand = get_object_or_404(Brand, slug=data['brand_slug'])
             product = get_object_or_404(Product, brand=brand, slug=data['product_slug'])
             
@@ -72,137 +95,404 @@ class ProvisionLicenseView(views.APIView):
                     )
             else:
                 # 2. US1 Logic: If no key provided, check if user already has a key for THIS brand
-                lk = LicenseKey.objects.filter(
+                # (on any shard: the key is not known yet)
+                candidates = scatter(LicenseKey.objects.filter(
                     customer_email=data['customer_email'], 
                     brand=brand
-                ).first()
+                ).order_by('pk')[:1])
+                lk = min(candidates, key=lambda key: (key.created_at, key.pk), default=None)
                 
                 # 3. Create new auto-generated key if user doesn't have one for this brand yet
                 if not lk:
-                    lk = LicenseKey.objects.create(
+                    # The router places a new key on the shard of its hash
+                    lk = LicenseKey(
                         customer_email=data['customer_email'],
                         brand=brand
                     )
+                    lk.save()
             
-            # Create or UPDATE the License (Entitlement) - US1 logic refinement
-            expires_at = timezone.now() + timedelta(days=data['expiration_days'])
-            
-            # Using update_or_create to prevent "MultipleObjectsReturned" during activation
-            license_obj, created = License.objects.update_or_create(
-                license_key=lk,
-                product=product,
-                defaults={
-                    'expires_at': expires_at,
-                    'total_seats': data['total_seats'],
-                    'status': 'VALID' # Re-validate if it was suspended
-                }
-            )
-            
-            if created:
-                logger.info(f"New license provisioned: {license_obj.id} for product {product.slug}")
-            else:
-                logger.info(f"Existing license updated/renewed: {license_obj.id}")
+            # The license and its key live on the key's shard (api/sharding.py)
+            with use_shard_of(lk.key):
+                # Create or UPDATE the License (Entitlement) - US1 logic refinement
+                expires_at = timezone.now() + timedelta(days=data['expiration_days'])
 
-            return Response(LicenseKeySerializer(lk).data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+                # Using update_or_create to prevent "MultipleObjectsReturned" during activation
+                license_obj, created = License.objects.update_or_create(
+                    license_key=lk,
+                    product=product,
+                    defaults={
+                        'expires_at': expires_at,
+                        'total_seats': data['total_seats'],
+                        'status': 'VALID' # Re-validate if it was suspended
+                    }
+                )
+
+                if created:
+                    logger.info(f"New license provisioned: {license_obj.id} for product {product.slug}")
+                else:
+                    logger.info(f"Existing license updated/renewed: {license_obj.id}")
+
+                lk = LicenseKey.objects.with_license_details().get(pk=lk.pk)
+                return Response(LicenseKeySerializer(lk).data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
         
         logger.error(f"Provisioning validation failed: {serializer.errors}")
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class ActivateLicenseView(views.APIView):
+class BulkProvisionLicenseView(views.APIView):
+    """
+    US1 (bulk): Brand can provision many licenses in one request.
+    Accepts a JSON array, NDJSON or CSV (with a header row) of provisioning rows,
+    processes them in chunks with set-based upserts and reports a result per row.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = 'provision'
+    service_token_scope = 'licenses:provision'
+    parser_classes = [ORJSONParser, NDJSONParser, CSVParser] + ([MessagePackParser] if msgpack else [])
+
+    @extend_schema(
+        request=ProvisionLicenseSerializer(many=True),
+        responses={200: BulkProvisionSummarySerializer},
+        tags=['License']
+    )
+    def post(self, request):
+        logger.info(f"Bulk provisioning request received from user: {request.user}")
+        rows = request.data
+        # A JSON/MessagePack array, or the lazy row iterator of the NDJSON and CSV parsers
+        if not isinstance(rows, (list, Iterator)):
+            return Response(
+                {"error": "Expected a list of provisioning rows."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        summary = BulkProvisioner(brand_slug=token_brand(request)).provision(rows)
+        return Response(BulkProvisionSummarySerializer(summary).data)
+
+class ActivateLicenseView(ShardKeyMixin, views.APIView):
     """
     US3: End-user product can activate a license.
     """
     permission_classes = [permissions.AllowAny] 
+    # No authentication: keeps the public path free of DB work before throttling
+    authentication_classes = []
+    throttle_scope = 'activate'
+    shard_key_field = 'license_key'
 
-    @extend_schema(request=ActivateLicenseSerializer, responses={200: LicenseSerializer}, tags=['License'])
+    @extend_schema(request=ActivateLicenseSerializer, responses={200: LicenseActivationSerializer}, tags=['License'])
     def post(self, request):
         serializer = ActivateLicenseSerializer(data=request.data)
         if serializer.is_valid():
             data = serializer.validated_data
-            lk = get_object_or_404(LicenseKey, key=data['license_key'])
+            try:
+                lk = get_license_key_or_404(data['license_key'])
+            except Http404:
+                record_activation('not_found')
+                raise
             
             # Use filter().latest() instead of get_object_or_404 to handle existing duplicates 
             # while the database is being cleaned up.
             license_obj = License.objects.filter(
                 license_key=lk, 
                 product__slug=data['product_slug']
-            ).order_by('-created_at').first()
+            ).select_related('license_key', 'product__brand').order_by('-created_at').first()
 
             if not license_obj:
                 logger.error(f"Activation failed: License not found for key {lk.key} and product {data['product_slug']}")
+                record_activation('not_found')
                 return Response({"error": "License not found for this product/key."}, status=status.HTTP_404_NOT_FOUND)
             
             if not license_obj.is_active():
                 logger.warning(f"Activation candidate inactive: Key {lk.key}")
+                record_activation('inactive')
                 return Response({"error": "License is not active or expired."}, status=status.HTTP_403_FORBIDDEN)
             
-            # Check seat limit
-            if license_obj.activations.count() >= license_obj.total_seats:
-                # Check if this instance is already activated (idempotency)
-                if not Activation.objects.filter(license=license_obj, instance_id=data['instance_id']).exists():
-                    logger.warning(f"Seat limit reached for license: {license_obj.id}")
-                    return Response({"error": "No seats remaining."}, status=status.HTTP_409_CONFLICT)
-            
-            # Register activation
-            activation, created = Activation.objects.get_or_create(
-                license=license_obj,
-                instance_id=data['instance_id']
-            )
-            
-            # Clear cache if activation state changes
-            cache_key = f"license_status_{lk.key}"
-            cache.delete(cache_key)
+            # Register activation; claims a seat atomically unless the instance is already active
+            try:
+                activation, created = license_obj.activate(data['instance_id'])
+            except SeatLimitReached:
+                logger.warning(f"Seat limit reached for license: {license_obj.id}")
+                record_activation('seat_limit')
+                return Response({"error": "No seats remaining."}, status=status.HTTP_409_CONFLICT)
+
+            # Status cache entries are invalidated by the Activation signals (api/signals.py)
             
             if created:
                 logger.info(f"New activation created for license {license_obj.id}: {data['instance_id']}")
+            record_activation('created' if created else 'idempotent')
+            if not created:
+                # Re-activating a known instance also proves it is alive
+                heartbeat_buffer.record(activation.id)
             
-            return Response(LicenseSerializer(license_obj).data)
+            return Response(
+                LicenseActivationSerializer(license_obj, context={'instance_id': data['instance_id']}).data
+            )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class LicenseStatusView(views.APIView):
+class LicenseStatusView(ReplicaReadMixin, views.APIView):
     """
     US4: User can check license status.
+    Cache misses may be read from a replica (api/routing.py). Responses carry an
+    ETag; a matching If-None-Match is answered 304 (api/cache.py).
     """
+    replica_key_kwarg = 'key'
     permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+    throttle_scope = 'status'
 
-    @extend_schema(responses={200: LicenseKeySerializer}, tags=['License'])
+    @extend_schema(responses={200: LicenseKeySerializer, 304: None}, tags=['License'])
     def get(self, request, key):
-        cache_key = f"license_status_{key}"
-        cached_data = cache.get(cache_key)
-        
-        if cached_data:
-            logger.debug(f"Serving license status from cache: {key}")
-            return Response(cached_data)
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            version = license_status_cache.current_version(key)
+            if etag_matches(if_none_match, status_etag(version)):
+                # Unchanged since the client's copy: nothing is loaded or serialized
+                return add_status_headers(Response(status=status.HTTP_304_NOT_MODIFIED), version)
+
+        version, data = get_versioned_license_status(key)
+        return add_status_headers(Response(data), version)
 
-        lk = get_object_or_404(LicenseKey, key=key)
+def get_versioned_license_status(key):
+    """(version, payload) of a license key's status, from the status cache when possible."""
+    version, data = license_status_cache.get_versioned(key)
+    if data is not None:
+        logger.debug(f"Serving license status from cache: {key}")
+        return version, data
+
+    # Unknown keys are rejected before a version is started for them
+    if not license_key_filter.might_exist(key):
+        raise Http404("No LicenseKey matches the given query.")
+    # Read before the payload, so the ETag is never newer than the data (see api/cache.py)
+    version = license_status_cache.version(key)
+    with use_shard_of(key):
+        lk = get_license_key_or_404(key, LicenseKey.objects.with_license_details())
         data = LicenseKeySerializer(lk).data
-        
-        # Cache for 1 hour
-        cache.set(cache_key, data, 3600)
-        logger.info(f"License status fetched and cached: {key}")
-        return Response(data)
+
+    # Cached in-process and in the shared cache until a write invalidates it
+    license_status_cache.set(key, data, version)
+    logger.info(f"License status fetched and cached: {key}")
+    return version, data
+
+def get_license_status(key):
+    """Status payload of a license key, from the status cache when possible."""
+    return get_versioned_license_status(key)[1]
+
+class LicenseVerdictView(ReplicaReadMixin, views.APIView):
+    """
+    US4 (compact): Is this product licensed (on this instance), and how many seats are left?
+    Answered from precomputed verdicts, refreshed by writes (api/verdicts.py).
+    """
+    replica_key_kwarg = 'key'
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+    throttle_scope = 'status'
+
+    @extend_schema(
+        parameters=[OpenApiParameter('instance_id', OpenApiTypes.STR, description="Also check this instance's activation.")],
+        responses={200: LicenseVerdictDetailSerializer, 404: LicenseVerdictDetailSerializer},
+        tags=['License']
+    )
+    def get(self, request, key, product_slug):
+        verdict = verdict_store.get(key, product_slug, request.query_params.get('instance_id') or None)
+        if verdict['verdict'] == 'not_found':
+            return Response(verdict, status=status.HTTP_404_NOT_FOUND)
+        return Response(verdict)
+
+class ActivationHeartbeatView(ShardKeyMixin, views.APIView):
+    """
+    Installed products report that an activation is still in use.
+    Answered from the status cache; last_seen_at is written in batches (api/heartbeats.py).
+    Returns 404 once the seat has been reclaimed, so the product knows to activate again.
+    """
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+    throttle_scope = 'heartbeat'
+    # Buffered heartbeats remember the activation's shard
+    shard_key_field = 'license_key'
+
+    @extend_schema(request=ActivateLicenseSerializer, responses={202: OpenApiTypes.OBJECT}, tags=['License'])
+    def post(self, request):
+        serializer = ActivateLicenseSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        licenses = [
+            license_data for license_data in get_license_status(data['license_key'])['licenses']
+            if license_data['product_slug'] == data['product_slug']
+        ]
+        activation_id = next((
+            activation['id'] for license_data in licenses for activation in license_data['activations']
+            if activation['instance_id'] == data['instance_id']
+        ), None)
+        if activation_id is None:
+            return Response({"error": "No activation for this instance."}, status=status.HTTP_404_NOT_FOUND)
+
+        license_data = licenses[0]
+        expires_at = parse_datetime(license_data['expires_at']) if license_data['expires_at'] else None
+        if license_data['status'] != 'VALID' or (expires_at and expires_at < timezone.now()):
+            return Response({"error": "License is not active or expired."}, status=status.HTTP_403_FORBIDDEN)
+
+        heartbeat_buffer.record(activation_id)
+        return Response({"detail": "Heartbeat recorded."}, status=status.HTTP_202_ACCEPTED)
+
+class LicenseSigningKeysView(views.APIView):
+    """
+    Publishes the JWKS used to verify offline license tokens.
+    Includes retired keys until their tokens expire, so keys can be rotated without downtime.
+    """
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+
+    @extend_schema(responses={200: OpenApiTypes.OBJECT}, tags=['License'])
+    def get(self, request):
+        response = Response(get_public_jwks())
+        response['Cache-Control'] = 'public, max-age=300'
+        return response
+
+class BatchLicenseValidationView(views.APIView):
+    """
+    US4 (bulk): Products can validate many installs in a single request.
+    Every (license_key, product_slug, instance_id) tuple is resolved with a fixed
+    number of set-based queries per shard, regardless of how many items are submitted.
+    """
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+    throttle_scope = 'batch_validate'
+
+    @extend_schema(
+        request=BatchLicenseValidationSerializer,
+        responses={200: LicenseVerdictSerializer(many=True)},
+        tags=['License']
+    )
+    def post(self, request):
+        serializer = BatchLicenseValidationSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        items = serializer.validated_data['items']
+        keys = {item['license_key'] for item in items}
+        product_slugs = {item['product_slug'] for item in items}
+        instance_ids = {item['instance_id'] for item in items}
+
+        licenses, activated = {}, set()
+        # Once per shard holding any of the keys (api/sharding.py)
+        for shard, shard_keys in group_by_shard(keys).items():
+            with use_shard(shard):
+                # 1. All candidate licenses in one query. Ordered oldest first so the latest
+                # license wins for a (key, product) pair, mirroring ActivateLicenseView.
+                shard_licenses = {}
+                license_qs = License.objects.filter(
+                    license_key__key__in=shard_keys,
+                    product__slug__in=product_slugs
+                ).select_related('license_key', 'product').order_by('created_at')
+                for license_obj in license_qs:
+                    shard_licenses[(license_obj.license_key.key, license_obj.product.slug)] = license_obj
+
+                # 2. All matching activations in one query.
+                pairs = {license_obj.id: pair for pair, license_obj in shard_licenses.items()}
+                activations = Activation.objects.filter(
+                    license_id__in=list(pairs),
+                    instance_id__in=instance_ids
+                ).values_list('license_id', 'instance_id')
+                activated.update((*pairs[license_id], instance_id) for license_id, instance_id in activations)
+            licenses.update(shard_licenses)
+
+        results = []
+        for item in items:
+            license_obj = licenses.get((item['license_key'], item['product_slug']))
+            verdict = {
+                'license_key': item['license_key'],
+                'product_slug': item['product_slug'],
+                'instance_id': item['instance_id'],
+                'verdict': 'not_found',
+                'status': None,
+                'expires_at': None,
+                'total_seats': None,
+                'active_seats': None,
+            }
+            if license_obj:
+                if not license_obj.is_active():
+                    verdict['verdict'] = 'inactive'
+                elif (item['license_key'], item['product_slug'], item['instance_id']) in activated:
+                    verdict['verdict'] = 'valid'
+                else:
+                    verdict['verdict'] = 'not_activated'
+                verdict.update({
+                    'status': license_obj.status,
+                    'expires_at': license_obj.expires_at,
+                    'total_seats': license_obj.total_seats,
+                    'active_seats': license_obj.active_seats,
+                })
+            results.append(verdict)
+
+        logger.info(f"Batch validation processed {len(items)} items ({len(licenses)} licenses resolved)")
+        return Response(LicenseVerdictSerializer(results, many=True).data)
+
+class CacheStatsView(views.APIView):
+    """
+    Counters of this worker's license status cache, verdict store and unknown-key filter, for sizing them.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    @extend_schema(responses={200: OpenApiTypes.OBJECT}, tags=['Stats'])
+    def get(self, request):
+        return Response({
+            'license_status': license_status_cache.stats(),
+            'license_key_filter': license_key_filter.stats(),
+            'license_verdicts': verdict_store.stats(),
+        })
+
+class ThrottleStatsView(views.APIView):
+    """
+    Requests rejected by this worker's throttles, per '<scope>.<kind>' rate.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    @extend_schema(responses={200: OpenApiTypes.OBJECT}, tags=['Stats'])
+    def get(self, request):
+        return Response(throttle_stats.snapshot())
+
+class DatabaseStatsView(views.APIView):
+    """
+    This worker's database connections per alias, with the server's connection limits.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    @extend_schema(responses={200: OpenApiTypes.OBJECT}, tags=['Stats'])
+    def get(self, request):
+        return Response({
+            'connections': connection_stats.snapshot(),
+            'servers': server_connection_stats(),
+        })
 
 @extend_schema(
     tags=['License'],
     parameters=[
-        OpenApiParameter("email", OpenApiTypes.STR, OpenApiParameter.QUERY, description="Customer email to look up")
+        OpenApiParameter("email", OpenApiTypes.STR, OpenApiParameter.QUERY, description="Customer email to look up"),
+        OpenApiParameter(
+            "active", OpenApiTypes.BOOL, OpenApiParameter.QUERY,
+            description="Only include active licenses (VALID and not expired)"
+        ),
     ]
 )
-class CustomerLicenseListView(generics.ListAPIView):
+class CustomerLicenseListView(ReplicaReadMixin, generics.ListAPIView):
     """
     US6: Brands can list licenses by customer email across all brands.
     """
     serializer_class = LicenseKeySerializer
     permission_classes = [permissions.IsAuthenticated] # Admin only
+    service_token_scope = 'licenses:read'
 
     def get_queryset(self):
         email = self.request.query_params.get('email')
+        active_only = self.request.query_params.get('active') in ('1', 'true')
         if email:
-            return LicenseKey.objects.filter(customer_email=email)
+            keys = LicenseKey.objects.with_license_details(active_only=active_only).filter(customer_email=email)
+            brand = token_brand(self.request)
+            # A brand's service token only sees that brand's keys
+            return keys.filter(brand__slug=brand) if brand else keys
         return LicenseKey.objects.none()
 
 @extend_schema(tags=['Brand'])
-class BrandListCreateView(generics.ListCreateAPIView):
+class BrandListCreateView(ReplicaReadMixin, generics.ListCreateAPIView):
     """
     API endpoint to list or create Brands.
     """
@@ -210,8 +500,53 @@ class BrandListCreateView(generics.ListCreateAPIView):
     serializer_class = BrandSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+@extend_schema(
+    tags=['Brand'],
+    parameters=[
+        OpenApiParameter(
+            "output", OpenApiTypes.STR, OpenApiParameter.QUERY,
+            enum=sorted(EXPORT_FORMATS), description="Export format (default: ndjson)"
+        ),
+        OpenApiParameter(
+            "active", OpenApiTypes.BOOL, OpenApiParameter.QUERY,
+            description="Only export active licenses (VALID and not expired)"
+        ),
+    ],
+    responses={200: OpenApiTypes.BINARY}
+)
+class BrandLicenseExportView(views.APIView):
+    """
+    Streams every license key, license and activation of a brand as NDJSON or CSV,
+    for nightly reconciliation against billing systems.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    service_token_scope = 'licenses:read'
+
+    def perform_content_negotiation(self, request, force=False):
+        # The body is produced by api/exports.py, not by a DRF renderer
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, slug):
+        check_brand_scope(request, slug)
+        brand = get_object_or_404(Brand, slug=slug)
+        export_format = request.query_params.get('output', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {"error": f"Unsupported export format '{export_format}'."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        logger.info(f"Streaming {export_format} export for brand {brand.slug} to user: {request.user}")
+        active_only = request.query_params.get('active') in ('1', 'true')
+        response = StreamingHttpResponse(
+            export_lines(brand, export_format, active_only=active_only),
+            content_type=EXPORT_FORMATS[export_format]
+        )
+        response['Content-Disposition'] = f'attachment; filename="{brand.slug}-licenses.{export_format}"'
+        return response
+
 @extend_schema(tags=['Brand'])
-class ProductListCreateView(generics.ListCreateAPIView):
+class ProductListCreateView(ReplicaReadMixin, generics.ListCreateAPIView):
     """
     API endpoint to list or create Products for a brand.
     """
@@ -1,4 +1,5 @@
 import os
+from importlib.util import find_spec
 from pathlib import Path
 import environ
 from datetime import timedelta
@@ -39,6 +40,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so latency covers the whole middleware stack
+    'api.metrics.PrometheusMetricsMiddleware',
+    # Removes itself unless REQUEST_PROFILER['ENABLED']
+    'api.profiling.RequestProfilerMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -46,6 +51,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Read-your-writes for replica reads, see api/routing.py
+    'api.routing.PrimaryPinningMiddleware',
 ]
 
 ROOT_URLCONF = 'assessment.urls'
@@ -74,6 +81,59 @@ DATABASES = {
     )
 }
 
+# Read replicas (see api/routing.py), e.g. DATABASE_REPLICA_URLS=postgres://...@replica-eu/db,postgres://...@replica-us/db
+for index, replica_url in enumerate(env.list('DATABASE_REPLICA_URLS', default=[])):
+    DATABASES[f'replica_{index}'] = {**env.db_url_config(replica_url), 'TEST': {'MIRROR': 'default'}}
+
+# License shards (see api/sharding.py): `default` plus one alias per URL. Run
+# `manage.py migrate --database shard_N` for each, and `manage.py reshard` after changing the list.
+SHARD_URLS = env.list('DATABASE_SHARD_URLS', default=[])
+for index, shard_url in enumerate(SHARD_URLS, start=1):
+    DATABASES[f'shard_{index}'] = env.db_url_config(shard_url)
+
+# Connection reuse (see api/pooling.py). Size it so UWSGI_PROCESSES x connections per
+# process (threads, or DATABASE_POOL_MAX_SIZE) x aliases stays under the server's max_connections.
+DATABASE_POOL = env.bool('DATABASE_POOL', default=False)
+for database in DATABASES.values():
+    backend = database['ENGINE'].rsplit('.', 1)[-1]
+    if database['ENGINE'] == f'django.db.backends.{backend}' and backend in ('postgresql', 'sqlite3'):
+        # The stock backend plus connection stats
+        database['ENGINE'] = f'api.db_backends.{backend}'
+    database['CONN_HEALTH_CHECKS'] = env.bool('DATABASE_CONN_HEALTH_CHECKS', default=True)
+    if DATABASE_POOL and backend == 'postgresql':
+        # Django's pool (psycopg 3 and psycopg_pool, see requirements/base.txt); pooled connections are never persistent
+        database['CONN_MAX_AGE'] = 0
+        database.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': env.int('DATABASE_POOL_MIN_SIZE', default=1),
+            'max_size': env.int('DATABASE_POOL_MAX_SIZE', default=4),
+            # Seconds a request waits for a free connection before failing
+            'timeout': env.float('DATABASE_POOL_TIMEOUT', default=10),
+            'max_lifetime': env.float('DATABASE_CONN_MAX_AGE', default=600),
+        }
+    else:
+        database['CONN_MAX_AGE'] = env.int('DATABASE_CONN_MAX_AGE', default=600)
+
+DATABASE_ROUTERS = ['api.sharding.ShardRouter', 'api.routing.ReplicaRouter']
+
+SHARDING = {
+    # Order matters: a key's shard is its hash modulo this list
+    'ALIASES': ['default'] + [f'shard_{index}' for index in range(1, len(SHARD_URLS) + 1)] if SHARD_URLS else [],
+}
+
+READ_REPLICAS = {
+    'ALIASES': [alias for alias in DATABASES if alias.startswith('replica_')],
+    # Reads of a client (or license key) go to the primary for this long after it writes
+    'STICKY_SECONDS': env.int('READ_REPLICA_STICKY_SECONDS', default=15),
+    # Replicas further behind than this are skipped until they catch up
+    'MAX_LAG': env.float('READ_REPLICA_MAX_LAG', default=5),
+    'LAG_CHECK_INTERVAL': env.int('READ_REPLICA_LAG_CHECK_INTERVAL', default=5),
+}
+
+# Must point at a shared cache (e.g. redis://) when running several workers
+CACHES = {
+    'default': env.cache_url('CACHE_URL', default='locmemcache://')
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -100,11 +160,46 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': (
+        # Brand integrations' service tokens, without a User query (see api/service_tokens.py)
+        'api.service_tokens.ServiceTokenAuthentication',
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # Sliding windows per '<view throttle_scope>.<kind>': 'num/period' admits num requests in any period
+    # (see api/throttling.py)
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.ClientIPThrottle',
+        'api.throttling.LicenseKeyThrottle',
+        'api.throttling.BrandThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'status.ip': env('THROTTLE_STATUS_IP', default='600/min'),
+        'status.license_key': env('THROTTLE_STATUS_LICENSE_KEY', default='120/min'),
+        'activate.ip': env('THROTTLE_ACTIVATE_IP', default='120/min'),
+        'activate.license_key': env('THROTTLE_ACTIVATE_LICENSE_KEY', default='30/min'),
+        'heartbeat.ip': env('THROTTLE_HEARTBEAT_IP', default='600/min'),
+        'heartbeat.license_key': env('THROTTLE_HEARTBEAT_LICENSE_KEY', default='300/min'),
+        'batch_validate.ip': env('THROTTLE_BATCH_VALIDATE_IP', default='60/min'),
+        'provision.brand': env('THROTTLE_PROVISION_BRAND', default='6000/min'),
+    },
+    # 0: throttle on REMOTE_ADDR, the client as reported by the PROXY protocol (uwsgi.ini). None would
+    # trust the whole client-supplied X-Forwarded-For; set it to the number of HTTP proxies instead.
+    'NUM_PROXIES': env.int('NUM_PROXIES', default=0),
+    # orjson instead of json.dumps/json.loads; MessagePack when msgpack is installed (see api/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ] + (['api.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ] + (['api.parsers.MessagePackParser'] if find_spec('msgpack') else []),
+    # Cursor pagination on (created_at, id), see api/pagination.py
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
+    'PAGE_SIZE': env.int('API_PAGE_SIZE', default=100),
 }
 
 SIMPLE_JWT = {
@@ -124,5 +219,59 @@ SPECTACULAR_SETTINGS = {
         {'name': 'Auth', 'description': 'Authentication endpoints (JWT)'},
         {'name': 'Brand', 'description': 'Brand and Product management'},
         {'name': 'License', 'description': 'License provisioning and activation'},
+        {'name': 'Stats', 'description': 'Operational counters for sizing caches and limits'},
     ],
 }
+
+# Offline license tokens (see api/signing.py)
+LICENSE_SIGNING_KEY_DIR = env('LICENSE_SIGNING_KEY_DIR', default=None)
+LICENSE_SIGNING_ACTIVE_KID = env('LICENSE_SIGNING_ACTIVE_KID', default=None)
+# Sign with a per-process key when LICENSE_SIGNING_KEY_DIR is unset (dev.py only: each worker would have its own)
+LICENSE_SIGNING_EPHEMERAL_KEY = False
+LICENSE_TOKEN_ISSUER = env('LICENSE_TOKEN_ISSUER', default='group-one-license-service')
+LICENSE_TOKEN_LIFETIME = timedelta(days=env.int('LICENSE_TOKEN_LIFETIME_DAYS', default=7))
+
+# Two-tier license status cache (see api/cache.py)
+LICENSE_STATUS_CACHE = {
+    'TIMEOUT': env.int('LICENSE_STATUS_CACHE_TIMEOUT', default=3600),
+    'LOCAL_MAX_ENTRIES': env.int('LICENSE_STATUS_CACHE_LOCAL_MAX_ENTRIES', default=10000),
+    'LOCAL_TIMEOUT': env.int('LICENSE_STATUS_CACHE_LOCAL_TIMEOUT', default=5),
+    # Cache-Control max-age of /api/status/ responses; proxies revalidate with the ETag after it
+    'HTTP_MAX_AGE': env.int('LICENSE_STATUS_HTTP_MAX_AGE', default=5),
+}
+
+# Bloom filter and negative cache for unknown license keys (see api/key_filter.py). Off by
+# default with a per-process cache: other workers would not see the markers of new keys.
+LOCAL_CACHE_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache', 'django.core.cache.backends.dummy.DummyCache')
+LICENSE_KEY_FILTER = {
+    'ENABLED': env.bool('LICENSE_KEY_FILTER_ENABLED', default=CACHES['default']['BACKEND'] not in LOCAL_CACHE_BACKENDS),
+    'ERROR_RATE': env.float('LICENSE_KEY_FILTER_ERROR_RATE', default=0.01),
+    'REFRESH_INTERVAL': env.int('LICENSE_KEY_FILTER_REFRESH_INTERVAL', default=300),
+    'NEGATIVE_TIMEOUT': env.int('LICENSE_KEY_FILTER_NEGATIVE_TIMEOUT', default=60),
+}
+
+# Activation heartbeats and stale seat reclamation (see api/heartbeats.py)
+ACTIVATION_HEARTBEAT = {
+    'FLUSH_INTERVAL': env.int('ACTIVATION_HEARTBEAT_FLUSH_INTERVAL', default=30),
+    'MAX_PENDING': env.int('ACTIVATION_HEARTBEAT_MAX_PENDING', default=10000),
+    # Seconds without a heartbeat after which `reclaim_stale_seats` frees the seat
+    'STALE_AFTER': env.int('ACTIVATION_STALE_AFTER', default=14 * 86400),
+}
+
+# Brand service tokens (see api/service_tokens.py), issued with `manage.py issue_service_token`
+SERVICE_TOKENS = {
+    'LIFETIME': env.int('SERVICE_TOKEN_LIFETIME', default=365 * 86400),
+    # Revoked tokens keep working for at most this long on workers that already cached the list
+    'LOCAL_TIMEOUT': env.int('SERVICE_TOKEN_REVOCATION_LOCAL_TIMEOUT', default=5),
+    'CACHE_TIMEOUT': env.int('SERVICE_TOKEN_REVOCATION_CACHE_TIMEOUT', default=300),
+}
+
+# Sampling request profiler (see api/profiling.py); profiles are listed at /admin/profiles/
+REQUEST_PROFILER = {
+    'ENABLED': env.bool('REQUEST_PROFILER_ENABLED', default=False),
+    'SAMPLE_RATE': env.float('REQUEST_PROFILER_SAMPLE_RATE', default=0.01),
+    # Requests sending `X-Profile: <token>` are always profiled
+    'HEADER_TOKEN': env('REQUEST_PROFILER_HEADER_TOKEN', default=None),
+    'INTERVAL': env.float('REQUEST_PROFILER_INTERVAL', default=0.001),
+    'BUFFER_SIZE': env.int('REQUEST_PROFILER_BUFFER_SIZE', default=100),
+}
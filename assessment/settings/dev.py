@@ -4,6 +4,9 @@ DEBUG = True
 
 ALLOWED_HOSTS = ['*']
 
+# No LICENSE_SIGNING_KEY_DIR needed to try activations locally (see api/signing.py)
+LICENSE_SIGNING_EPHEMERAL_KEY = True
+
 # Additional dev-only apps
 INSTALLED_APPS += [
 ]
@@ -17,10 +17,13 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
+from api.admin import request_profiles_view
+from api.metrics import metrics_view
 from api.views import DecoratedTokenObtainPairView, DecoratedTokenRefreshView
 
 urlpatterns = [
 
+    path('admin/profiles/', admin.site.admin_view(request_profiles_view), name='request-profiles'),
     path('admin/', admin.site.urls),
     
     # Authentication endpoints
@@ -32,6 +35,9 @@ urlpatterns = [
     path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('api/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
 
+    # Prometheus scrape endpoint
+    path('metrics', metrics_view, name='metrics'),
+
     # License Service endpoints
     path('api/', include('api.urls')),
 ]